@@ -0,0 +1,231 @@
+import asyncio
+import json
+import time
+import aiohttp
+import pandas as pd
+
+from Binance import Binance, request_delay
+from SymbolRules import SymbolRules
+
+# asyncio version of the Binance client. The request methods below are coroutines
+# returning exactly what their Binance counterparts return, so the same code can
+# handle the results. The exchangeInfo lookups are coroutines too, as the first one
+# downloads exchangeInfo. Everything that doesn't touch the network (signing, rounding
+# with a symbol's data) is inherited from Binance.
+#
+#	exchange = AsyncBinance('credentials.txt')
+#	dfs = await exchange.GetSymbolKlinesOfSymbols(['ETHBTC', 'NEOBTC'], '5m')
+#	await exchange.Close()
+
+class AsyncBinance(Binance):
+
+	def __init__(self, filename=None, base:str=None, max_concurrency:int=50, timeout=(3.05, 10), scheduler=None):
+		'''
+		Parameters
+		--
+			filename str:          File with the API key & secret
+			base str:              Base url of the API, point it to a local server for testing
+			max_concurrency int:   Most requests in flight at once
+			timeout tuple:         (connect, read) timeouts in seconds
+		'''
+		super().__init__(filename, pool_size=max_concurrency, timeout=timeout, scheduler=scheduler)
+		if base != None:
+			self.base = base
+
+		self.max_concurrency = max_concurrency
+		self.semaphore = asyncio.Semaphore(max_concurrency)
+		self.async_session = None
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *args):
+		await self.Close()
+
+	async def Close(self):
+		if self.async_session != None:
+			await self.async_session.close()
+			self.async_session = None
+
+	def _AsyncSession(self):
+		# aiohttp sessions have to be created inside the event loop
+		if self.async_session == None:
+			self.async_session = aiohttp.ClientSession(
+				connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+				timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1]))
+		return self.async_session
+
+	async def _arequest(self, method:str, url:str, params=None, headers=None, limit:int=None):
+		""" Async counterpart of Binance._request, returns (status, headers, text) """
+		endpoint = self.endpoint_names.get(url[len(self.base):].split('?')[0], None)
+		weight = self.scheduler.Weight(endpoint, method, limit)
+
+		# waits on the event loop, not on a thread: hundreds of requests can be waiting
+		# for the rate limit without using up the default executor
+		requested_at = time.time()
+		await self.scheduler.AcquireAsync(endpoint, method, weight)
+
+		if params != None and 'signature' in params and time.time() - requested_at > 1:
+			del params['signature']
+			params['timestamp'] = int(round(time.time()*1000)) + request_delay
+			self.signRequest(params)
+
+		async with self.semaphore:
+			async with self._AsyncSession().request(method, url, params=params, headers=headers) as response:
+				text = await response.text()
+				self.scheduler.Update(response.status, response.headers)
+				return response.status, response.headers, text
+
+	async def _aget(self, url, params=None, headers=None) -> dict:
+		""" Makes a Get Request """
+		return await self._asend('GET', url, params, headers)
+
+	async def _apost(self, url, params=None, headers=None) -> dict:
+		""" Makes a Post Request """
+		return await self._asend('POST', url, params, headers)
+
+	async def _asend(self, method:str, url:str, params=None, headers=None) -> dict:
+		try:
+			status, response_headers, text = await self._arequest(method, url, params=params, headers=headers)
+			data = json.loads(text)
+			if isinstance(data, dict):
+				data['url'] = url
+		except Exception as e:
+			print("Exception occured when trying to access "+url)
+			print(e)
+			data = {'code': '-1', 'url':url, 'msg': e}
+		return data
+
+	async def GetAccountData(self) -> dict:
+		""" Gets Balances & Account Data """
+
+		url = self.base + self.endpoints["account"]
+
+		params = {
+		'recvWindow': 6000,
+		'timestamp': int(round(time.time()*1000)) + request_delay
+		}
+		self.signRequest(params)
+
+		return await self._aget(url, params, self.headers)
+
+	# exchangeInfo is downloaded (with requests) by the first lookup and refreshed once it's
+	# stale, so lookups run on a thread to keep the event loop going meanwhile
+
+	async def GetTradingSymbols(self, quoteAssets:list=None):
+		''' Gets All symbols which are tradable (currently), see Binance.GetTradingSymbols '''
+		return await asyncio.to_thread(super().GetTradingSymbols, quoteAssets)
+
+	async def GetSymbolDataOfSymbols(self, symbols:list=None):
+		''' Gets the exchangeInfo data of symbols, see Binance.GetSymbolDataOfSymbols '''
+		return await asyncio.to_thread(super().GetSymbolDataOfSymbols, symbols)
+
+	async def GetSymbolData(self, symbol:str):
+		''' Gets the exchangeInfo data of one symbol, None if it doesn't exist '''
+		return await asyncio.to_thread(super().GetSymbolData, symbol)
+
+	async def GetSymbolRules(self, symbol:str):
+		''' Gets the compiled trading rules (SymbolRules) of one symbol, None if it doesn't exist '''
+		symbol_data = await self.GetSymbolData(symbol)
+		if symbol_data == None:
+			return None
+		return SymbolRules.Of(symbol_data)
+
+	async def GetSymbolKlines(self, symbol:str, interval:str, limit:int=1000, end_time=False, extra_fields:bool=False):
+		''' Gets trading data for one symbol, see Binance.GetSymbolKlines '''
+
+		if limit <= 1000:
+			df = await self.DownloadSymbolKlines(symbol, interval, limit, end_time=end_time)
+			return self.SelectKlineColumns(df, extra_fields)
+
+		if interval not in self.KLINE_INTERVAL_MS:
+			raise Exception("Can't get more than 1000 candles on interval "+interval+" asynchronously.")
+
+		# same windows as GetSymbolKlinesRange, all downloaded at once
+		interval_ms = self.KLINE_INTERVAL_MS[interval]
+		end = int(end_time) if end_time else int(round(time.time()*1000))
+		start = end - limit * interval_ms + 1
+		windows = []
+		while start <= end:
+			windows.append((start, min(start + 1000 * interval_ms - 1, end)))
+			start = start + 1000 * interval_ms
+
+		pages = await asyncio.gather(*[
+			self.DownloadSymbolKlines(symbol, interval, 1000, start_time=window[0], end_time=window[1])
+			for window in windows])
+
+		df = pd.concat(pages, ignore_index=True)
+		df = df.drop_duplicates(subset='time').sort_values('time')
+		return self.SelectKlineColumns(df.tail(limit).reset_index(drop=True), extra_fields)
+
+	async def DownloadSymbolKlines(self, symbol:str, interval:str, limit:int=1000, start_time=None, end_time=None):
+		''' Downloads at most 1000 klines of one symbol straight from the exchange '''
+
+		url = self.KlinesUrl(symbol, interval, limit, start_time, end_time)
+		status, headers, text = await self._arequest('GET', url, limit=limit)
+		return self.KlinesToDataFrame(text)
+
+	async def GetSymbolKlinesOfSymbols(self, symbols:list, interval:str, limit:int=1000, end_time=False,
+		extra_fields:bool=False) -> dict:
+		''' Gets the klines of all symbols concurrently, returns a dict of symbol: DataFrame '''
+		dfs = await asyncio.gather(*[
+			self.GetSymbolKlines(symbol, interval, limit, end_time, extra_fields) for symbol in symbols])
+		return dict(zip(symbols, dfs))
+
+	async def PlaceOrderFromDict(self, params, test:bool=False):
+		""" Places order from params dict """
+
+		params['recvWindow'] = 5000
+		params['timestamp'] = int(round(time.time()*1000)) + request_delay
+
+		self.signRequest(params)
+		url = ''
+		if test:
+			url = self.base + self.endpoints['testOrder']
+		else:
+			url = self.base + self.endpoints['order']
+		return await self._apost(url, params, self.headers)
+
+	async def CancelOrder(self, symbol:str, orderId:str):
+		'''
+			Cancels the order on a symbol based on orderId
+		'''
+
+		params = {
+			'symbol': symbol,
+			'orderId' : orderId,
+			'recvWindow': 5000,
+			'timestamp': int(round(time.time()*1000)) + request_delay
+		}
+
+		self.signRequest(params)
+
+		url = self.base + self.endpoints['order']
+
+		try:
+			status, headers, text = await self._arequest('DELETE', url, params=params, headers=self.headers)
+			data = json.loads(text)
+		except Exception as e:
+			print("Exception occured when trying to cancel order on "+url)
+			print(e)
+			data = {'code': '-1', 'msg':e}
+
+		return data
+
+	async def GetOrderInfo(self, symbol:str, orderId:str):
+		'''
+			Gets info about an order on a symbol based on orderId
+		'''
+
+		params = {
+			'symbol': symbol,
+			'origClientOrderId' : orderId,
+			'recvWindow': 5000,
+			'timestamp': int(round(time.time()*1000)) + request_delay
+		}
+
+		self.signRequest(params)
+
+		url = self.base + self.endpoints['order']
+
+		return await self._aget(url, params=params, headers=self.headers)
@@ -0,0 +1,212 @@
+#Backtest of a strategy's buy signals with the exit rules of EvaluateStrategy, on float64
+#
+#   buys, sells, resulting_balance = backtest(signals, lows, highs, 100, 1.045, 0.85, 1.04, 0.975)
+#
+#The rules are the same as the Decimal loop EvaluateStrategy used to run (referenceBacktest):
+#  - buy at the signal price on the first candle with a signal, when not in a trade
+#  - exits are checked from the second candle after the buy (or after the last target) on
+#  - if the low goes below price * stop loss, sell there
+#  - else if the high goes above price * profit target, that becomes the new price, and the
+#    stop loss & target become the incremental ones
+#  - the balance grows by sell price / first buy price, a trade still open at the end is ignored
+#Instead of looking at every candle, the next entry is found with a binary search in the
+#candles that have a signal, and the next exit with numpy on blocks of candles, so only
+#the trades themselves are looped over in python.
+#
+#compareWithReference runs both on the same candles. To check every strategy on the
+#klines cached by Binance(cache_dir='klines'): python BacktestEngine.py klines
+import os
+import sys
+import time
+from bisect import bisect_left
+from decimal import Decimal, getcontext
+
+import numpy as np
+
+
+def _firstExit(lows, highs, start, end, stop_price, target_price):
+    #First candle in [start, end) where the stop loss or the target is hit, end if there's none
+    #Most exits come within a few candles, looking at those one by one (as python floats) is
+    #cheaper than numpy comparisons. After that, look at blocks of candles, doubling the block
+    #every time
+    stop = min(start + 16, end)
+    for k, (low, high) in enumerate(zip(lows[start:stop].tolist(), highs[start:stop].tolist())):
+        if low < stop_price or high > target_price:
+            return start + k
+    start = stop
+    size = 64
+    while start < end:
+        stop = min(start + size, end)
+        hit = (lows[start:stop] < stop_price) | (highs[start:stop] > target_price)
+        if hit.any():
+            return start + int(np.argmax(hit))
+        start = stop
+        size = size * 2
+    return end
+
+
+def backtest(signals, lows, highs,
+    starting_balance:float = 100,
+    initial_profits:float = 1.045,
+    initial_stop_loss:float = 0.85,
+    incremental_profits:float = 1.04,
+    incremental_stop_loss:float = 0.975):
+    #signals: buy price or NaN (or 0) on every candle, lows & highs of the same candles
+    #Returns the buys and sells as lists of (candle index, price), and the resulting balance
+    signals = np.asarray(signals, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+
+    #the last candle is never looked at
+    end = len(lows) - 1
+    entries = np.flatnonzero(~np.isnan(signals[:end]) & (signals[:end] != 0)).tolist()
+
+    buys, sells = [], []
+    resulting_balance = float(starting_balance)
+    i = 0
+    while True:
+        next_entry = bisect_left(entries, i)
+        if next_entry == len(entries):
+            break
+        i = entries[next_entry]
+        buy_price = float(signals[i])
+        buys.append((i, buy_price))
+
+        price = buy_price
+        stop_loss = initial_stop_loss
+        profit_target = initial_profits
+        while True:
+            stop_loss_price = price * stop_loss
+            next_target_price = price * profit_target
+            k = _firstExit(lows, highs, i + 2, end, stop_loss_price, next_target_price)
+            if k == end:
+                return buys, sells, resulting_balance
+
+            if lows[k] < stop_loss_price:
+                sells.append((k, stop_loss_price))
+                resulting_balance = resulting_balance * (stop_loss_price / buy_price)
+                i = k + 1
+                break
+
+            i = k
+            price = next_target_price
+            stop_loss = incremental_stop_loss
+            profit_target = incremental_profits
+
+    return buys, sells, resulting_balance
+
+
+def referenceBacktest(signals, lows, highs,
+    starting_balance:float = 100,
+    initial_profits:float = 1.045,
+    initial_stop_loss:float = 0.85,
+    incremental_profits:float = 1.04,
+    incremental_stop_loss:float = 0.975):
+    #The candle by candle Decimal loop EvaluateStrategy.backtest used to run, kept to check
+    #backtest against. Same arguments and return values, prices & balance are Decimals
+    getcontext().prec = 30
+
+    buys, sells = [], []
+    last_buy = None
+    resulting_balance = Decimal(starting_balance)
+    stop_loss = Decimal(initial_stop_loss)
+    profit_target = Decimal(initial_profits)
+    buy_price = 0
+
+    for i in range(len(lows) - 1):
+        if last_buy is None:
+            strategy_result = signals[i]
+            if strategy_result and not np.isnan(strategy_result):
+                buy_price = Decimal(float(strategy_result))
+                last_buy = {'index': i, 'price': buy_price}
+                buys.append((i, buy_price))
+                stop_loss = Decimal(initial_stop_loss)
+                profit_target = Decimal(initial_profits)
+
+        elif i > last_buy['index'] + 1:
+            stop_loss_price = last_buy['price'] * stop_loss
+            next_target_price = last_buy['price'] * profit_target
+
+            if lows[i] < stop_loss_price:
+                sells.append((i, stop_loss_price))
+                resulting_balance = resulting_balance * (stop_loss_price / buy_price)
+                last_buy = None
+                buy_price = Decimal(0)
+
+            elif highs[i] > next_target_price:
+                last_buy = {'index': i, 'price': Decimal(next_target_price)}
+                stop_loss = Decimal(incremental_stop_loss)
+                profit_target = Decimal(incremental_profits)
+
+    return buys, sells, resulting_balance
+
+
+def compareWithReference(signals, lows, highs, **options):
+    #Runs both backtests, returns whether they made the same trades, the largest relative
+    #difference between their prices & balances, and the time each took
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+
+    start = time.perf_counter()
+    reference = referenceBacktest(signals, lows.tolist(), highs.tolist(), **options)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = backtest(signals, lows, highs, **options)
+    engine_time = time.perf_counter() - start
+
+    same_trades = [index for index, price in reference[0]] == [index for index, price in result[0]] and \
+        [index for index, price in reference[1]] == [index for index, price in result[1]]
+
+    difference = 0.0
+    if same_trades:
+        pairs = [(float(a[1]), b[1]) for a, b in zip(reference[0] + reference[1], result[0] + result[1])]
+        pairs.append((float(reference[2]), result[2]))
+        difference = max(abs(a - b) / abs(a) for a, b in pairs if a != 0)
+
+    return dict(
+        same_trades = same_trades,
+        max_difference = difference,
+        reference_time = reference_time,
+        engine_time = engine_time
+    )
+
+
+def Main(cache_dir='klines'):
+    #Checks the engine against the reference for every strategy on every cached symbol
+    from KlineCache import KlineCache
+    from Indicators import Indicators
+    from EvaluateStrategy import EvaluateStrategy
+    from Strategies import strategies_dict
+
+    cache = KlineCache(cache_dir)
+    files = sorted(name for name in os.listdir(cache_dir) if name.endswith('.npz') and not name.endswith('.tmp.npz'))
+    options = dict(starting_balance = 100, initial_profits = 1.012, initial_stop_loss = 0.9,
+        incremental_profits = 1.006, incremental_stop_loss = 0.996)
+
+    mismatches = 0
+    reference_total, engine_total = 0, 0
+    for name in files:
+        symbol, interval = name[:-len('.npz')].rsplit('_', 1)
+        df = cache.Load(symbol, interval)
+        if df is None or len(df) < 2:
+            continue
+        Indicators.describe(df, symbol, interval)
+
+        for strategy_name, strategy in strategies_dict.items():
+            signals = EvaluateStrategy(strategy).signals(df)
+            comparison = compareWithReference(signals, df['low'], df['high'], **options)
+            reference_total = reference_total + comparison['reference_time']
+            engine_total = engine_total + comparison['engine_time']
+            if not comparison['same_trades'] or comparison['max_difference'] > 1e-9:
+                mismatches = mismatches + 1
+                print(symbol + ' ' + interval + ' ' + strategy_name + ': ' + str(comparison))
+
+    print(str(len(files)) + ' symbols, ' + str(mismatches) + ' mismatches')
+    if engine_total > 0:
+        print('reference: {:.1f} ms, engine: {:.1f} ms, {:.0f}x faster'.format(
+            1000 * reference_total, 1000 * engine_total, reference_total / engine_total))
+
+
+if __name__ == '__main__':
+    Main(*sys.argv[1:])
@@ -1,11 +1,18 @@
 import requests 
+from requests.adapters import HTTPAdapter
 import json
 import decimal
 import hmac
 import time
+import numpy as np
 import pandas as pd
 import hashlib
+from multiprocessing.pool import ThreadPool
 from decimal import Decimal
+from KlineCache import KlineCache
+from RateLimiter import shared_scheduler
+from ExchangeInfo import ExchangeInfoStore
+from SymbolRules import SymbolRules
 
 # I will show you how exactly to get these API Keys
 # But first, let's update our function that gets the candlestick data 
@@ -37,10 +44,34 @@ class Binance:
 
 	KLINE_INTERVALS = ['1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '8h', '12h', '1d', '3d', '1w', '1M']
 
-	def __init__(self, filename=None):
+	# Length of each interval in milliseconds ('1M' isn't fixed, so it's left out)
+	KLINE_INTERVAL_MS = {
+		'1m': 60000, '3m': 180000, '5m': 300000, '15m': 900000, '30m': 1800000,
+		'1h': 3600000, '2h': 7200000, '4h': 14400000, '6h': 21600000, '8h': 28800000,
+		'12h': 43200000, '1d': 86400000, '3d': 259200000, '1w': 604800000
+	}
+
+	# Columns of a klines DataFrame, the extra ones are only kept if asked for
+	KLINE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume']
+	KLINE_EXTRA_COLUMNS = ['close_time', 'quote_volume', 'trades', 'taker_base_volume', 'taker_quote_volume']
+	# ms timestamps, kept as int64 (the other columns are float64)
+	KLINE_TIME_COLUMNS = ['time', 'close_time']
+
+	def __init__(self, filename=None, cache_dir=None, pool_size:int=4, timeout=(3.05, 10), scheduler=None,
+		exchange_info_ttl:float=1800):
 
 		self.base = 'https://api.binance.com'
 
+		# One keep-alive session for all requests, so we don't do a new TCP + TLS
+		# handshake every time. pool_size should match the number of threads using
+		# this client at once. timeout is (connect, read) in seconds.
+		self.timeout = timeout
+		self.pool_size = pool_size
+		self.session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
+
 		self.endpoints = {
 			"order": '/api/v3/order',
 			"testOrder": '/api/v3/order/test',
@@ -52,8 +83,22 @@ class Binance:
 			"orderBook" : '/api/v3/depth',
 			"account" : '/api/v3/account'
 		}
+		self.endpoint_names = {path: name for name, path in self.endpoints.items()}
 		self.account_access = False
 
+		# Every request waits for its turn on the scheduler, so we stay under the
+		# weight limits. Clients share one scheduler unless told otherwise.
+		self.scheduler = scheduler if scheduler != None else shared_scheduler
+
+		# exchangeInfo is downloaded once and shared by all the symbol lookups
+		self.exchange_info = ExchangeInfoStore(
+			lambda: self._get(self.base + self.endpoints["exchangeInfo"]), ttl=exchange_info_ttl)
+
+		# if a cache_dir is given, klines are stored on disk and only the missing tail is downloaded
+		self.kline_cache = None
+		if cache_dir != None:
+			self.kline_cache = KlineCache(cache_dir)
+
 		if filename == None:
 			return
 	
@@ -68,10 +113,29 @@ class Binance:
 
 		self.account_access = True
 	
+	def _request(self, method:str, url:str, params=None, headers=None, limit:int=None):
+		""" Sends a request once the scheduler lets us, and feeds the
+		response's weight headers back to it """
+		endpoint = self.endpoint_names.get(url[len(self.base):].split('?')[0], None)
+		weight = self.scheduler.Weight(endpoint, method, limit)
+
+		requested_at = time.time()
+		self.scheduler.Acquire(endpoint, method, weight)
+
+		# if we had to wait, the signed timestamp might be outside recvWindow by now
+		if params != None and 'signature' in params and time.time() - requested_at > 1:
+			del params['signature']
+			params['timestamp'] = int(round(time.time()*1000)) + request_delay
+			self.signRequest(params)
+
+		response = self.session.request(method, url, params=params, headers=headers, timeout=self.timeout)
+		self.scheduler.Update(response.status_code, response.headers)
+		return response
+
 	def _get(self, url, params=None, headers=None) -> dict:
 		""" Makes a Get Request """
 		try: 
-			response = requests.get(url, params=params, headers=headers)
+			response = self._request('GET', url, params=params, headers=headers)
 			data = json.loads(response.text)
 			data['url'] = url
 		except Exception as e:
@@ -83,7 +147,7 @@ class Binance:
 	def _post(self, url, params=None, headers=None) -> dict:
 		""" Makes a Post Request """
 		try: 
-			response = requests.post(url, params=params, headers=headers)
+			response = self._request('POST', url, params=params, headers=headers)
 			data = json.loads(response.text)
 			data['url'] = url
 		except Exception as e:
@@ -94,58 +158,142 @@ class Binance:
 
 	def GetTradingSymbols(self, quoteAssets:list=None):
 		''' Gets All symbols which are tradable (currently) '''
-		url = self.base + self.endpoints["exchangeInfo"]
-		data = self._get(url)
-		if data.__contains__('code'):
+		if quoteAssets == None:
 			return []
 
-		symbols_list = []
-		for pair in data['symbols']:
-			if pair['status'] == 'TRADING':
-				if quoteAssets != None and pair['quoteAsset'] in quoteAssets:
-					symbols_list.append(pair['symbol'])
-
-		return symbols_list
+		return [pair['symbol'] for pair in self.exchange_info.GetSymbolsOfQuoteAssets(quoteAssets)]
 
 	def GetSymbolDataOfSymbols(self, symbols:list=None):
 		''' Gets All symbols which are tradable (currently) '''
-		url = self.base + self.endpoints["exchangeInfo"]
-		data = self._get(url)
-		if data.__contains__('code'):
+		if symbols == None:
 			return []
 
-		symbols_list = []
+		return self.exchange_info.GetSymbols(symbols)
 
-		for pair in data['symbols']:
-			if pair['status'] == 'TRADING':
-				if symbols != None and pair['symbol'] in symbols:
-					symbols_list.append(pair)
+	def GetSymbolData(self, symbol:str):
+		''' Gets the exchangeInfo data of one symbol, None if it doesn't exist '''
+		return self.exchange_info.GetSymbol(symbol)
 
-		return symbols_list
+	def GetSymbolRules(self, symbol:str):
+		''' Gets the compiled trading rules (SymbolRules) of one symbol, None if it doesn't exist '''
+		symbol_data = self.GetSymbolData(symbol)
+		if symbol_data == None:
+			return None
+		return SymbolRules.Of(symbol_data)
 
 	def GetSymbolKlinesExtra(self, symbol:str, interval:str, limit:int=1000, end_time=False):
-		# Basicall, we will be calling the GetSymbolKlines as many times as we need 
-		# in order to get all the historical data required (based on the limit parameter)
-		# and we'll be merging the results into one long dataframe.
-
-		repeat_rounds = 0
-		if limit > 1000:
-			repeat_rounds = int(limit/1000)
-		initial_limit = limit % 1000
-		if initial_limit == 0:
-			initial_limit = 1000
-		# First, we get the last initial_limit candles, starting at end_time and going
-		# backwards (or starting in the present moment, if end_time is False)
-		df = self.GetSymbolKlines(symbol, interval, limit=initial_limit, end_time=end_time)
-		while repeat_rounds > 0:
-			# Then, for every other 1000 candles, we get them, but starting at the beginning
-			# of the previously received candles.
-			df2 = self.GetSymbolKlines(symbol, interval, limit=1000, end_time=df['time'][0])
-			df = df2.append(df, ignore_index = True)
-			repeat_rounds = repeat_rounds - 1
-		
+		''' Gets the last limit klines (ending at end_time, or now), when limit is
+		more than the 1000 candles a single request can return '''
+
+		if interval not in self.KLINE_INTERVAL_MS:
+			# '1M' candles don't have a fixed length, so walk backwards page by page
+			pages = []
+			page_end = end_time
+			remaining = limit
+			while remaining > 0:
+				page = self.DownloadSymbolKlines(symbol, interval, limit=min(remaining, 1000), end_time=page_end)
+				if len(page) == 0:
+					break
+				pages.append(page)
+				remaining = remaining - len(page)
+				page_end = page['time'].iloc[0] - 1
+			if len(pages) == 0:
+				return self.DownloadSymbolKlines(symbol, interval, limit=1, end_time=end_time).head(0)
+			df = pd.concat(pages[::-1], ignore_index=True)
+			return df.drop_duplicates(subset='time').tail(limit).reset_index(drop=True)
+
+		end = int(end_time) if end_time else int(round(time.time()*1000))
+		start = end - limit * self.KLINE_INTERVAL_MS[interval] + 1
+		df = self.GetSymbolKlinesRange(symbol, interval, start, end, extra_fields=True)
+		return df.tail(limit).reset_index(drop=True)
+
+	def GetSymbolKlinesRange(self, symbol:str, interval:str, start_time, end_time=None, workers:int=None,
+		extra_fields:bool=False):
+		''' Gets all klines opened between start_time and end_time (ms timestamps).
+
+		The range is split into 1000-candle windows up front, which are downloaded
+		by a pool of worker threads (pool_size of them by default). If the client
+		has a kline cache, windows it has downloaded before are skipped (even if some
+		candles of them don't exist, see DownloadedRange) and every
+		downloaded page is written back, so an interrupted download picks up where
+		it stopped. '''
+
+		interval_ms = self.KLINE_INTERVAL_MS[interval]
+		now = int(round(time.time()*1000))
+		end = int(end_time) if end_time else now
+		start = int(start_time)
+		if workers == None:
+			workers = self.pool_size
+
+		cache = self.kline_cache
+		cached = None
+		# candle times we know all the candles of (see DownloadedRange)
+		ranges = []
+		if cache != None:
+			cached = cache.Load(symbol, interval)
+			if cached is not None:
+				ranges = cache.LoadRanges(symbol, interval)
+
+		windows = []
+		window_start = start
+		while window_start <= end:
+			window_end = min(window_start + 1000 * interval_ms - 1, end)
+			if not KlineCache.Covers(ranges, window_start, window_end, interval_ms):
+				windows.append((window_start, window_end))
+			window_start = window_start + 1000 * interval_ms
+
+		def download(window):
+			# a window can't hold more than 1000 candles, so the page has all of them
+			page = self.DownloadSymbolKlines(symbol, interval, 1000, start_time=window[0], end_time=window[1])
+			return page, list(window)
+
+		pages = []
+		unsaved_pages = 0
+		pool = ThreadPool(max(1, min(workers, len(windows))))
+		try:
+			for page, downloaded in pool.imap_unordered(download, windows):
+				pages.append(page)
+				ranges.append(downloaded)
+				unsaved_pages = unsaved_pages + 1
+				# write progress to disk every so often, for resuming
+				if cache != None and unsaved_pages >= 50:
+					cached = self._SaveClosedKlines(symbol, interval, cached, pages[-unsaved_pages:], ranges, now)
+					unsaved_pages = 0
+		finally:
+			pool.terminate()
+			if cache != None and unsaved_pages > 0:
+				cached = self._SaveClosedKlines(symbol, interval, cached, pages[-unsaved_pages:], ranges, now)
+
+		# concatenate once, windows can overlap on the boundary candle
+		if cached is not None:
+			pages.append(cached[(cached['time'] >= start) & (cached['time'] <= end)])
+		pages = [page for page in pages if len(page) > 0]
+		if len(pages) == 0:
+			return self.SelectKlineColumns(pd.DataFrame(columns=KlineCache.COLUMNS + ['date']), extra_fields)
+
+		df = pd.concat(pages, ignore_index=True)
+		df = df.drop_duplicates(subset='time', keep='first')
+		df = df[(df['time'] >= start) & (df['time'] <= end)]
+		return self.SelectKlineColumns(df.sort_values('time').reset_index(drop=True), extra_fields)
+
+	def _SaveClosedKlines(self, symbol:str, interval:str, cached, pages:list, ranges:list, now):
+		''' Merges pages into the cached candles and saves the closed ones, with the
+		downloaded ranges (the cached ones and the ones of every page so far) '''
+		cache = self.kline_cache
+		interval_ms = self.KLINE_INTERVAL_MS[interval]
+		df = cache.Merge(cached, pd.concat(pages, ignore_index=True))
+		df = df[df['time'] + interval_ms <= now]
+		if len(df) > 0:
+			cache.Save(symbol, interval, df, cache.MergeRanges(self._ClosedRanges(ranges, interval_ms, now), interval_ms))
 		return df
 
+	@staticmethod
+	def _ClosedRanges(ranges:list, interval_ms:int, now) -> list:
+		''' Ranges cut off at the last closed candle, the one that is still forming
+		can change and isn't saved '''
+		last_closed = now - interval_ms
+		return [[first, min(last, last_closed)] for first, last in ranges if first <= min(last, last_closed)]
+
 	def GetAccountData(self) -> dict:
 		""" Gets Balances & Account Data """
 
@@ -163,7 +311,7 @@ class Binance:
 		url = self.base + self.endpoints['24hrTicker'] + "?symbol="+symbol
 		return self._get(url)
 
-	def GetSymbolKlines(self, symbol:str, interval:str, limit:int=1000, end_time=False):
+	def GetSymbolKlines(self, symbol:str, interval:str, limit:int=1000, end_time=False, extra_fields:bool=False):
 		''' 
 		Gets trading data for one symbol 
 		
@@ -176,34 +324,137 @@ class Binance:
 				days         '1d' '3d'
 				weeks        '1w'
 				months       '1M;
+			extra_fields bool: Also return quote volume, trade count and taker volumes
 		'''
 
 		if limit > 1000:
-			return self.GetSymbolKlinesExtra(symbol, interval, limit, end_time)
-		
+			df = self.GetSymbolKlinesExtra(symbol, interval, limit, end_time)
+		elif self.kline_cache != None and interval in self.KLINE_INTERVAL_MS:
+			df = self.GetCachedSymbolKlines(symbol, interval, limit, end_time)
+		else:
+			df = self.DownloadSymbolKlines(symbol, interval, limit, end_time=end_time)
+
+		return self.SelectKlineColumns(df, extra_fields)
+
+	@classmethod
+	def SelectKlineColumns(cls, df, extra_fields:bool=False):
+		if extra_fields:
+			return df
+		return df.drop(columns=cls.KLINE_EXTRA_COLUMNS, errors='ignore')
+
+	def GetCachedSymbolKlines(self, symbol:str, interval:str, limit:int=1000, end_time=False):
+		''' Serves klines from the local cache, downloading only the candles that
+		came after the last cached one '''
+
+		cache = self.kline_cache
+		interval_ms = self.KLINE_INTERVAL_MS[interval]
+		now = int(round(time.time()*1000))
+		end = int(end_time) if end_time else now
+
+		cached = cache.Load(symbol, interval)
+		# candle times we know all the candles of (see DownloadedRange)
+		ranges = cache.LoadRanges(symbol, interval) if cached is not None else []
+		fresh = None
+
+		if cached is not None and len(cached) > 0 and cached['time'].iloc[-1] + interval_ms <= end:
+			# the cache ends before the requested end, get the tail we're missing
+			start = cached['time'].iloc[-1] + interval_ms
+			fresh = self.DownloadSymbolKlines(symbol, interval, 1000, start_time=start, end_time=end_time)
+			ranges.append(self.DownloadedRange(fresh, 1000, end, start))
+			if len(fresh) == 1000:
+				# the gap is bigger than one page, just get the requested window
+				fresh = self.DownloadSymbolKlines(symbol, interval, limit, end_time=end_time)
+				ranges.append(self.DownloadedRange(fresh, limit, end))
+
+		df = cache.Merge(cached, fresh)
+		window = df[df['time'] <= end].tail(limit)
+
+		# candles missing from the window that we never downloaded the range of:
+		# download the requested window itself and patch the cache with it. Fewer
+		# candles than limit are fine once we know the history starts there
+		if len(window) == 0 or not cache.Covers(ranges, 0 if len(window) < limit else window['time'].iloc[0], end, interval_ms):
+			fresh = self.DownloadSymbolKlines(symbol, interval, limit, end_time=end_time)
+			ranges.append(self.DownloadedRange(fresh, limit, end))
+			df = cache.Merge(df, fresh)
+			window = df[df['time'] <= end].tail(limit)
+
+		if fresh is not None:
+			# only closed candles go to disk
+			closed = df[df['time'] + interval_ms <= now]
+			if len(closed) > 0:
+				cache.Save(symbol, interval, closed, cache.MergeRanges(self._ClosedRanges(ranges, interval_ms, now), interval_ms))
+
+		return window.reset_index(drop=True)
+
+	@staticmethod
+	def DownloadedRange(df, limit:int, end, start_time=None) -> list:
+		''' [first, last] open times of the candles a klines download of limit candles
+		up to end (from start_time) returned all of: a page that isn't full had every
+		candle of the range we asked for, back to the first one the symbol has '''
+		if len(df) < limit:
+			return [start_time if start_time else 0, end]
+		if start_time:
+			return [start_time, df['time'].iloc[-1]]
+		return [df['time'].iloc[0], end]
+
+	def DownloadSymbolKlines(self, symbol:str, interval:str, limit:int=1000, start_time=None, end_time=None):
+		''' Downloads at most 1000 klines of one symbol straight from the exchange '''
+
+		url = self.KlinesUrl(symbol, interval, limit, start_time, end_time)
+
+		# download data
+		data = self._request('GET', url, limit=limit)
+
+		return self.KlinesToDataFrame(data.content)
+
+	def KlinesUrl(self, symbol:str, interval:str, limit:int=1000, start_time=None, end_time=None) -> str:
 		params = '?&symbol='+symbol+'&interval='+interval+'&limit='+str(limit)
+		if start_time:
+			params = params + '&startTime=' + str(int(start_time))
 		if end_time:
 			params = params + '&endTime=' + str(int(end_time))
 
-		url = self.base + self.endpoints['klines'] + params
+		return self.base + self.endpoints['klines'] + params
 
-		# download data
-		data = requests.get(url)
-		dictionary = json.loads(data.text)
+	@classmethod
+	def DecodeKlines(cls, payload):
+		''' Parses the body of a klines response straight into a (candles x 11) float64
+		array, columns in the order of KLINE_COLUMNS + KLINE_EXTRA_COLUMNS.
 
-		# put in dataframe and clean-up
-		df = pd.DataFrame.from_dict(dictionary)
-		df = df.drop(range(6, 12), axis=1)
+		Every field of a kline is a number (some quoted), so once the brackets and
+		quotes are gone the payload is one long comma separated list of numbers, that
+		numpy parses in one go without building python lists / strings first. '''
+		if isinstance(payload, str):
+			payload = payload.encode('utf-8')
 
-		# rename columns
-		col_names = ['time', 'open', 'high', 'low', 'close', 'volume']
-		df.columns = col_names
+		if payload.lstrip()[:1] == b'{':
+			# errors come back as {"code": ..., "msg": ...}
+			raise Exception("Couldn't get klines: " + payload.decode('utf-8'))
 
-		# transform values from strings to floats
-		for col in col_names:
-			df[col] = df[col].astype(float)
+		numbers = payload.translate(None, b'[]" \t\r\n')
+		if len(numbers) == 0:
+			return np.empty((0, 11))
 
-		df['date'] = pd.to_datetime(df['time'] * 1000000, infer_datetime_format=True)
+		data = np.fromstring(numbers, dtype=np.float64, sep=',').reshape(-1, 12)
+		# the last field is unused by Binance
+		return data[:, :11]
+
+	@classmethod
+	def KlinesToDataFrame(cls, payload, extra_fields:bool=True):
+		''' Turns the body of a klines response into a DataFrame, with int64 open (and
+		close) times and float64 prices & volumes '''
+		data = cls.DecodeKlines(payload)
+		if not extra_fields:
+			data = data[:, :6]
+
+		# built on top of the decoded array, the prices aren't copied
+		columns = cls.KLINE_COLUMNS + cls.KLINE_EXTRA_COLUMNS[:data.shape[1] - 6]
+		df = pd.DataFrame(data, columns=columns, copy=False)
+		# ms timestamps are far below 2^53, so they were parsed exactly
+		for col in cls.KLINE_TIME_COLUMNS:
+			if col in columns:
+				df[col] = data[:, columns.index(col)].astype(np.int64)
+		df['date'] = (df['time'].to_numpy() * 1000000).astype('datetime64[ns]')
 
 		return df
 	
@@ -272,7 +523,7 @@ class Binance:
 		url = self.base + self.endpoints['order']
 
 		try: 
-			response = requests.delete(url, params=params, headers=self.headers)
+			response = self._request('DELETE', url, params=params, headers=self.headers)
 			data = response.text
 		except Exception as e:
 			print("Exception occured when trying to cancel order on "+url)
@@ -314,7 +565,7 @@ class Binance:
 		url = self.base + self.endpoints['allOrders']
 
 		try: 
-			response = requests.get(url, params=params, headers=self.headers)
+			response = self._request('GET', url, params=params, headers=self.headers)
 			data = response.text
 		except Exception as e:
 			print("Exception occured when trying to get info on all orders on "+url)
@@ -358,52 +609,15 @@ class Binance:
 
 	@classmethod
 	def RoundToValidPrice(cls, symbol_data, desired_price, round_up:bool=False) -> Decimal:
-		""" Returns the minimum quantity of a symbol we can buy,
-		closest to desiredPrice """
-		
-		pr_filter = {}
-		
-		for fil in symbol_data["filters"]:
-			if fil["filterType"] == "PRICE_FILTER":
-				pr_filter = fil
-				break
-		
-		if not pr_filter.keys().__contains__("tickSize"):
-			raise Exception("Couldn't find tickSize or PRICE_FILTER in symbol_data.")
-			return
-
-		round_off_number = int(cls.get10Factor((float(pr_filter["tickSize"]))))
-
-		number = round(Decimal(desired_price), round_off_number)
-		if round_up:
-			number = number + Decimal(pr_filter["tickSize"])
-
-		return number
+		""" Returns the valid price of a symbol closest to desired_price
+		(one tick higher if round_up) """
+		return SymbolRules.Of(symbol_data).RoundPrice(desired_price, round_up)
 
 	@classmethod
 	def RoundToValidQuantity(cls, symbol_data, desired_quantity, round_up:bool=False) -> Decimal:
-		""" Returns the minimum quantity of a symbol we can buy,
-		closest to desiredPrice """
-		
-		lot_filter = {}
-		
-		for fil in symbol_data["filters"]:
-			if fil["filterType"] == "LOT_SIZE":
-				lot_filter = fil
-				break
-		
-		if not lot_filter.keys().__contains__("stepSize"):
-			raise Exception("Couldn't find stepSize or PRICE_FILTER in symbol_data.")
-			return
-
-		round_off_number = int(cls.get10Factor((float(lot_filter["stepSize"]))))
-
-		number = round(Decimal(desired_quantity), round_off_number)
-		if round_up:
-			number = number + Decimal(lot_filter["stepSize"])
-
-		return number
-
+		""" Returns the valid quantity of a symbol closest to desired_quantity
+		(one step higher if round_up) """
+		return SymbolRules.Of(symbol_data).RoundQuantity(desired_quantity, round_up)
 
 def Main():
 
@@ -1,37 +1,52 @@
 import time
+import asyncio
 from requests import exceptions 
 
 from uuid import uuid1
 from decimal import Decimal, getcontext
 from yaspin import yaspin
 from Binance import Binance
+from SymbolRules import SymbolRules
 
 from multiprocessing.pool import ThreadPool as Pool
 from functools import partial
 from Database import BotDatabase
 
 from TradeModel import TradeModel
+from KlineStream import KlineStream
+from StreamingIndicators import IndicatorState
+from Indicators import Indicators
 
 from Strategies import *
 
 class BotRunner:
 
+	# Number of threads looking for entries / exits at once, the exchange's
+	# connection pool should be (at least) this big
+	POOL_SIZE = 4
+	# columns of the candles themselves, the rest of a df are indicators
+	CANDLE_COLUMNS = Binance.KLINE_COLUMNS + ['date']
+
 	def __init__(self, sp, exchange, database):
 		self.sp = sp
 		self.exchange = exchange
 		self.database = database
 		self.update_balance = True
 		self.ask_permission = True
+		# streaming indicator state of every (bot id, symbol), see UpdateIndicators
+		self.indicator_states = dict()
 		getcontext().prec = 33
 
-	def EntryOrder(self, bot_params, strategy_function, pairs, symbol_data):
+	def EntryOrder(self, bot_params, strategy_function, pairs, symbol_data, df=None):
 		sp = self.sp
 		exchange = self.exchange
 		database = self.database
 
-		# get dataframe & check for signal
+		# get dataframe (unless it came from a kline stream) & check for signal
 		symbol = symbol_data['symbol']
-		df = exchange.GetSymbolKlines(symbol, bot_params['interval'])	
+		if df is None:
+			df = exchange.GetSymbolKlines(symbol, bot_params['interval'])	
+		Indicators.describe(df, symbol, bot_params['interval'])
 		buy = strategy_function(df, len(df['close'])-1)
 
 		sp.text = "Checking signals on "+symbol
@@ -41,13 +56,13 @@ class BotRunner:
 			order_id = str(uuid1())
 			# buy at 0.4% lower than current price
 			q_qty = Decimal(bot_params['trade_allocation'])
-			buy_price = exchange.RoundToValidPrice(
-				symbol_data = symbol_data, 
-			    desired_price = Decimal(df['close'][i]) * Decimal(0.99))
-                
-			quantity = exchange.RoundToValidQuantity(
-				symbol_data = symbol_data, 
-				desired_quantity = q_qty / buy_price)
+			rules = SymbolRules.Of(symbol_data)
+			buy_price = rules.RoundPrice(Decimal(df['close'][i]) * Decimal(0.99))
+			quantity = rules.RoundQuantity(q_qty / buy_price)
+
+			if not rules.IsValidOrder(buy_price, quantity):
+				sp.text = "Order on "+symbol+" would be under the minimum quantity / notional, skipping"
+				return
 			
 			order_params = dict(
 				symbol = symbol,
@@ -60,8 +75,11 @@ class BotRunner:
 
 			if self.ask_permission:
 
-				model = TradeModel(symbol, bot_params['interval'])
-				model.df = df
+				# the streaming indicators only fill the last candles of df, plot the
+				# candles with their indicators computed on all of them instead
+				model = TradeModel(symbol, bot_params['interval'], exchange)
+				model.df = df[[column for column in df.columns if column in self.CANDLE_COLUMNS]].copy()
+				Indicators.ensureIndicators(model.df, getattr(strategy_function, 'indicators', []))
 				model.plot_data(buy_signals=[(df['time'][i], buy)], plot_title=symbol)
 
 				sp.stop()
@@ -117,8 +135,9 @@ class BotRunner:
 			if order['is_entry_order']:
 				# place the exit order
 				order_id = str(uuid1())
-				price = exchange.RoundToValidPrice(symbol_data = self.all_symbol_datas[symbol], desired_price = Decimal(order['take_profit_price']))
-				quantity = exchange.RoundToValidQuantity(symbol_data = self.all_symbol_datas[symbol], desired_quantity = Decimal(order['executed_quantity']))
+				rules = SymbolRules.Of(self.all_symbol_datas[symbol])
+				price = rules.RoundPrice(Decimal(order['take_profit_price']))
+				quantity = rules.RoundQuantity(Decimal(order['executed_quantity']))
 				order_params = dict(
 					symbol = symbol,
 					side = "SELL",
@@ -233,15 +252,14 @@ class BotRunner:
 
 		order = dict()
 		if symbol_data == None:
-			symbol_data = exchange.GetSymbolDataOfSymbols([order_result['symbol']])
+			symbol_data = exchange.GetSymbolData(order_result['symbol'])
 		order['id'] = order_result['clientOrderId']
 		order['bot_id'] = bot_params['id']
 		order['symbol'] = order_result['symbol']
 		order['time'] = order_result['transactTime']
 		order['price'] = order_result['price']
-		order['take_profit_price'] = exchange.RoundToValidPrice(
-			symbol_data = symbol_data,
-			desired_price = Decimal(order_result['price']) * Decimal(bot_params['profit_target']), 
+		order['take_profit_price'] = SymbolRules.Of(symbol_data).RoundPrice(
+			Decimal(order_result['price']) * Decimal(bot_params['profit_target']),
 			round_up=True)
 		order['original_quantity'] =  Decimal(order_result['origQty'])
 		order['executed_quantity'] =  Decimal(order_result['executedQty'])
@@ -451,6 +469,8 @@ class BotRunner:
 							sp.text = "SSL Error caught!"
 						except exceptions.ConnectionError:
 							sp.text = "Having trouble connecting... retry"
+						except exceptions.Timeout:
+							sp.text = "Request timed out... retry"
 					
 						open_orders = database.GetOpenOrdersOfBot(bot)
 
@@ -463,6 +483,8 @@ class BotRunner:
 								sp.text = "SSL Error caught!"
 							except exceptions.ConnectionError:
 								sp.text = "Having trouble connecting... retry"
+							except exceptions.Timeout:
+								sp.text = "Request timed out... retry"
 						else:
 							sp.text = "No orders open on "+ bot['name']
 
@@ -471,12 +493,117 @@ class BotRunner:
 					print("\nExiting...\n")
 					return
 
+	def StartStreaming(self, bots, exit_check_delay:float=10):
+		""" Like StartExecution, but entries are checked when a candle closes on the
+		kline websocket streams instead of polling klines. Open orders are still
+		checked every exit_check_delay seconds. Orders can't be confirmed one by one
+		here: the callbacks of every stream run at once, and a prompt would hold up
+		its stream, so ask_permission has to be turned off first. """
+		database = self.database
+
+		if self.ask_permission:
+			print("Can't ask for permission to place orders while streaming, set ask_permission to False first.")
+			return
+
+		if len(bots) == 0:
+			self.sp.text = "No bots available, exiting..."
+			return
+
+		self.all_symbol_datas = dict()
+		for bot, sd in bots:
+			for pair in database.GetAllPairsOfBot(bot):
+				self.all_symbol_datas[pair['symbol']] = sd[pair['symbol']]
+
+		with yaspin() as sp:
+			self.sp = sp
+			try:
+				asyncio.run(self._Stream(bots, exit_check_delay))
+			except KeyboardInterrupt:
+				sp.stop()
+				print("\nExiting...\n")
+
+	async def _Stream(self, bots, exit_check_delay):
+		database = self.database
+
+		streams = []
+		for bot, symbol_datas_dict in bots:
+
+			def on_close(symbol, df, bot=bot, symbol_datas_dict=symbol_datas_dict):
+				# only look for entries on pairs that aren't in a trade already
+				pairs = dict()
+				for pair in database.GetActivePairsOfBot(bot):
+					pairs[pair['symbol']] = pair
+				self.UpdateIndicators(bot, symbol, df)
+				if symbol in pairs:
+					self.sp.text = "Candle closed on "+symbol
+					self.EntryOrder(bot, strategies_dict[bot['strategy_name']], pairs, symbol_datas_dict[symbol], df)
+
+			streams.append(KlineStream(self.exchange, list(symbol_datas_dict.keys()), bot['interval'], on_close))
+
+		tasks = [asyncio.ensure_future(stream.Run()) for stream in streams]
+		try:
+			while True:
+				await asyncio.to_thread(self.CheckExits, bots)
+				await asyncio.sleep(exit_check_delay)
+		finally:
+			for stream in streams:
+				stream.Stop()
+			for task in tasks:
+				task.cancel()
+
+	def UpdateIndicators(self, bot_params, symbol:str, df):
+		""" Updates the indicators the bot's strategy needs with the candles of df we
+		haven't seen yet, and writes them into df so the strategy doesn't recompute them.
+		The state is saved in the database, so a restart carries on from it. """
+		specs = strategy_indicators.get(bot_params['strategy_name'], None)
+		if specs == None:
+			return
+
+		key = (bot_params['id'], symbol)
+		state = self.indicator_states.get(key, None)
+		if state == None:
+			saved = self.database.GetIndicatorState(bot_params, symbol)
+			if saved != None:
+				state = IndicatorState.fromDict(saved)
+			# the strategy might have changed since it was saved
+			if saved == None or state.specs != specs:
+				state = IndicatorState(specs)
+			self.indicator_states[key] = state
+
+		if state.updateFromDf(df) > 0:
+			self.database.SaveIndicatorState(bot_params, symbol, state.toDict())
+		state.fillColumns(df)
+
+	def CheckExits(self, bots):
+		""" Looks for exits on the open orders of all bots """
+		sp = self.sp
+		database = self.database
+
+		all_pairs = dict()
+		for bot, sd in bots:
+			for pair in database.GetAllPairsOfBot(bot):
+				all_pairs[pair['symbol']] = pair
+
+		for bot, symbol_datas_dict in bots:
+			open_orders = database.GetOpenOrdersOfBot(bot)
+			if len(open_orders) == 0:
+				continue
+			sp.text = (str(len(open_orders)) + " orders open on " + bot['name'] + ", looking to close.")
+			try:
+				self.Exit(bot, all_pairs, open_orders)
+			except exceptions.SSLError:
+				sp.text = "SSL Error caught!"
+			except exceptions.ConnectionError:
+				sp.text = "Having trouble connecting... retry"
+			except exceptions.Timeout:
+				sp.text = "Request timed out... retry"
+
 	def Run(self, bot_params, strategy_function, pairs, symbol_datas):
 		sp = self.sp
 		exchange = self.exchange
 		database = self.database
 
-		pool = Pool(4)
+		pool = Pool(self.POOL_SIZE)
 		func1 = partial(self.EntryOrder, bot_params, strategy_function, pairs)
 		pool.map(func1, symbol_datas)
 		pool.close()
@@ -487,7 +614,7 @@ class BotRunner:
 		exchange = self.exchange
 		database = self.database
 
-		pool = Pool(4)
+		pool = Pool(self.POOL_SIZE)
 		func1 = partial(self.ExitOrder, bot_params, pairs)
 		pool.map(func1, orders)
 		pool.close()
@@ -496,14 +623,15 @@ class BotRunner:
 def Main():
 
 	sp = yaspin()
-	exchange = Binance(filename = 'credentials.txt')
+	exchange = Binance(filename = 'credentials.txt', cache_dir = 'klines', pool_size = BotRunner.POOL_SIZE)
 	database = BotDatabase("database.db")
 	prog = BotRunner(sp, exchange, database)
 
-	i = input("Execute or Quit? (e or q)\n")
+	i = input("Execute, Stream or Quit? (e, s or q)\n")
 	bot_symbol_datas = []
 	while i not in ['q']:
-		if i == 'e':
+		if i in ['e', 's']:
+			stream = i == 's'
 			i = input("Create a new bot? (y or n)\n")
 			if i == 'y':
 
@@ -529,9 +657,16 @@ def Main():
 			else:
 				bot_symbol_datas = prog.GetAllBotsFromDb()
 
-			prog.StartExecution(bot_symbol_datas)
+			if stream:
+				i = input("Orders are placed without asking while streaming, continue? (y or n)\n")
+				if i == 'y':
+					prog.ask_permission = False
+					prog.StartStreaming(bot_symbol_datas)
+					prog.ask_permission = True
+			else:
+				prog.StartExecution(bot_symbol_datas)
 		
-		i = input("Execute or Quit? (e or q)")
+		i = input("Execute, Stream or Quit? (e, s or q)")
 		
 if __name__ == "__main__":
 	Main()
\ No newline at end of file
@@ -0,0 +1,58 @@
+#A minimal stand-in for the klines DataFrame, for strategies that look at one candle at a time
+#df['close'][i] on a DataFrame goes through pandas' indexing machinery and takes microseconds.
+#On a CandleFrame df['close'] is a plain numpy array, so the same lookup is ~100x cheaper,
+#and strategies written for DataFrames run on it without changes:
+#
+#   frame = CandleFrame.fromDataFrame(model.df)
+#   for i in range(len(frame)):
+#       buy = ichimokuBull(frame, i)
+#
+#Indicators.addIndicator (and the cache / pipeline) work on it like on a df.
+import numpy as np
+import pandas as pd
+
+
+class CandleFrame:
+
+    __slots__ = ('data', 'length', '__weakref__')
+
+    def __init__(self, data):
+        #data is a dict of column name -> 1-D array, all the same length
+        self.data = dict()
+        self.length = None
+        for name, values in data.items():
+            self[name] = values
+
+    @staticmethod
+    def fromDataFrame(df):
+        #Numeric columns are shared with df where pandas allows it, not copied
+        return CandleFrame({name: df[name].to_numpy() for name in df.columns})
+
+    def toDataFrame(self):
+        return pd.DataFrame(self.data)
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def __setitem__(self, name, values):
+        values = np.asarray(values)
+        if values.ndim == 0:
+            values = np.full(self.length or 0, values)
+        if self.length is None:
+            self.length = len(values)
+        elif len(values) != self.length:
+            raise ValueError('Length of values (' + str(len(values)) + ') does not match length of frame (' + str(self.length) + ')')
+        self.data[name] = values
+
+    def __contains__(self, name):
+        return name in self.data
+
+    def __len__(self):
+        return self.length or 0
+
+    @property
+    def columns(self):
+        return list(self.data.keys())
+
+    def keys(self):
+        return self.data.keys()
@@ -1,4 +1,5 @@
 import sqlite3
+import json
 from decimal import Decimal
 
 def adapt_decimal(d):
@@ -15,11 +16,15 @@ class BotDatabase:
 		sqlite3.register_converter("decimal", convert_decimal)
 		self.name = name
 		self.Initialise()
+
+	def Connect(self):
+		''' Opens a connection to the Database '''
+		return sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
 		
 	def Initialise(self):
 		''' Initialises the Database ''' 
 
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		# Create tables
@@ -62,6 +67,14 @@ class BotDatabase:
 			FOREIGN KEY(closing_order_id) REFERENCES orders(id)
 			)''')
 
+		c.execute('''CREATE TABLE IF NOT EXISTS indicator_states (
+			bot_id text,
+			symbol text,
+			state text,
+			PRIMARY KEY(bot_id, symbol),
+			FOREIGN KEY(bot_id) REFERENCES bots(id)
+			)''')
+
 		conn.commit()
 
 	def SaveBot(self, bot):
@@ -76,7 +89,7 @@ class BotDatabase:
 			profit_target text, 
 			test_run bool
 		'''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		values = (
@@ -93,7 +106,7 @@ class BotDatabase:
 	def GetBot(self, id:str):
 		''' Gets Bot details from Database '''
 
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		c.execute('SELECT * FROM bots WHERE id = ?', (id, ))
@@ -103,7 +116,7 @@ class BotDatabase:
 	def GetAllBots(self):
 		''' Gets Bot details from Database '''
 
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		c.execute('SELECT * FROM bots')
@@ -113,7 +126,7 @@ class BotDatabase:
 	def UpdateBot(self, bot):
 		''' Updates a Bot within the Database '''
 
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 
@@ -128,7 +141,7 @@ class BotDatabase:
 		'''
 		Saves an Order to the Database
 		'''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		values = (
@@ -151,7 +164,7 @@ class BotDatabase:
 	
 	def GetOrder(self, id:str):
 		''' Gets Bot details from Database '''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		c.execute('SELECT * FROM orders WHERE id=?', (id, ))
@@ -160,7 +173,7 @@ class BotDatabase:
 
 	def UpdateOrder(self, order):
 		''' Updates a Bot within the Database '''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 
@@ -192,7 +205,7 @@ class BotDatabase:
 			FOREIGN KEY(current_order_id) REFERENCES orders(id),
     	FOREIGN KEY(bot_id) REFERENCES bots(id)
 		'''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		values = (
@@ -208,7 +221,7 @@ class BotDatabase:
 	
 	def GetPair(self, id:str):
 		''' Gets Bot details from Database '''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		c.execute('SELECT * FROM pairs WHERE id=?', (id, ))
@@ -224,7 +237,7 @@ class BotDatabase:
 			symbol, 
 			bot['id'])
 			
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		c.execute("UPDATE pairs " + \
@@ -234,10 +247,10 @@ class BotDatabase:
 
 	def GetOpenOrdersOfBot(self, bot):
 		''' Gets all the bots within a database '''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
-		c.execute('SELECT * FROM orders Where bot_id = ? and closing_order_id = 0 and is_closed = 0', (bot['id'],))
+		c.execute('SELECT * FROM orders Where bot_id = ? and is_closed = 0', (bot['id'],))
 		
 		orders = []
 		result = [dict(row) for row in c.fetchall()]
@@ -245,7 +258,7 @@ class BotDatabase:
 		
 	def GetActivePairsOfBot(self, bot):
 		''' Gets all the bots within a database '''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		c.execute('SELECT * FROM pairs Where bot_id = ? and is_active = 1', (bot['id'],))
@@ -254,9 +267,27 @@ class BotDatabase:
 
 	def GetAllPairsOfBot(self, bot):
 		''' Gets all the bots within a database '''
-		conn = sqlite3.connect(self.name, detect_types=sqlite3.PARSE_DECLTYPES)
+		conn = self.Connect()
 		conn.row_factory = sqlite3.Row
 		c = conn.cursor()
 		c.execute('SELECT * FROM pairs Where bot_id = ?', (bot['id'],))
 		result = [dict(row) for row in c.fetchall()]
-		return result
\ No newline at end of file
+		return result
+
+	def SaveIndicatorState(self, bot, symbol:str, state:dict):
+		''' Saves the streaming indicator state of a pair (replaces the old one) '''
+		conn = self.Connect()
+		c = conn.cursor()
+		c.execute('INSERT OR REPLACE INTO indicator_states VALUES (?, ?, ?)',
+			(bot['id'], symbol, json.dumps(state)))
+		conn.commit()
+
+	def GetIndicatorState(self, bot, symbol:str):
+		''' Gets the streaming indicator state of a pair, None if there isn't one '''
+		conn = self.Connect()
+		c = conn.cursor()
+		c.execute('SELECT state FROM indicator_states WHERE bot_id = ? and symbol = ?', (bot['id'], symbol))
+		row = c.fetchone()
+		if row == None:
+			return None
+		return json.loads(row[0])
@@ -1,6 +1,12 @@
 import pandas as  pd 
+import numpy as np
 from decimal import Decimal, getcontext
 
+from Indicators import Indicators
+from CandleFrame import CandleFrame
+from MultiStrategy import strategySignals
+import BacktestEngine
+
 class EvaluateStrategy:
     """Evaluate performance of diff strategies through simple backtest"""
 
@@ -26,10 +32,12 @@ class EvaluateStrategy:
     initial_profits:float = 1.045,
     initial_stop_loss:float = 0.85,
     incremental_profits:float = 1.04,
-    incremental_stop_loss:float = 0.975):
+    incremental_stop_loss:float = 0.975,
+    signals = None):
         
         #Function to backtest strategy and set rules
         #Will return balance that could have been a result of running the current strategy
+        #signals can be passed if they were already computed (see MultiStrategy.py)
 
         #Error checking
         if initial_stop_loss >= 1 or initial_stop_loss <= 0:
@@ -39,84 +47,76 @@ class EvaluateStrategy:
             AssertionError('initial_profits must be greater than 1')
         
         df = model.df 
-        buy_times, sell_times = [], []
-
-        last_buy = None
 
-        #Calculations to 30th decimal for accuracy
+        #Every buy price of the strategy at once (see signals), the trades are then found
+        #by BacktestEngine.backtest, which follows the same rules as the Decimal loop it
+        #replaced (BacktestEngine.referenceBacktest) on float64
+        if signals is None:
+            signals = self.signals(df, model)
+        buys, sells, resulting_balance = BacktestEngine.backtest(
+            signals, df['low'], df['high'],
+            starting_balance = starting_balance,
+            initial_profits = initial_profits,
+            initial_stop_loss = initial_stop_loss,
+            incremental_profits = incremental_profits,
+            incremental_stop_loss = incremental_stop_loss)
+
+        #Results are kept as Decimals, like they always were
         getcontext().prec = 30
-
-        resulting_balance = Decimal(starting_balance)
-        stop_loss = Decimal(initial_stop_loss)
-        profit_target = Decimal(initial_profits)
-        buy_price = 0
-
-        #iterate through all candlesticks
-        #Check if strategy is fulfilled and if it is a buy or sell time. Only checks sell if previously bought the symbol
-        for i in range(len(df['close'])-1):
-            #Check if bought
-            if last_buy is None:
-                #Check if strategy is fulfilled
-                try:
-                    strategy_result = self.strategy(model.df, i)
-                except Exception as e:
-                    pass
-
-                if strategy_result:
-                    #If strat is fulfilled, buy the symbol/coin, set stop loss and take profit
-                    buy_price = Decimal(strategy_result)
-                    last_buy = {
-                        'index':i,
-                        'price': buy_price
-                    }
-
-                    buy_times.append([df['time'][i], buy_price])
-
-                    stop_loss = Decimal(initial_stop_loss)
-                    profit_target = Decimal(initial_profits)
-            
-            #If already bought, checkc if price has hit SL or TP
-            elif last_buy is not None and i > last_buy['index'] + 1:
-                stop_loss_price = last_buy['price'] * stop_loss
-                next_target_price = last_buy['price'] * profit_target
-
-                #if price goes below SL, sell at that price
-                if df['low'][i] < stop_loss_price:
-                    sell_times.append([df['time'][i], stop_loss_price])
-                    resulting_balance = resulting_balance * (stop_loss_price / buy_price)
-
-                    #reset values for last_buy
-                    last_buy = None
-                    buy_price = Decimal(0)
-
-                elif df['high'][i] > next_target_price:
-                    #if price goes above target, increase SL and adjust next target.
-                    last_buy = {
-                        'index': i,
-                        'price': Decimal(next_target_price),
-                    }
-
-                    stop_loss = Decimal(incremental_stop_loss)
-                    profit_target = Decimal(incremental_profits)
+        times = np.asarray(df['time'])
+        buy_times = [[times[i], Decimal(price)] for i, price in buys]
+        sell_times = [[times[i], Decimal(price)] for i, price in sells]
+        resulting_balance = Decimal(resulting_balance)
         
         #Aggregate results, add to the model's symbol
-        self.results[model.symbol] = dict(
+        self.addResult(model.symbol, starting_balance, resulting_balance, dict(
             returns = round(Decimal(100.0) * (resulting_balance / Decimal(starting_balance) - Decimal(1.0)), 3),
             buy_times = buy_times,
             sell_times = sell_times
-        )
+        ))
+
+        return resulting_balance
+
+        #Counts the result of a symbol, also used for backtests run elsewhere (see ParallelBacktest.py)
+    def addResult(self, symbol, starting_balance, resulting_balance, result):
+        self.results[symbol] = result
 
         if resulting_balance > starting_balance:
             self.profitable_symbols = self.profitable_symbols + 1
         elif resulting_balance < starting_balance:
             self.unprofitable_symbols = self.unprofitable_symbols + 1
 
-        return resulting_balance
-
         #Check only last candlestick for strategy fullfilment
-    def evaluate(self, model):
+    def evaluate(self, model, signals=None):
         last_entry = len(model.df['close']) -1
-        return self.strategy(model.df, last_entry)
+        if signals is None:
+            if not hasattr(self.strategy, 'signals'):
+                return self.strategy(model.df, last_entry)
+            signals = self.signals(model.df, model)
+        if last_entry < 0 or np.isnan(signals[last_entry]):
+            return False
+        return signals[last_entry]
+
+        #Buy price (or NaN) on every candle of df
+    def signals(self, df, model=None):
+        Indicators.ensureIndicators(df, getattr(self.strategy, 'indicators', []))
+        if hasattr(self.strategy, 'signals'):
+            return strategySignals(self.strategy, df)
+
+        #Other strategies are called on every candle, give them numpy arrays instead of
+        #pandas Series to index into
+        if isinstance(df, CandleFrame):
+            return strategySignals(self.strategy, df)
+        frame = CandleFrame.fromDataFrame(df)
+        if model is not None and hasattr(model, 'timeframe'):
+            Indicators.describe(frame, model.symbol, model.timeframe)
+        signals = strategySignals(self.strategy, frame)
+
+        #Keep the indicators the strategy added, for plotting
+        for name in frame.columns:
+            if name not in df:
+                df[name] = frame[name]
+        return signals
 
         #Helper functions
     def updateResult(self, starting_balance, resulting_balance):
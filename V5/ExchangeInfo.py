@@ -0,0 +1,104 @@
+import threading
+import time
+
+# exchangeInfo is a several MB download, so we keep one copy of it around, indexed
+# by symbol and by quote asset. Once it's older than ttl seconds it gets refreshed
+# in a background thread, while callers keep getting the old copy until the new one
+# is in.
+
+class ExchangeInfoStore:
+
+	def __init__(self, fetch, ttl:float=1800, refresh_in_background:bool=True):
+		'''
+		Parameters
+		--
+			fetch function:              Downloads exchangeInfo, returns the decoded json
+			ttl float:                   Seconds after which the data gets refreshed
+			refresh_in_background bool:  If False, refreshes block the caller instead
+		'''
+		self.fetch = fetch
+		self.ttl = ttl
+		self.refresh_in_background = refresh_in_background
+
+		self.lock = threading.Lock()
+		self.refresh_lock = threading.Lock()
+		self.refreshing = False
+		self.loaded_at = None
+
+		self.symbols = dict()
+		self.symbols_by_quote = dict()
+
+	def Refresh(self) -> bool:
+		''' Downloads exchangeInfo and rebuilds the indexes, returns False if it failed '''
+		data = self.fetch()
+		if data.__contains__('code') or not data.__contains__('symbols'):
+			return False
+
+		symbols = dict()
+		symbols_by_quote = dict()
+		for pair in data['symbols']:
+			symbols[pair['symbol']] = pair
+			symbols_by_quote.setdefault(pair['quoteAsset'], []).append(pair)
+
+		# swap in the new indexes in one go, readers never see half of them
+		with self.lock:
+			self.symbols, self.symbols_by_quote = symbols, symbols_by_quote
+			self.loaded_at = time.time()
+		return True
+
+	def Invalidate(self):
+		with self.lock:
+			self.loaded_at = None
+
+	def _EnsureFresh(self):
+		with self.lock:
+			loaded_at = self.loaded_at
+			if loaded_at != None and time.time() - loaded_at < self.ttl:
+				return
+			if loaded_at != None and self.refresh_in_background:
+				# stale but usable, refresh once in the background
+				if not self.refreshing:
+					self.refreshing = True
+					threading.Thread(target=self._BackgroundRefresh, daemon=True).start()
+				return
+
+		# nothing loaded yet (or no background refresh), so we have to wait for it
+		with self.refresh_lock:
+			# another thread might have refreshed it while we were waiting
+			if self.loaded_at == None or time.time() - self.loaded_at >= self.ttl:
+				self.Refresh()
+
+	def _BackgroundRefresh(self):
+		try:
+			with self.refresh_lock:
+				self.Refresh()
+		finally:
+			with self.lock:
+				self.refreshing = False
+
+	def GetSymbol(self, symbol:str):
+		''' Returns the exchangeInfo entry of symbol, or None if it doesn't exist '''
+		self._EnsureFresh()
+		return self.symbols.get(symbol, None)
+
+	def GetSymbols(self, symbols:list, status:str='TRADING') -> list:
+		''' Returns the entries of the given symbols that have the given status '''
+		self._EnsureFresh()
+		index = self.symbols
+		symbols_list = []
+		for symbol in dict.fromkeys(symbols):
+			pair = index.get(symbol, None)
+			if pair != None and (status == None or pair['status'] == status):
+				symbols_list.append(pair)
+		return symbols_list
+
+	def GetSymbolsOfQuoteAssets(self, quote_assets:list, status:str='TRADING') -> list:
+		''' Returns the entries of all symbols quoted in one of quote_assets '''
+		self._EnsureFresh()
+		index = self.symbols_by_quote
+		symbols_list = []
+		for quote_asset in dict.fromkeys(quote_assets):
+			for pair in index.get(quote_asset, []):
+				if status == None or pair['status'] == status:
+					symbols_list.append(pair)
+		return symbols_list
@@ -0,0 +1,77 @@
+#Compares the numpy indicators in Indicators.py with the pyti ones they replaced
+#Prints the time each takes and the largest difference between their outputs
+#Needs pyti installed (pip install pyti), the bot itself doesn't
+import time
+import numpy as np
+
+from pyti.smoothed_moving_average import smoothed_moving_average as pyti_sma
+from pyti.exponential_moving_average import exponential_moving_average as pyti_ema
+from pyti.bollinger_bands import lower_bollinger_band as pyti_lbb
+from pyti.bollinger_bands import upper_bollinger_band as pyti_ubb
+
+from Indicators import Indicators
+
+
+#(indicator name, pyti function, period)
+CASES = [
+    ('sma', pyti_sma, 30),
+    ('ema', pyti_ema, 50),
+    ('ema', pyti_ema, 200),
+    ('lbb', pyti_lbb, 14),
+    ('ubb', pyti_ubb, 14),
+]
+
+SIZES = [1000, 10000, 100000]
+
+
+def randomWalk(n, seed=0):
+    #Close prices that look a bit like a real market
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+def timeIt(func, *args, repeat=3):
+    #Best of repeat runs, in seconds
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def maxDifference(a, b):
+    #Largest relative difference where both are computed, they must also agree on the NaNs
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    if not np.array_equal(np.isnan(a), np.isnan(b)):
+        return np.inf
+    valid = ~np.isnan(a)
+    if not valid.any():
+        return 0.0
+    return np.max(np.abs(a[valid] - b[valid]) / np.abs(b[valid]))
+
+
+def Main():
+    print('{:>8} {:>10} {:>12} {:>12} {:>9} {:>10}'.format(
+        'candles', 'indicator', 'pyti (ms)', 'numpy (ms)', 'speedup', 'max diff'))
+
+    for size in SIZES:
+        close = randomWalk(size)
+        close_list = close.tolist()
+
+        for name, pyti_func, period in CASES:
+            #pyti is slow on big inputs, a single run is enough
+            pyti_time, expected = timeIt(pyti_func, close_list, period, repeat=1)
+            numpy_time, result = timeIt(Indicators.INDICATORS_DICT[name], close, period)
+
+            print('{:>8} {:>10} {:>12.2f} {:>12.2f} {:>8.1f}x {:>10.1e}'.format(
+                size, name+' '+str(period), pyti_time*1000, numpy_time*1000,
+                pyti_time/numpy_time, maxDifference(result, expected)))
+
+
+if __name__ == '__main__':
+    Main()
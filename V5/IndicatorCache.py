@@ -0,0 +1,146 @@
+#Memoizes indicator results between DataFrames, so a df that was fetched again (or
+#that got a few new candles) doesn't recompute its indicators from scratch.
+#Entries are keyed by (symbol, interval, indicator name, column, args) and keep the
+#input columns they were computed from. A new df is lined up with the entry by candle
+#time, so a window that slid forward (GetSymbolKlines(limit=1000) on every candle, the
+#live bot) reuses it as well as a df that grew: the candles where the inputs match are
+#reused, only the rest is computed (see Indicators.extendIndicator). A df gets the same
+#values whether or not they came from the cache.
+#Least recently used entries are dropped once there are more than max_entries.
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+class IndicatorCache:
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        #What we know about the dfs we've seen: id(df) -> [weakref, symbol, interval, {col: (spec, len)}]
+        self.frames = dict()
+
+        self.hits = 0
+        self.extensions = 0
+        self.misses = 0
+
+    def _frame(self, df, create=True):
+        frame = self.frames.get(id(df), None)
+        #ids get reused once a df is garbage collected
+        if frame is not None and frame[0]() is df:
+            return frame
+        if not create:
+            return None
+
+        key = id(df)
+        def forget(ref, key=key):
+            if self.frames.get(key, (None,))[0] is ref:
+                del self.frames[key]
+        frame = [weakref.ref(df, forget), None, None, dict()]
+        self.frames[key] = frame
+        return frame
+
+    def describe(self, df, symbol, interval):
+        #Tells the cache which symbol & interval df holds, so entries are shared by symbol
+        frame = self._frame(df)
+        frame[1] = symbol
+        frame[2] = interval
+
+    def isComputed(self, df, col_name, spec):
+        #True if col_name was computed for spec on df as it is now
+        frame = self._frame(df, create=False)
+        return frame is not None and frame[3].get(col_name, None) == (spec, len(df))
+
+    def markComputed(self, df, col_name, spec):
+        self._frame(df)[3][col_name] = (spec, len(df))
+
+    def key(self, df, spec, inputs):
+        frame = self._frame(df)
+        times = inputs['time']
+        symbol, interval = frame[1], frame[2]
+        if symbol is None:
+            #unknown df, fall back to what its first candle looks like
+            #(its candles can't be lined up with another df's then)
+            symbol = tuple(float(values[0]) for name, values in sorted(inputs.items()))
+        if interval is None:
+            interval = float(times[1] - times[0]) if len(times) > 1 else None
+        return (symbol, interval, spec)
+
+    def get(self, df, spec, inputs, compute, extend):
+        #Returns the columns of spec on inputs (dict of float64 arrays, including 'time').
+        #compute(inputs) computes them from scratch, extend(cached, inputs, k, offset) reuses
+        #cached columns (lined up with inputs) on their first k candles, offset is the number
+        #of candles the cached ones started before inputs.
+        if len(inputs['time']) == 0:
+            return compute(inputs)
+
+        entry = self._entry(self.key(df, spec, inputs))
+        n = len(inputs['time'])
+        offset, k = (0, 0) if entry is None else self._matchingCandles(entry[0], inputs)
+        if entry is not None and offset == 0 and k == n and len(entry[0]['time']) == n:
+            self.hits += 1
+            return {col: values.copy() for col, values in entry[1].items()}
+
+        if k > 0:
+            self.extensions += 1
+            columns = extend({col: values[offset:offset+k] for col, values in entry[1].items()}, inputs, k, offset)
+        else:
+            self.misses += 1
+            columns = compute(inputs)
+
+        self.store(df, spec, inputs, columns)
+        return columns
+
+    def lookup(self, df, spec, inputs):
+        #Returns the columns of spec if they were computed on exactly these inputs, else None
+        if len(inputs['time']) == 0:
+            return None
+        entry = self._entry(self.key(df, spec, inputs))
+        n = len(inputs['time'])
+        if entry is None or len(entry[0]['time']) != n or self._matchingCandles(entry[0], inputs) != (0, n):
+            return None
+        self.hits += 1
+        return {col: values.copy() for col, values in entry[1].items()}
+
+    def store(self, df, spec, inputs, columns):
+        if len(inputs['time']) == 0:
+            return
+        key = self.key(df, spec, inputs)
+        stored_inputs = {name: np.array(values) for name, values in inputs.items()}
+        stored_columns = {col: np.array(values) for col, values in columns.items()}
+        with self.lock:
+            self.entries[key] = (stored_inputs, stored_columns)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _entry(self, key):
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def _matchingCandles(self, cached, inputs):
+        #(offset, k): inputs start at candle offset of the cached inputs, and are the same
+        #as them on their first k candles. (0, 0) when they don't start on a cached candle
+        offset = int(np.searchsorted(cached['time'], inputs['time'][0]))
+        if offset == len(cached['time']) or cached['time'][offset] != inputs['time'][0]:
+            return 0, 0
+        length = min(len(cached['time']) - offset, len(inputs['time']))
+        matching = length
+        for name, values in inputs.items():
+            if name not in cached:
+                return 0, 0
+            different = np.flatnonzero(cached[name][offset:offset+length] != values[:length])
+            if len(different) > 0:
+                matching = min(matching, int(different[0]))
+        return offset, matching
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,165 @@
+#Computes a set of indicators together, sharing what they have in common
+#Every indicator is described as a graph of nodes (rolling max/min, means, std,
+#averages...) over the candle columns. Nodes are keyed by what they compute, so
+#when several indicators need the same node (both bollinger bands need the same
+#rolling mean & std, the ichimoku lines share their rolling highs and lows, two
+#strategies both use the 200 ema...) it's only computed once.
+#
+#   pipeline = IndicatorPipeline.forStrategies([maCrossoverStrategy, bollStrategy])
+#   pipeline.run(df)
+import numpy as np
+
+from Indicators import Indicators, INDICATOR_INPUTS, rollingMean, rollingStd, rollingSum, rollingMax, rollingMin, \
+    shift, exponentialMovingAverage, smoothedMovingAverage, gains, losses, rsiFromAverages, typicalPrice
+
+
+def ratio(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a / b
+
+
+#What a node does with its arguments (columns, other nodes or numbers)
+NODE_FUNCTIONS = {
+    'ema': exponentialMovingAverage,
+    'smma': smoothedMovingAverage,
+    'rolling_mean': rollingMean,
+    'rolling_std': rollingStd,
+    'rolling_sum': rollingSum,
+    'rolling_max': rollingMax,
+    'rolling_min': rollingMin,
+    'shift': shift,
+    'mid': lambda a, b: (a + b) / 2,
+    'band': lambda mean, std, std_mult: mean + std * std_mult,
+    'gains': gains,
+    'losses': losses,
+    'rsi': rsiFromAverages,
+    'typical': typicalPrice,
+    'sub': lambda a, b: a - b,
+    'mul': lambda a, b: a * b,
+    'ratio': ratio,
+}
+
+
+def ichimokuGraph(col_name, args):
+    tenkansen = ('mid', ('rolling_max', 'high', 9), ('rolling_min', 'low', 9))
+    kijunsen = ('mid', ('rolling_max', 'high', 26), ('rolling_min', 'low', 26))
+    return {
+        'tenkansen': tenkansen,
+        'kijunsen': kijunsen,
+        'senkou_a': ('shift', ('mid', tenkansen, kijunsen), 26),
+        'senkou_b': ('shift', ('mid', ('rolling_max', 'high', 52), ('rolling_min', 'low', 52)), 52),
+        'chikou_span': ('shift', 'close', -26)
+    }
+
+
+def macdGraph(col_name, args):
+    fast, slow, signal = args
+    macd = ('sub', ('ema', 'close', fast), ('ema', 'close', slow))
+    macd_signal = ('ema', macd, signal)
+    return {col_name: macd, col_name+'_signal': macd_signal, col_name+'_hist': ('sub', macd, macd_signal)}
+
+
+#Columns each entry of Indicators.INDICATORS_DICT adds, as nodes
+INDICATOR_GRAPHS = {
+    'sma': lambda col_name, args: {col_name: ('smma', 'close', args)},
+    'ema': lambda col_name, args: {col_name: ('ema', 'close', args)},
+    'lbb': lambda col_name, args: {col_name: ('band', ('rolling_mean', 'close', args), ('rolling_std', 'close', args), -2.0)},
+    'ubb': lambda col_name, args: {col_name: ('band', ('rolling_mean', 'close', args), ('rolling_std', 'close', args), 2.0)},
+    'ichimoku': ichimokuGraph,
+    'rsi': lambda col_name, args: {col_name: ('rsi', ('smma', ('gains', 'close'), args), ('smma', ('losses', 'close'), args))},
+    'macd': macdGraph,
+    'vwap': lambda col_name, args: {col_name: ('ratio',
+        ('rolling_sum', ('mul', ('typical', 'high', 'low', 'close'), 'volume'), args),
+        ('rolling_sum', 'volume', args))}
+}
+
+
+class IndicatorPipeline:
+
+    def __init__(self, specs=[]):
+        #specs are dicts of indicator_name, col_name, args (what Indicators.addIndicator takes)
+        self.specs = []
+        for spec in specs:
+            self.add(**spec)
+
+    @staticmethod
+    def forStrategies(strategies):
+        #Pipeline of everything the strategies list in their .indicators
+        pipeline = IndicatorPipeline()
+        for strategy in strategies:
+            for spec in getattr(strategy, 'indicators', []):
+                pipeline.add(**spec)
+        return pipeline
+
+    def add(self, indicator_name, col_name, args):
+        spec = dict(indicator_name=indicator_name, col_name=col_name, args=args)
+        if spec not in self.specs:
+            self.specs.append(spec)
+        return self
+
+    def inputs(self):
+        #Candle columns the pipeline reads
+        names = ['time']
+        for spec in self.specs:
+            for name in INDICATOR_INPUTS[spec['indicator_name']]:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def compute(self, inputs, specs=None):
+        #Computes the columns of every spec on a dict of input arrays (1-D, or 2-D time x symbols),
+        #returns them as a dict. Nodes shared between specs are computed once.
+        nodes = dict()
+        columns = dict()
+        for spec in self.specs if specs is None else specs:
+            try:
+                graph = INDICATOR_GRAPHS[spec['indicator_name']](spec['col_name'], spec['args'])
+                for col_name, node in graph.items():
+                    columns[col_name] = self._evaluate(node, inputs, nodes)
+            except Exception as e:
+                print('Error raised when trying to compute: '+ spec['indicator_name'])
+                print(e)
+        return columns
+
+    def _evaluate(self, node, inputs, nodes):
+        if isinstance(node, str):
+            return inputs[node]
+        if not isinstance(node, tuple):
+            return node
+
+        if node not in nodes:
+            args = [self._evaluate(arg, inputs, nodes) for arg in node[1:]]
+            nodes[node] = NODE_FUNCTIONS[node[0]](*args)
+        return nodes[node]
+
+    def run(self, df):
+        #Adds the columns of every spec to df, skipping the ones it already has (see
+        #Indicators.ensureIndicator) and taking the ones it can from the cache
+        cache = Indicators.cache
+        inputs = {name: np.asarray(df[name], dtype=np.float64) for name in self.inputs()}
+
+        missing = []
+        for spec in self.specs:
+            key = (spec['indicator_name'], spec['col_name'], spec['args'])
+            if cache.isComputed(df, spec['col_name'] or spec['indicator_name'], key):
+                continue
+            spec_inputs = {name: inputs[name] for name in ('time',) + INDICATOR_INPUTS[spec['indicator_name']]}
+            columns = cache.lookup(df, key, spec_inputs)
+            if columns is None:
+                missing.append((spec, key, spec_inputs))
+                continue
+            for col, values in columns.items():
+                df[col] = values
+            Indicators.markComputed(df, **spec)
+
+        computed = self.compute(inputs, [spec for spec, key, spec_inputs in missing])
+        for spec, key, spec_inputs in missing:
+            graph = INDICATOR_GRAPHS[spec['indicator_name']](spec['col_name'], spec['args'])
+            if not all(col in computed for col in graph):
+                continue
+            columns = {col: computed[col] for col in graph}
+            cache.store(df, key, spec_inputs, columns)
+            for col, values in columns.items():
+                df[col] = values
+            Indicators.markComputed(df, **spec)
+        return df
@@ -1,11 +1,182 @@
 #Will be used to calculate indicators from a df
 
-from pyti.smoothed_moving_average import smoothed_moving_average as sma
-from pyti.exponential_moving_average import exponential_moving_average as ema
-from pyti.bollinger_bands import lower_bollinger_band as lbb
-from pyti.bollinger_bands import upper_bollinger_band as ubb
+#All indicators work on float64 numpy arrays, either 1-D (one series) or 2-D
+#(time x symbols), with no python loop over the candles. They give the same
+#values as the pyti versions we used before (see IndicatorBenchmark.py)
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from IndicatorCache import IndicatorCache
 #Will add more as needed
-#RSI, MACD, VWAP
+
+
+def _checkPeriod(data, period):
+    #Same error pyti gave, addIndicator prints it
+    if len(data) < int(period):
+        raise ValueError("Error: data_len < period")
+
+
+def _rolling(data, period, func):
+    #Applies func (np.mean, np.max...) over every window of period candles,
+    #the first period-1 values can't be computed and are NaN
+    data = np.asarray(data, dtype=np.float64)
+    period = int(period)
+    _checkPeriod(data, period)
+
+    result = np.full(data.shape, np.nan)
+    result[period-1:] = func(sliding_window_view(data, period, axis=0), axis=-1)
+    return result
+
+
+def rollingMean(data, period):
+    return _rolling(data, period, np.mean)
+
+
+def rollingStd(data, period):
+    #Population std (ddof=0), like np.std
+    return _rolling(data, period, np.std)
+
+
+def rollingSum(data, period):
+    return _rolling(data, period, np.sum)
+
+
+def rollingMax(data, period):
+    return _rolling(data, period, np.max)
+
+
+def rollingMin(data, period):
+    return _rolling(data, period, np.min)
+
+
+def shift(data, periods):
+    #Like pandas' shift, positive periods move values forward in time
+    data = np.asarray(data, dtype=np.float64)
+    result = np.full(data.shape, np.nan)
+    if periods >= 0:
+        result[periods:] = data[:len(data)-periods]
+    else:
+        result[:periods] = data[-periods:]
+    return result
+
+
+def _linearFilter(x, alpha, previous=None):
+    #Computes y[t] = (1 - alpha) * y[t-1] + alpha * x[t] (with y[-1] = previous, or 0) over axis 0.
+    #Within a block of candles this has a closed form with a cumulative sum, so we
+    #only loop over blocks. Blocks are short enough that (1 - alpha)^-block can't overflow.
+    r = 1.0 - alpha
+    if r <= 0:
+        return x.copy()
+
+    n = len(x)
+    block = int(max(1, min(n, 600 / -np.log(r))))
+    powers = r ** np.arange(block, dtype=np.float64)
+    inverse_powers = 1.0 / powers
+
+    y = np.empty_like(x)
+    if previous is None:
+        previous = np.zeros(x.shape[1:])
+    for start in range(0, n, block):
+        xb = x[start:start+block]
+        m = len(xb)
+        shape = (m,) + (1,) * (x.ndim - 1)
+        acc = np.cumsum(xb * inverse_powers[:m].reshape(shape), axis=0)
+        yb = powers[:m].reshape(shape) * (r * previous + alpha * acc)
+        y[start:start+m] = yb
+        previous = yb[-1]
+    return y
+
+
+def _seededAverage(data, period, alpha):
+    #Recursive average seeded with the simple average of the first period values.
+    #Leading NaNs (e.g. warm-up of a previous indicator, or a symbol with a shorter
+    #history in a 2-D array) are skipped and kept as NaN, per column.
+    data = np.asarray(data, dtype=np.float64)
+    period = int(period)
+    _checkPeriod(data, period)
+
+    columns = data.reshape(len(data), -1)
+    n = len(columns)
+    x = np.zeros(columns.shape)
+    seed_index = np.full(columns.shape[1], n)
+
+    for col in range(columns.shape[1]):
+        finite = np.flatnonzero(~np.isnan(columns[:, col]))
+        if len(finite) == 0 or finite[0] + period - 1 >= n:
+            continue
+        seed = finite[0] + period - 1
+        seed_index[col] = seed
+        x[seed+1:, col] = columns[seed+1:, col]
+        #y[seed] = alpha * x[seed] since everything before it is 0
+        x[seed, col] = np.mean(columns[finite[0]:seed+1, col]) / alpha
+
+    result = _linearFilter(x, alpha)
+    result[np.arange(n)[:, None] < seed_index[None, :]] = np.nan
+    return result.reshape(data.shape)
+
+
+def exponentialMovingAverage(data, period):
+    #EMA[t] = alpha * P[t] + (1 - alpha) * EMA[t-1], alpha = 2 / (N + 1)
+    return _seededAverage(data, period, 2.0 / (int(period) + 1))
+
+
+def smoothedMovingAverage(data, period):
+    #Wilder's average, SMMA[t] = (SMMA[t-1] * (N - 1) + P[t]) / N
+    return _seededAverage(data, period, 1.0 / int(period))
+
+
+def lowerBollingerBand(data, period, std_mult=2.0):
+    return rollingMean(data, period) - rollingStd(data, period) * std_mult
+
+
+def upperBollingerBand(data, period, std_mult=2.0):
+    return rollingMean(data, period) + rollingStd(data, period) * std_mult
+
+
+def gains(data):
+    #Rise of the price from the previous candle (0 if it fell), NaN on the first candle
+    change = np.diff(np.asarray(data, dtype=np.float64), axis=0)
+    return np.concatenate([np.full((1,) + change.shape[1:], np.nan), np.maximum(change, 0)])
+
+
+def losses(data):
+    change = np.diff(np.asarray(data, dtype=np.float64), axis=0)
+    return np.concatenate([np.full((1,) + change.shape[1:], np.nan), np.maximum(-change, 0)])
+
+
+def rsiFromAverages(average_gain, average_loss):
+    #100 when there were no losses at all
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + average_gain / average_loss)
+    return np.where((average_loss == 0) & ~np.isnan(average_gain), 100.0, rsi)
+
+
+def relativeStrengthIndex(data, period):
+    #Wilder's RSI, gains & losses averaged with the smoothed moving average
+    return rsiFromAverages(smoothedMovingAverage(gains(data), period), smoothedMovingAverage(losses(data), period))
+
+
+def movingAverageConvergenceDivergence(data, args=(12, 26, 9)):
+    #args are (fast, slow, signal) periods. Returns the macd line, its signal line
+    #(ema of the macd line) and the histogram (macd - signal).
+    fast, slow, signal = args
+    macd = exponentialMovingAverage(data, fast) - exponentialMovingAverage(data, slow)
+    macd_signal = exponentialMovingAverage(macd, signal)
+    return macd, macd_signal, macd - macd_signal
+
+
+def typicalPrice(high, low, close):
+    return (np.asarray(high, dtype=np.float64) + low + close) / 3
+
+
+def volumeWeightedAveragePrice(df, period):
+    #Rolling VWAP of the last period candles, on their typical price (high + low + close) / 3.
+    #NaN where there was no volume at all.
+    volume = np.asarray(df['volume'], dtype=np.float64)
+    price_volume = typicalPrice(df['high'], df['low'], df['close']) * volume
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return rollingSum(price_volume, period) / rollingSum(volume, period)
+
 
 '''
 #Computing ichimoku cloud
@@ -15,48 +186,153 @@ If price moves below base line --> pullback
 if price moves above conversion line --> upturn
 '''
 def getIchimokuCloud(df):
-    
+
     '''Components (from python for finance blog)
     https://www.pythonforfinance.net/2019/06/26/ichimoku-trading-strategy-with-python/
     '''
+    high = np.asarray(df['high'], dtype=np.float64)
+    low = np.asarray(df['low'], dtype=np.float64)
 
     #Tenkan-sen (conversion line): (9 period high + 9 period low) / 2
-    nine_period_high = df['high'].rolling(window=9).max()
-    nine_period_low = df['low'].rolling(window=9).min()
-    df['tenkansen'] = (nine_period_high + nine_period_low) / 2
+    tenkansen = (rollingMax(high, 9) + rollingMin(low, 9)) / 2
+    df['tenkansen'] = tenkansen
 
     #Kijun-sen (Base Line): (26 p high + 26 p low) / 2
-    period26_high = df['high'].rolling(window=26).max()
-    period26_low = df['low'].rolling(window=26).min()
-    df['kijunsen'] = (period26_high + period26_low) / 2
+    kijunsen = (rollingMax(high, 26) + rollingMin(low, 26)) / 2
+    df['kijunsen'] = kijunsen
 
     #Senkou Span A (leading span A): (Conversion line + base line) / 2
-    df['senkou_a'] = ((df['tenkansen'] + df['kijunsen']) / 2).shift(26)
+    df['senkou_a'] = shift((tenkansen + kijunsen) / 2, 26)
 
     #Senkou Span B
-    period52_high = df['high'].rolling(window=52).max()
-    period52_low = df['low'].rolling(window=52).min()
-    df['senkou_b'] = ((period52_high + period52_low) / 2).shift(52)
+    df['senkou_b'] = shift((rollingMax(high, 52) + rollingMin(low, 52)) / 2, 52)
 
     # The most current closing price plotted 26 time periods behind (optional)
-    df['chikou_span'] = df['close'].shift(-26)
+    df['chikou_span'] = shift(df['close'], -26)
 
     return df
 
 
+#Columns each indicator reads from the df
+INDICATOR_INPUTS = {
+    'sma': ('close',),
+    'ema': ('close',),
+    'lbb': ('close',),
+    'ubb': ('close',),
+    'ichimoku': ('high', 'low', 'close'),
+    'rsi': ('close',),
+    'macd': ('close',),
+    'vwap': ('high', 'low', 'close', 'volume')
+}
+
+ICHIMOKU_COLUMNS = ('tenkansen', 'kijunsen', 'senkou_a', 'senkou_b', 'chikou_span')
+
+#Window indicators, (candles before, candles after) a value depends on
+INDICATOR_WINDOWS = {
+    'lbb': lambda args: (int(args) - 1, 0),
+    'ubb': lambda args: (int(args) - 1, 0),
+    #senkou_b is the 52 candle high/low from 52 candles ago, chikou_span the close 26 candles ahead
+    'ichimoku': lambda args: (52 + 51, 26),
+    'vwap': lambda args: (int(args) - 1, 0)
+}
+#Anything else (sma, ema, rsi, macd) is recomputed as a whole when candles are added:
+#their values depend on every candle before them, and continuing them from a cached value
+#(or from candles a previous df had) wouldn't give exactly what computing them on the df does
+
+
+def computeIndicator(indicator_name, col_name, args, inputs):
+    #Computes an indicator on a dict of input arrays, returns a dict of its columns
+    if indicator_name == 'ichimoku':
+        columns = getIchimokuCloud(dict(inputs))
+        return {col: columns[col] for col in ICHIMOKU_COLUMNS}
+    if indicator_name == 'macd':
+        macd, macd_signal, macd_hist = movingAverageConvergenceDivergence(inputs['close'], args)
+        return {col_name: macd, col_name+'_signal': macd_signal, col_name+'_hist': macd_hist}
+    if indicator_name == 'vwap':
+        return {col_name: volumeWeightedAveragePrice(inputs, args)}
+    return {col_name: Indicators.INDICATORS_DICT[indicator_name](inputs['close'], args)}
+
+
+def extendIndicator(indicator_name, col_name, args, cached, inputs, k, offset=0):
+    #Same as computeIndicator, given the columns computed on the same first k candles of
+    #inputs (cached). Only the candles after them (and the ones they affect) are computed.
+    #offset > 0 means the cached columns were computed on a df that started offset candles
+    #earlier (a window that slid forward), their first candles are recomputed.
+    #The result is always the same as computeIndicator's, whatever the cache saw before.
+    n = len(inputs['time'])
+
+    if indicator_name not in INDICATOR_WINDOWS:
+        return computeIndicator(indicator_name, col_name, args, inputs)
+
+    before, after = INDICATOR_WINDOWS[indicator_name](args)
+    start = max(0, k - after)
+    first = max(0, start - before)
+    #candles before `head` used candles the df doesn't have anymore
+    head = min(before, start) if offset > 0 else 0
+    if first == 0 or head + after >= start:
+        return computeIndicator(indicator_name, col_name, args, inputs)
+
+    columns = {col: np.array(values[:n]) for col, values in cached.items()}
+    if head > 0:
+        #long enough for a whole window, the first head values only depend on the first head + after candles
+        head_columns = computeIndicator(indicator_name, col_name, args,
+            {name: values[:head+before+after+1] for name, values in inputs.items()})
+        for col in columns:
+            columns[col][:head] = head_columns[col][:head]
+    if start >= n:
+        return columns
+
+    tail = computeIndicator(indicator_name, col_name, args,
+        {name: values[first:] for name, values in inputs.items()})
+    return {col: np.concatenate([columns[col][:start], tail[col][start-first:]]) for col in tail}
+
+
 #Func to compute any indicator and add to the df, called from outside class when TradeModel.py calls for an indicator for a strategy
 
 class Indicators:
 
     #All indicators that have been created
+    #('sma' has always been the smoothed moving average)
     INDICATORS_DICT = {
-        'sma': sma,
-        'ema': ema,
-        'lbb': lbb,
-        'ubb': ubb,
-        'ichimoku': getIchimokuCloud
+        'sma': smoothedMovingAverage,
+        'ema': exponentialMovingAverage,
+        'lbb': lowerBollingerBand,
+        'ubb': upperBollingerBand,
+        'ichimoku': getIchimokuCloud,
+        #args=period
+        'rsi': relativeStrengthIndex,
+        #args=(fast, slow, signal), adds col_name, col_name_signal and col_name_hist
+        'macd': movingAverageConvergenceDivergence,
+        #args=period, reads high, low, close & volume
+        'vwap': volumeWeightedAveragePrice
     }
 
+    #Results shared between dfs, see IndicatorCache.py
+    cache = IndicatorCache()
+
+    @staticmethod
+    def describe(df, symbol, interval):
+        #Lets the cache share results between dfs of the same symbol & interval
+        Indicators.cache.describe(df, symbol, interval)
+
+    @staticmethod
+    def markComputed(df, indicator_name, col_name, args):
+        #For columns that were put in the df some other way (e.g. streaming indicators)
+        Indicators.cache.markComputed(df, col_name or indicator_name, (indicator_name, col_name, args))
+
+    @staticmethod
+    def ensureIndicator(df, indicator_name, col_name, args):
+        #Adds the indicator to df, unless it has already been computed on df as it is now.
+        #Cheap enough to be called on every candle from a strategy.
+        if not Indicators.cache.isComputed(df, col_name or indicator_name, (indicator_name, col_name, args)):
+            Indicators.addIndicator(df, indicator_name, col_name, args)
+
+    @staticmethod
+    def ensureIndicators(df, specs):
+        #ensureIndicator for a list of specs (dicts of indicator_name, col_name, args)
+        for spec in specs:
+            Indicators.ensureIndicator(df, spec['indicator_name'], spec['col_name'], spec['args'])
+
     @staticmethod
     def addIndicator(df, indicator_name, col_name, args):
         #Df is df to add indicator to,
@@ -65,13 +341,16 @@ class Indicators:
         #args for potential other arguments during function call
 
         try:
-            #special case, where more columns created in df
-            if indicator_name == 'ichimoku':
-                df = getIchimokuCloud(df)
-            else:
-                df[col_name] = Indicators.INDICATORS_DICT[indicator_name](df['close'].tolist(), args)
+            spec = (indicator_name, col_name, args)
+            inputs = {name: np.asarray(df[name], dtype=np.float64) for name in ('time',) + INDICATOR_INPUTS[indicator_name]}
+            columns = Indicators.cache.get(df, spec, inputs,
+                lambda inputs: computeIndicator(indicator_name, col_name, args, inputs),
+                lambda cached, inputs, k, offset: extendIndicator(indicator_name, col_name, args, cached, inputs, k, offset))
+
+            #special case (ichimoku), where more columns created in df
+            for col, values in columns.items():
+                df[col] = values
+            Indicators.cache.markComputed(df, col_name or indicator_name, spec)
         except Exception as e:
             print('Error raised when trying to compute: '+ indicator_name)
             print(e)
-
-
@@ -0,0 +1,112 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Local candle store, so we don't have to download the same klines over and over.
+# Every (symbol, interval) pair gets its own .npz file in cache_dir, holding one
+# array per column. Only closed candles are stored, the candle that is still
+# forming is always fetched fresh from the exchange.
+# The file also keeps the ranges of candle times that were downloaded, so candles
+# missing inside them (maintenance halts, a symbol's history starting later) are
+# known not to exist rather than not cached.
+
+class KlineCache:
+
+	COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume',
+		'trades', 'taker_base_volume', 'taker_quote_volume']
+	# ms timestamps, int64 like Binance.KlinesToDataFrame returns them
+	TIME_COLUMNS = ['time', 'close_time']
+
+	def __init__(self, cache_dir:str='klines'):
+		self.cache_dir = cache_dir
+		self.lock = threading.Lock()
+		os.makedirs(cache_dir, exist_ok=True)
+
+	def Path(self, symbol:str, interval:str) -> str:
+		return os.path.join(self.cache_dir, symbol + '_' + interval + '.npz')
+
+	def Load(self, symbol:str, interval:str):
+		''' Returns the cached candles as a DataFrame, or None if nothing is cached '''
+		path = self.Path(symbol, interval)
+		with self.lock:
+			if not os.path.exists(path):
+				return None
+			try:
+				with np.load(path) as data:
+					# files from before we kept every field count as not cached
+					if not all(col in data.files for col in self.COLUMNS):
+						return None
+					columns = {col: data[col].astype(np.int64) if col in self.TIME_COLUMNS else data[col]
+						for col in self.COLUMNS}
+			except Exception as e:
+				print("Couldn't read cached klines from "+path)
+				print(e)
+				return None
+
+		df = pd.DataFrame(columns)
+		df['date'] = pd.to_datetime(df['time'] * 1000000)
+		return df
+
+	def LoadRanges(self, symbol:str, interval:str) -> list:
+		''' Returns the downloaded ranges of candle open times, as [first, last] lists '''
+		path = self.Path(symbol, interval)
+		with self.lock:
+			if not os.path.exists(path):
+				return []
+			try:
+				with np.load(path) as data:
+					if 'ranges' not in data.files:
+						return []
+					return data['ranges'].tolist()
+			except Exception as e:
+				print("Couldn't read cached klines from "+path)
+				print(e)
+				return []
+
+	def Save(self, symbol:str, interval:str, df, ranges:list=None):
+		''' Overwrites the cached candles of symbol/interval with the ones in df,
+		and the downloaded ranges with ranges '''
+		path = self.Path(symbol, interval)
+		columns = {col: df[col].to_numpy(dtype=np.int64 if col in self.TIME_COLUMNS else float) for col in self.COLUMNS}
+		columns['ranges'] = np.array(ranges or [], dtype=float).reshape(-1, 2)
+		with self.lock:
+			# write to a temp file first, so a crash never leaves half a file behind
+			tmp_path = path + '.tmp.npz'
+			np.savez(tmp_path, **columns)
+			os.replace(tmp_path, path)
+
+	def Merge(self, cached, fresh):
+		''' Merges two candle DataFrames, newer rows win on duplicate times '''
+		if cached is None or len(cached) == 0:
+			if fresh is None:
+				return pd.DataFrame(columns=self.COLUMNS + ['date'])
+			return fresh.reset_index(drop=True)
+		if fresh is None or len(fresh) == 0:
+			return cached.reset_index(drop=True)
+
+		df = pd.concat([cached, fresh], ignore_index=True)
+		df = df.drop_duplicates(subset='time', keep='last')
+		return df.sort_values('time').reset_index(drop=True)
+
+	@staticmethod
+	def MergeRanges(ranges:list, interval_ms:int) -> list:
+		''' Sorts ranges and joins the ones that overlap or follow each other '''
+		merged = []
+		for first, last in sorted(ranges):
+			if len(merged) > 0 and first <= merged[-1][1] + interval_ms:
+				merged[-1][1] = max(merged[-1][1], last)
+			else:
+				merged.append([first, last])
+		return merged
+
+	@classmethod
+	def Covers(cls, ranges:list, first, last, interval_ms:int) -> bool:
+		''' True if every candle from first to last (open times) was downloaded '''
+		return any(start <= first and last <= end for start, end in cls.MergeRanges(ranges, interval_ms))
+
+	def Clear(self, symbol:str, interval:str):
+		path = self.Path(symbol, interval)
+		with self.lock:
+			if os.path.exists(path):
+				os.remove(path)
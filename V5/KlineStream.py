@@ -0,0 +1,163 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import aiohttp
+import pandas as pd
+
+# Listens to Binance's <symbol>@kline_<interval> websocket streams instead of polling
+# the klines endpoint. A window of the last closed candles is kept in memory for
+# every symbol, and on_close(symbol, df) is called whenever a candle closes, with df
+# looking just like what GetSymbolKlines returns (except it only has closed candles).
+# If the connection drops we reconnect, and fill the candles we missed over REST
+# (on_close is then called for the newest of them, so it isn't skipped).
+# Calls for the same symbol run one after the other, in the order its candles closed.
+
+class KlineStream:
+
+	COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume']
+
+	# Binance allows 1024 streams per connection, we stay well below that
+	STREAMS_PER_CONNECTION = 200
+
+	def __init__(self, exchange, symbols:list, interval:str, on_close, window:int=1000,
+		base:str='wss://stream.binance.com:9443', reconnect_delay:float=1, max_reconnect_delay:float=60):
+		'''
+		Parameters
+		--
+			exchange:                 Binance or AsyncBinance client, used for backfilling
+			symbols list:             Symbols to listen to
+			interval str:             Kline interval, one of Binance.KLINE_INTERVALS
+			on_close function:        Called as on_close(symbol, df) when a candle closes,
+			                          can be a normal function (runs on a thread) or a coroutine.
+			                          Calls for different symbols can run at the same time
+			window int:               Number of candles to keep per symbol
+			base str:                 Websocket base url, point it to a local server for testing
+		'''
+		self.exchange = exchange
+		self.symbols = list(symbols)
+		self.interval = interval
+		self.on_close = on_close
+		self.window = window
+		self.base = base
+		self.reconnect_delay = reconnect_delay
+		self.max_reconnect_delay = max_reconnect_delay
+
+		self.candles = {symbol: deque(maxlen=window) for symbol in self.symbols}
+		# held while on_close runs for the symbol, so a backfilled candle and the next
+		# live one can't both place an entry or update the same indicator state
+		self.locks = {symbol: asyncio.Lock() for symbol in self.symbols}
+		self.running = False
+		self.tasks = set()
+
+	def GetWindow(self, symbol:str):
+		''' Returns the candles we have for symbol as a DataFrame '''
+		df = pd.DataFrame(list(self.candles[symbol]), columns=self.COLUMNS)
+		df['time'] = df['time'].astype('int64')
+		df['date'] = pd.to_datetime(df['time'] * 1000000)
+		return df
+
+	def Stop(self):
+		self.running = False
+
+	async def Run(self):
+		''' Backfills every symbol, then listens until Stop() is called '''
+		self.running = True
+		chunks = [self.symbols[i:i + self.STREAMS_PER_CONNECTION]
+			for i in range(0, len(self.symbols), self.STREAMS_PER_CONNECTION)]
+		await asyncio.gather(*[self._Listen(chunk) for chunk in chunks])
+
+	async def _Listen(self, symbols:list):
+		streams = '/'.join([symbol.lower() + '@kline_' + self.interval for symbol in symbols])
+		url = self.base + '/stream?streams=' + streams
+		delay = self.reconnect_delay
+
+		async with aiohttp.ClientSession() as session:
+			while self.running:
+				try:
+					await self._Backfill(symbols)
+					async with session.ws_connect(url, heartbeat=30) as ws:
+						delay = self.reconnect_delay
+						async for msg in ws:
+							if msg.type == aiohttp.WSMsgType.TEXT:
+								self._OnMessage(json.loads(msg.data))
+							elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+								break
+							if not self.running:
+								break
+				except Exception as e:
+					print("Kline stream disconnected, reconnecting in "+str(delay)+"s")
+					print(e)
+
+				if self.running:
+					await asyncio.sleep(delay)
+					delay = min(delay * 2, self.max_reconnect_delay)
+
+	def _OnMessage(self, message:dict):
+		kline = message.get('data', message).get('k', None)
+		# we only care about candles that just closed
+		if kline == None or not kline['x']:
+			return
+
+		symbol = kline['s']
+		if symbol not in self.candles:
+			return
+
+		candle = (float(kline['t']), float(kline['o']), float(kline['h']),
+			float(kline['l']), float(kline['c']), float(kline['v']))
+		if not self._AddCandle(symbol, candle):
+			return
+		self._Closed(symbol)
+
+	def _Closed(self, symbol:str):
+		''' Calls on_close with the window of symbol, without waiting for it '''
+		task = asyncio.ensure_future(self._Callback(symbol, self.GetWindow(symbol)))
+		self.tasks.add(task)
+		task.add_done_callback(self.tasks.discard)
+
+	def _AddCandle(self, symbol:str, candle:tuple) -> bool:
+		''' Appends a closed candle to the window, returns False if we had it already '''
+		candles = self.candles[symbol]
+		if len(candles) > 0 and candles[-1][0] >= candle[0]:
+			return False
+		candles.append(candle)
+		return True
+
+	async def _Callback(self, symbol:str, df):
+		# waiters get the lock in the order they asked for it, so in the order candles closed
+		async with self.locks[symbol]:
+			try:
+				if asyncio.iscoroutinefunction(self.on_close):
+					await self.on_close(symbol, df)
+				else:
+					await asyncio.to_thread(self.on_close, symbol, df)
+			except Exception as e:
+				print("Exception in kline stream callback for "+symbol)
+				print(e)
+
+	async def _Backfill(self, symbols:list):
+		''' Gets the closed candles we're missing over REST '''
+		now = int(round(time.time()*1000))
+		interval_ms = self.exchange.KLINE_INTERVAL_MS.get(self.interval, None)
+
+		async def backfill(symbol):
+			if asyncio.iscoroutinefunction(self.exchange.GetSymbolKlines):
+				df = await self.exchange.GetSymbolKlines(symbol, self.interval, self.window)
+			else:
+				df = await asyncio.to_thread(self.exchange.GetSymbolKlines, symbol, self.interval, self.window)
+
+			if interval_ms != None:
+				df = df[df['time'] + interval_ms <= now]
+			else:
+				# can't tell if the last '1M' candle closed, so leave it to the stream
+				df = df.iloc[:-1]
+
+			added = False
+			for row in df[self.COLUMNS].itertuples(index=False):
+				added = self._AddCandle(symbol, tuple(float(value) for value in row)) or added
+			# a candle that closed while we weren't listening still gets looked at
+			if added:
+				self._Closed(symbol)
+
+		await asyncio.gather(*[backfill(symbol) for symbol in symbols])
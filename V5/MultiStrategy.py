@@ -0,0 +1,143 @@
+#Evaluates many strategies on the same candles together
+#
+#   multi = MultiStrategyEvaluator(strategy_evaluators)
+#   balances = multi.backtest(model, **options)
+#
+#The indicators of all the strategies are computed once (IndicatorPipeline), then the
+#signals of every strategy, each one only once even when voting strategies reuse them,
+#and every EvaluateStrategy gets its results (evaluator.results, profitable_symbols...)
+#as if its own backtest had been called.
+import numpy as np
+import pandas as pd
+
+from CandleFrame import CandleFrame
+from IndicatorPipeline import IndicatorPipeline
+
+
+def strategySignals(strategy, data):
+    #Buy price (or NaN) on every candle. Strategies without a .signals function are
+    #called candle by candle, on a CandleFrame when data is a df. Candles they raise an
+    #error on don't buy, the first error is printed with how many candles it happened on
+    try:
+        if hasattr(strategy, 'signals'):
+            return np.asarray(strategy.signals(data), dtype=np.float64)
+
+        frame = CandleFrame.fromDataFrame(data) if isinstance(data, pd.DataFrame) else data
+        signals = np.full(len(frame), np.nan)
+        errors, first_error = 0, None
+        for i in range(len(frame)):
+            try:
+                result = strategy(frame, i)
+            except Exception as e:
+                errors = errors + 1
+                first_error = first_error or e
+                continue
+            if result:
+                signals[i] = result
+
+        if errors > 0:
+            print(strategy.__name__ + ' raised an error on ' + str(errors) + ' candles, they were skipped')
+            print(first_error)
+        return signals
+    except Exception as e:
+        #Usually an indicator that couldn't be computed (not enough candles)
+        print('Error raised when computing the signals of ' + strategy.__name__)
+        print(e)
+        return np.full(np.shape(data['close']), np.nan)
+
+
+class VotingStrategy:
+    #Buys when enough of its strategies buy on the same candle
+    #Every strategy has a weight (1 by default). The vote passes when the weights of the
+    #strategies buying add up to min_votes, or to more than half of all the weights when
+    #min_votes isn't given. It buys at the lowest price of the strategies buying.
+    #
+    #   trend_vote = VotingStrategy([maCrossoverStrategy, ichimokuBull, macdMomentum], min_votes=2)
+
+    def __init__(self, strategies, min_votes=None, weights=None, name='voting'):
+        self.strategies = list(strategies)
+        self.weights = [1.0] * len(self.strategies) if weights is None else list(weights)
+        self.min_votes = min_votes
+        self.__name__ = name
+
+        if len(self.weights) != len(self.strategies):
+            raise ValueError('VotingStrategy needs one weight per strategy')
+
+    @property
+    def indicators(self):
+        specs = []
+        for strategy in self.strategies:
+            for spec in getattr(strategy, 'indicators', []):
+                if spec not in specs:
+                    specs.append(spec)
+        return specs
+
+    def _passes(self, votes):
+        if self.min_votes is None:
+            return votes * 2 > sum(self.weights)
+        return votes >= self.min_votes
+
+    def signals(self, data, member_signals=None):
+        #member_signals are the signals of self.strategies, if they were already computed
+        if member_signals is None:
+            member_signals = [strategySignals(strategy, data) for strategy in self.strategies]
+
+        member_signals = np.stack([np.asarray(signals, dtype=np.float64) for signals in member_signals])
+        buying = ~np.isnan(member_signals) & (member_signals != 0)
+        votes = np.tensordot(np.asarray(self.weights, dtype=np.float64), buying, axes=1)
+        price = np.min(np.where(buying, member_signals, np.inf), axis=0)
+        return np.where(self._passes(votes), price, np.nan)
+
+    def __call__(self, df, i:int):
+        votes = 0
+        price = None
+        for strategy, weight in zip(self.strategies, self.weights):
+            result = strategy(df, i)
+            if result:
+                votes = votes + weight
+                price = result if price is None else min(price, result)
+
+        if price is not None and self._passes(votes):
+            return price
+        return False
+
+    def __repr__(self):
+        return 'VotingStrategy(' + self.__name__ + ', ' + str([strategy.__name__ for strategy in self.strategies]) + ')'
+
+
+class MultiStrategyEvaluator:
+
+    def __init__(self, strategy_evaluators):
+        self.evaluators = list(strategy_evaluators)
+        #Indicators of every strategy (and of the members of voting strategies)
+        self.pipeline = IndicatorPipeline.forStrategies([evaluator.strategy for evaluator in self.evaluators])
+
+    def signals(self, df):
+        #Adds the indicators to df, returns the signals of each evaluator's strategy in order
+        self.pipeline.run(df)
+        computed = dict()
+        return [self._signals(evaluator.strategy, df, computed) for evaluator in self.evaluators]
+
+    def _signals(self, strategy, df, computed):
+        #computed holds the signals already computed, by strategy
+        key = id(strategy)
+        if key not in computed:
+            if isinstance(strategy, VotingStrategy):
+                members = [self._signals(member, df, computed) for member in strategy.strategies]
+                computed[key] = strategy.signals(df, members)
+            else:
+                computed[key] = strategySignals(strategy, df)
+        return computed[key]
+
+    def backtest(self, model, **options):
+        #Backtests every strategy on model, returns the resulting balances in the order
+        #of the evaluators. options are the ones of EvaluateStrategy.backtest
+        all_signals = self.signals(model.df)
+        return [evaluator.backtest(model, signals=signals, **options)
+            for evaluator, signals in zip(self.evaluators, all_signals)]
+
+    def evaluate(self, model):
+        #What each strategy says about the last candle (buy price or False), in order
+        all_signals = self.signals(model.df)
+        return [evaluator.evaluate(model, signals=signals)
+            for evaluator, signals in zip(self.evaluators, all_signals)]
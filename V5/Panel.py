@@ -0,0 +1,147 @@
+#Candles of many symbols aligned on the same times, as 2-D (time x symbol) float64 arrays
+#Indicators (IndicatorPipeline) and strategy signals (strategy.signals in Strategies.py)
+#are computed for all symbols at once instead of one TradeModel at a time.
+#
+#Symbols don't all have the same history (newer listings, delistings, missing candles):
+#before a symbol's first candle and after its last one everything is NaN, which the
+#indicators skip or propagate. Candles missing in between are filled with the previous
+#close (and no volume) so they don't break the averages, and `mask` marks the rows
+#that really came from the exchange. Signals are only given on those.
+#
+#   panel = Panel.fromExchange(exchange, exchange.GetTradingSymbols(['BTC']), '1h')
+#   panel.addIndicators(maCrossoverStrategy.indicators)
+#   buys = panel.lastSignals(maCrossoverStrategy)
+import asyncio
+from multiprocessing.pool import ThreadPool as Pool
+
+import numpy as np
+import pandas as pd
+
+from CandleFrame import CandleFrame
+from IndicatorPipeline import IndicatorPipeline, INDICATOR_GRAPHS
+from MultiStrategy import strategySignals
+
+
+class Panel:
+
+    COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, symbols, times, columns, mask, interval=None):
+        #symbols: list of N symbols, times: T candle open times (ms),
+        #columns: dict of name -> (T, N) arrays, mask: (T, N) bool array of real candles
+        self.symbols = list(symbols)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.columns = columns
+        self.mask = mask
+        self.interval = interval
+
+    def __getitem__(self, name):
+        if name == 'time':
+            return np.broadcast_to(self.times[:, None], self.mask.shape)
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.columns[name] = values
+
+    def __contains__(self, name):
+        return name == 'time' or name in self.columns
+
+    def __len__(self):
+        return len(self.times)
+
+    @staticmethod
+    def fromFrames(frames, interval=None):
+        #Builds a panel from a dict of symbol -> df (as returned by GetSymbolKlines)
+        symbols = list(frames.keys())
+        symbol_times = [np.asarray(frames[symbol]['time'], dtype=np.float64) for symbol in symbols]
+        times = np.unique(np.concatenate(symbol_times)) if len(symbols) > 0 else np.empty(0)
+
+        shape = (len(times), len(symbols))
+        mask = np.zeros(shape, dtype=bool)
+        columns = {name: np.full(shape, np.nan) for name in Panel.COLUMNS}
+
+        for col, symbol in enumerate(symbols):
+            rows = np.searchsorted(times, symbol_times[col])
+            mask[rows, col] = True
+            for name in Panel.COLUMNS:
+                columns[name][rows, col] = np.asarray(frames[symbol][name], dtype=np.float64)
+
+        Panel._fillGaps(columns, mask)
+        return Panel(symbols, times, columns, mask, interval)
+
+    @staticmethod
+    def fromExchange(exchange, symbols, interval, limit=1000):
+        #Gets the klines of all symbols (concurrently) and aligns them
+        get_all = getattr(exchange, 'GetSymbolKlinesOfSymbols', None)
+        if get_all is not None and asyncio.iscoroutinefunction(get_all):
+            frames = asyncio.run(exchange.GetSymbolKlinesOfSymbols(symbols, interval, limit))
+        else:
+            pool = Pool(getattr(exchange, 'pool_size', 4))
+            dfs = pool.map(lambda symbol: exchange.GetSymbolKlines(symbol, interval, limit), symbols)
+            pool.close()
+            pool.join()
+            frames = dict(zip(symbols, dfs))
+
+        frames = {symbol: df for symbol, df in frames.items() if df is not None and len(df) > 0}
+        return Panel.fromFrames(frames, interval)
+
+    @staticmethod
+    def _fillGaps(columns, mask):
+        #Fills the missing candles between a symbol's first and last ones with the previous close
+        rows = np.arange(mask.shape[0])[:, None]
+        last_real = np.maximum.accumulate(np.where(mask, rows, -1), axis=0)
+        listed = (last_real >= 0) & (rows <= np.max(np.where(mask, rows, -1), axis=0))
+        gaps = listed & ~mask
+        if not gaps.any():
+            return
+
+        previous_close = np.take_along_axis(columns['close'], np.maximum(last_real, 0), axis=0)
+        for name in ['open', 'high', 'low', 'close']:
+            columns[name][gaps] = previous_close[gaps]
+        columns['volume'][gaps] = 0
+
+    def addIndicators(self, specs):
+        #Adds the columns of the specs (see IndicatorPipeline) for every symbol at once
+        pipeline = specs if isinstance(specs, IndicatorPipeline) else IndicatorPipeline(specs)
+        self.columns.update(pipeline.compute(self))
+        return self
+
+    def signals(self, strategy):
+        #(T, N) array of buy prices, NaN where the strategy doesn't buy
+        self.addIndicators([spec for spec in getattr(strategy, 'indicators', []) if not self._hasColumns(spec)])
+        if hasattr(strategy, 'signals'):
+            signals = np.asarray(strategy.signals(self), dtype=np.float64)
+        else:
+            #Strategies without .signals are called candle by candle, one symbol at a time
+            signals = np.full(self.mask.shape, np.nan)
+            for col in range(len(self.symbols)):
+                listed = ~np.isnan(self.columns['close'][:, col])
+                frame = CandleFrame({name: values[listed, col] for name, values in self.columns.items()})
+                frame['time'] = self.times[listed]
+                signals[listed, col] = strategySignals(strategy, frame)
+        return np.where(self.mask, signals, np.nan)
+
+    def lastSignals(self, strategy):
+        #Buy prices on each symbol's latest candle, for the symbols the strategy buys
+        signals = self.signals(strategy)
+        rows = np.arange(len(self.times))[:, None]
+        last = np.max(np.where(self.mask, rows, -1), axis=0)
+
+        buys = dict()
+        for col, symbol in enumerate(self.symbols):
+            if last[col] >= 0 and not np.isnan(signals[last[col], col]):
+                buys[symbol] = float(signals[last[col], col])
+        return buys
+
+    def _hasColumns(self, spec):
+        graph = INDICATOR_GRAPHS[spec['indicator_name']](spec['col_name'], spec['args'])
+        return all(col in self.columns for col in graph)
+
+    def frame(self, symbol):
+        #The candles of one symbol as a df, like GetSymbolKlines (filled gaps included)
+        col = self.symbols.index(symbol)
+        listed = ~np.isnan(self.columns['close'][:, col])
+        df = pd.DataFrame({name: values[listed, col] for name, values in self.columns.items()})
+        df.insert(0, 'time', self.times[listed])
+        df['date'] = pd.to_datetime(df['time'] * 1000000)
+        return df
@@ -0,0 +1,158 @@
+#Backtests strategies on many symbols at once, spread over a process pool
+#
+#   frames = loadFrames(exchange, symbols, '1h')
+#   balances = ParallelBacktest(strategy_evaluators, processes=8).run(frames, '1h', options)
+#
+#The candles of all the symbols are written once to a memory mapped file (SharedCandles)
+#that every worker maps read only, instead of pickling a df to the workers for every
+#symbol. The OS keeps one copy of it in memory for all processes.
+#Each task backtests one symbol with every strategy (MultiStrategyEvaluator), and its
+#results are merged back into the evaluators (EvaluateStrategy.addResult) as they come in.
+import os
+import tempfile
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from CandleFrame import CandleFrame
+from EvaluateStrategy import EvaluateStrategy
+from Indicators import Indicators
+from MultiStrategy import MultiStrategyEvaluator
+
+
+def loadFrames(exchange, symbols, interval, limit=1000):
+    #Klines of every symbol (like TradeModel gets them), downloaded on a few threads
+    pool = ThreadPool(getattr(exchange, 'pool_size', 4))
+    dfs = pool.map(lambda symbol: exchange.GetSymbolKlines(symbol, interval, limit), symbols)
+    pool.close()
+    pool.join()
+    return {symbol: df for symbol, df in zip(symbols, dfs) if df is not None and len(df) > 0}
+
+
+class SharedCandles:
+    #Candle columns of many symbols, one after the other in a file mapped in memory.
+    #Pickling it only sends the path & layout, the process it's sent to maps the file itself
+
+    COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, path, layout, total, columns=COLUMNS):
+        #layout: symbol -> (first candle, number of candles) in the file
+        self.path = path
+        self.layout = layout
+        self.total = total
+        self.columns = list(columns)
+        self.data = None
+        if total > 0:
+            self.data = np.memmap(path, dtype=np.float64, mode='r', shape=(len(self.columns), total))
+
+    @staticmethod
+    def fromFrames(frames, columns=COLUMNS):
+        #frames: dict of symbol -> df (or anything with these columns, like a CandleFrame)
+        layout = dict()
+        total = 0
+        for symbol, df in frames.items():
+            layout[symbol] = (total, len(df))
+            total = total + len(df)
+
+        #in RAM when the system has a shared memory filesystem
+        shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, path = tempfile.mkstemp(suffix='.candles', dir=shm_dir)
+        os.close(fd)
+        if total > 0:
+            data = np.memmap(path, dtype=np.float64, mode='w+', shape=(len(columns), total))
+            for symbol, df in frames.items():
+                start, length = layout[symbol]
+                for row, name in enumerate(columns):
+                    data[row, start:start+length] = np.asarray(df[name], dtype=np.float64)
+            data.flush()
+            del data
+        return SharedCandles(path, layout, total, columns)
+
+    def frame(self, symbol):
+        #The candles of symbol as a CandleFrame, its columns are read only views of the file
+        start, length = self.layout[symbol]
+        return CandleFrame({name: self.data[row, start:start+length] for row, name in enumerate(self.columns)})
+
+    def close(self):
+        #Deletes the file, only the process that made it should call this
+        self.data = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getstate__(self):
+        return (self.path, self.layout, self.total, self.columns)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class CandleModel:
+    #What EvaluateStrategy needs from a TradeModel
+
+    def __init__(self, symbol, timeframe, df):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.df = df
+
+
+class ParallelBacktest:
+
+    def __init__(self, strategy_evaluators, processes=None):
+        #processes=None uses all cpus
+        self.evaluators = list(strategy_evaluators)
+        self.processes = processes
+
+    def run(self, frames, interval=None, options=dict(starting_balance = 100, initial_profits = 1.012,
+        initial_stop_loss = 0.9, incremental_profits = 1.006, incremental_stop_loss = 0.996)):
+        #Backtests every strategy on frames (dict of symbol -> df), returns a dict of
+        #symbol -> resulting balances of the evaluators (in order), in the order of frames
+        frames = {symbol: df for symbol, df in frames.items() if df is not None and len(df) > 0}
+        candles = SharedCandles.fromFrames(frames)
+        strategies = [evaluator.strategy for evaluator in self.evaluators]
+
+        balances = dict()
+        try:
+            pool = Pool(self.processes, initializer=_initWorker, initargs=(candles, strategies, interval))
+            try:
+                tasks = [(symbol, options) for symbol in frames]
+                chunksize = max(1, len(tasks) // (4 * (self.processes or os.cpu_count() or 1)))
+                for symbol, results in pool.imap_unordered(_backtestSymbol, tasks, chunksize):
+                    if results is None:
+                        continue
+                    for evaluator, (resulting_balance, result) in zip(self.evaluators, results):
+                        evaluator.addResult(symbol, options['starting_balance'], resulting_balance, result)
+                    balances[symbol] = [resulting_balance for resulting_balance, result in results]
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            candles.close()
+
+        return {symbol: balances[symbol] for symbol in frames if symbol in balances}
+
+
+#Candles & strategies of each worker process, set once when it starts
+_worker_candles = None
+_worker_strategies = None
+_worker_interval = None
+
+def _initWorker(candles, strategies, interval):
+    global _worker_candles, _worker_strategies, _worker_interval
+    _worker_candles = candles
+    _worker_strategies = strategies
+    _worker_interval = interval
+
+def _backtestSymbol(task):
+    #Backtests one symbol with every strategy, returns its balance & results for each one
+    symbol, options = task
+    try:
+        model = CandleModel(symbol, _worker_interval, _worker_candles.frame(symbol))
+        Indicators.describe(model.df, symbol, _worker_interval)
+        evaluators = [EvaluateStrategy(strategy) for strategy in _worker_strategies]
+        balances = MultiStrategyEvaluator(evaluators).backtest(model, **options)
+        return symbol, [(resulting_balance, evaluator.results[symbol]) for resulting_balance, evaluator in zip(balances, evaluators)]
+    except Exception as e:
+        print('Error raised when backtesting ' + symbol)
+        print(e)
+        return symbol, None
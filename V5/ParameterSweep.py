@@ -0,0 +1,202 @@
+#Backtests strategies over grids of parameters on many symbols, on a process pool
+#
+#   sweep = ParameterSweep([bollStrategy, macdMomentum],
+#       grid = dict(initial_profits=[1.01, 1.02, 1.04], initial_stop_loss=np.arange(0.85, 0.99, 0.02)),
+#       strategy_grids = dict(macdMomentum=dict(max_rsi=[60, 70, 80])))
+#   table = sweep.run(symbols, '1h', processes=4, time_budget=600)
+#   print(ParameterSweep.summary(table).head(20))
+#
+#grid has the values to try for the exit parameters of EvaluateStrategy.backtest (any
+#list, range or numpy array), the ones left out keep their value in options.
+#strategy_grids adds / replaces values for one strategy (by name), including the Params
+#of strategies written as rules (see Rules.py). Every combination is backtested on
+#every symbol.
+#
+#Candles are downloaded before the workers start (ParallelBacktest.loadFrames), so the
+#API weight limit is only spent by one process. Each symbol is then one task: the worker
+#computes the indicators of every strategy once, the signals once per strategy (and
+#Param values), then runs BacktestEngine.backtest for all the exit parameters on them.
+import itertools
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import BacktestEngine
+from EvaluateStrategy import EvaluateStrategy
+from Indicators import Indicators
+from IndicatorPipeline import IndicatorPipeline
+from ParallelBacktest import loadFrames
+
+
+EXIT_PARAMETERS = ['initial_profits', 'initial_stop_loss', 'incremental_profits', 'incremental_stop_loss']
+RESULT_COLUMNS = ['returns', 'trades', 'open_trade', 'resulting_balance']
+
+#The options TradeBot.BackTestStrategies uses
+DEFAULT_OPTIONS = dict(starting_balance = 100, initial_profits = 1.012, initial_stop_loss = 0.9,
+    incremental_profits = 1.006, incremental_stop_loss = 0.996)
+
+
+def _product(grid):
+    #Every combination of the values in grid, as dicts
+    names = list(grid.keys())
+    values = [[value.item() if isinstance(value, np.generic) else value for value in grid[name]] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+class ParameterSweep:
+
+    def __init__(self, strategies, grid=None, strategy_grids=None, options=DEFAULT_OPTIONS):
+        self.strategies = list(strategies)
+        self.grid = dict(grid or {})
+        self.strategy_grids = dict(strategy_grids or {})
+        self.options = dict(options)
+
+        for strategy in self.strategies:
+            unknown = [name for name in self.strategyGrid(strategy) if name not in EXIT_PARAMETERS and
+                name not in getattr(strategy, 'parameters', lambda: {})()]
+            if len(unknown) > 0:
+                raise ValueError(strategy.__name__ + " doesn't have the parameters " + str(unknown))
+
+    def strategyGrid(self, strategy):
+        return dict(self.grid, **self.strategy_grids.get(strategy.__name__, {}))
+
+    def combinations(self, strategy):
+        #(strategy params, exit params) combinations of strategy, as two lists of dicts
+        grid = self.strategyGrid(strategy)
+        strategy_grid = {name: values for name, values in grid.items() if name not in EXIT_PARAMETERS}
+        exit_grid = {name: values for name, values in grid.items() if name in EXIT_PARAMETERS}
+        return _product(strategy_grid), _product(exit_grid)
+
+    def size(self):
+        #Number of backtests per symbol
+        total = 0
+        for strategy in self.strategies:
+            strategy_params, exit_params = self.combinations(strategy)
+            total = total + len(strategy_params) * len(exit_params)
+        return total
+
+    def variants(self):
+        #(strategy, strategy params, strategy with those params, exit params) of every
+        #strategy params combination
+        variants = []
+        for strategy in self.strategies:
+            strategy_params, exit_params = self.combinations(strategy)
+            for params in strategy_params:
+                variants.append((strategy, params, strategy.bind(**params) if len(params) > 0 else strategy, exit_params))
+        return variants
+
+    def sweepSymbol(self, symbol, df, deadline=None):
+        #Rows of the table for one symbol, stops early once time.time() passes deadline
+        rows = []
+        if df is None or len(df) < 2:
+            return rows
+
+        #Indicators of every variant at once (a Param can change an indicator's args)
+        variants = self.variants()
+        IndicatorPipeline.forStrategies([variant for strategy, params, variant, exit_params in variants]).run(df)
+        lows = df['low'].to_numpy(dtype=np.float64)
+        highs = df['high'].to_numpy(dtype=np.float64)
+        starting_balance = self.options['starting_balance']
+
+        for strategy, params, variant, exit_params in variants:
+            signals = EvaluateStrategy(variant).signals(df)
+            for exits in exit_params:
+                if deadline is not None and time.time() > deadline:
+                    return rows
+                options = dict(self.options, **exits)
+                buys, sells, resulting_balance = BacktestEngine.backtest(signals, lows, highs, **options)
+                row = dict(strategy = strategy.__name__, symbol = symbol)
+                row.update(params)
+                row.update({name: options[name] for name in EXIT_PARAMETERS})
+                row.update(
+                    returns = 100 * (resulting_balance / starting_balance - 1),
+                    trades = len(sells),
+                    open_trade = len(buys) > len(sells),
+                    resulting_balance = resulting_balance)
+                rows.append(row)
+        return rows
+
+    def run(self, symbols, interval='1h', processes=None, time_budget=None, frames=None, exchange=None,
+        cache_dir='klines', limit=1000):
+        #Sweeps every symbol, returns a DataFrame with a row per backtest
+        #Candles come from frames (dict of symbol -> df) if given, else they're downloaded
+        #here with exchange (a Binance(cache_dir=cache_dir) by default) before the workers start.
+        #processes=1 runs everything here, None uses all cpus. Once time_budget (seconds)
+        #is spent, the backtests done so far are returned.
+        start = time.time()
+        deadline = None if time_budget is None else start + time_budget
+        if frames is None:
+            if exchange is None:
+                from Binance import Binance
+                exchange = Binance(cache_dir=cache_dir)
+            frames = loadFrames(exchange, symbols, interval, limit)
+        tasks = [(symbol, interval, frames[symbol], deadline) for symbol in symbols if symbol in frames]
+        print('Sweeping ' + str(self.size()) + ' parameter combinations on ' + str(len(tasks)) + ' symbols')
+
+        rows = []
+        if processes == 1:
+            _initWorker(self)
+            results = map(_sweepTask, tasks)
+            pool = None
+        else:
+            pool = Pool(processes, initializer=_initWorker, initargs=(self,))
+            results = pool.imap_unordered(_sweepTask, tasks)
+
+        try:
+            for done, symbol_rows in enumerate(results, 1):
+                rows.extend(symbol_rows)
+                elapsed = time.time() - start
+                print('[{}/{} symbols] {} backtests, {:.1f}s elapsed, ~{:.0f}s left'.format(
+                    done, len(tasks), len(rows), elapsed, elapsed / done * (len(tasks) - done)))
+                if deadline is not None and time.time() > deadline:
+                    print('Time budget spent, stopping the sweep')
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        #strategy, symbol, strategy params, exit params, then the results
+        table = pd.DataFrame(rows)
+        if len(table) == 0:
+            return table
+        params = [name for name in table.columns if name not in ['strategy', 'symbol'] + EXIT_PARAMETERS + RESULT_COLUMNS]
+        return table[['strategy', 'symbol'] + params + EXIT_PARAMETERS + RESULT_COLUMNS]
+
+    @staticmethod
+    def summary(table):
+        #One row per strategy & parameters over all the symbols, best mean returns first
+        if len(table) == 0:
+            return table
+        keys = [name for name in table.columns if name not in ['symbol'] + RESULT_COLUMNS]
+        grouped = table.groupby(keys, dropna=False)
+        summary = pd.DataFrame(dict(
+            mean_returns = grouped['returns'].mean(),
+            median_returns = grouped['returns'].median(),
+            profitable_symbols = grouped['returns'].apply(lambda returns: int((returns > 0).sum())),
+            unprofitable_symbols = grouped['returns'].apply(lambda returns: int((returns < 0).sum())),
+            trades = grouped['trades'].sum()))
+        return summary.sort_values('mean_returns', ascending=False).reset_index()
+
+
+#The sweep each worker process runs, set once when the process starts
+_worker_sweep = None
+
+def _initWorker(sweep):
+    global _worker_sweep
+    _worker_sweep = sweep
+
+def _sweepTask(task):
+    symbol, interval, df, deadline = task
+    if deadline is not None and time.time() > deadline:
+        return []
+    try:
+        df = df.copy()
+        Indicators.describe(df, symbol, interval)
+        return _worker_sweep.sweepSymbol(symbol, df, deadline)
+    except Exception as e:
+        print('Error raised when sweeping ' + symbol)
+        print(e)
+        return []
@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+# Keeps track of how much of the Binance request weight / order count we used,
+# and makes requests wait for their turn before we get a 429 (or worse, a 418 ban).
+# Orders and cancels have a higher priority than account / market data requests,
+# so a backtest downloading klines never delays placing an order.
+
+class RequestScheduler:
+
+	PRIORITY_ORDER = 0
+	PRIORITY_ACCOUNT = 1
+	PRIORITY_MARKET_DATA = 2
+
+	# Request weight of each endpoint (keys are the same as Binance.endpoints).
+	# Placing / cancelling an order costs 1, querying one costs the weight below.
+	ENDPOINT_WEIGHTS = {
+		"order": 4,
+		"testOrder": 1,
+		"allOrders": 20,
+		"klines": 2,
+		"exchangeInfo": 20,
+		"24hrTicker" : 2,
+		"averagePrice" : 2,
+		"orderBook" : 5,
+		"account" : 20
+	}
+
+	ENDPOINT_PRIORITIES = {
+		"order": PRIORITY_ORDER,
+		"testOrder": PRIORITY_ORDER,
+		"allOrders": PRIORITY_ACCOUNT,
+		"account": PRIORITY_ACCOUNT
+	}
+
+	def __init__(self, weight_limit:int=6000, order_limit_10s:int=50, order_limit_1d:int=160000,
+		order_reserve:int=50, safety:float=0.9):
+		'''
+		Parameters
+		--
+			weight_limit int:      Request weight allowed per minute
+			order_limit_10s int:   Orders allowed per 10 seconds
+			order_limit_1d int:    Orders allowed per day
+			order_reserve int:     Weight kept free for orders, other requests can't use it
+			safety float:          Fraction of the limits we allow ourselves to use
+		'''
+		self.weight_limit = int(weight_limit * safety)
+		self.order_limit_10s = int(order_limit_10s * safety)
+		self.order_limit_1d = int(order_limit_1d * safety)
+		self.order_reserve = order_reserve
+
+		self.condition = threading.Condition()
+		self.queue = []
+		self.counter = itertools.count()
+
+		self.weight_window = 0
+		self.used_weight = 0
+		self.order_window_10s = 0
+		self.order_count_10s = 0
+		self.order_window_1d = 0
+		self.order_count_1d = 0
+		self.blocked_until = 0
+
+	@classmethod
+	def KlinesWeight(cls, limit:int=500) -> int:
+		''' Weight of a klines request depends on how many candles we ask for '''
+		if limit <= 100:
+			return 1
+		if limit <= 500:
+			return 2
+		if limit <= 1000:
+			return 5
+		return 10
+
+	def Weight(self, endpoint:str, method:str='GET', limit:int=None) -> int:
+		if endpoint == 'order' and method != 'GET':
+			return 1
+		if endpoint == 'klines' and limit != None:
+			return self.KlinesWeight(limit)
+		return self.ENDPOINT_WEIGHTS.get(endpoint, 1)
+
+	def Priority(self, endpoint:str, method:str='GET') -> int:
+		if endpoint == 'order' and method == 'GET':
+			return self.PRIORITY_ACCOUNT
+		return self.ENDPOINT_PRIORITIES.get(endpoint, self.PRIORITY_MARKET_DATA)
+
+	# longest an AcquireAsync waiter sleeps before checking the queue again
+	ASYNC_POLL = 0.05
+
+	def Acquire(self, endpoint:str, method:str='GET', weight:int=None, priority:int=None):
+		''' Blocks until the request can be sent without going over the limits,
+		and books its weight (and order count, for new orders) '''
+
+		if weight == None:
+			weight = self.Weight(endpoint, method)
+		if priority == None:
+			priority = self.Priority(endpoint, method)
+		is_order = endpoint == 'order' and method == 'POST'
+
+		with self.condition:
+			ticket = (priority, next(self.counter))
+			heapq.heappush(self.queue, ticket)
+			while True:
+				wait = self._Wait(weight, priority, is_order) if self.queue[0] == ticket else None
+				if wait == 0:
+					break
+				self.condition.wait(timeout=wait)
+			self._Book(weight, is_order)
+
+	async def AcquireAsync(self, endpoint:str, method:str='GET', weight:int=None, priority:int=None):
+		''' Acquire for coroutines: waits its turn with asyncio.sleep, so waiting
+		requests don't hold a thread each. Shares the queue with Acquire '''
+
+		if weight == None:
+			weight = self.Weight(endpoint, method)
+		if priority == None:
+			priority = self.Priority(endpoint, method)
+		is_order = endpoint == 'order' and method == 'POST'
+
+		with self.condition:
+			ticket = (priority, next(self.counter))
+			heapq.heappush(self.queue, ticket)
+		try:
+			while True:
+				with self.condition:
+					wait = self._Wait(weight, priority, is_order) if self.queue[0] == ticket else None
+					if wait == 0:
+						self._Book(weight, is_order)
+						return
+				# there's no condition to wait on in the event loop, check again soon
+				await asyncio.sleep(self.ASYNC_POLL if wait == None else min(wait, 1))
+		except BaseException:
+			# cancelled while waiting, give our place in the queue up
+			with self.condition:
+				if ticket in self.queue:
+					self.queue.remove(ticket)
+					heapq.heapify(self.queue)
+				self.condition.notify_all()
+			raise
+
+	def _Book(self, weight:int, is_order:bool):
+		''' Takes the first ticket off the queue and counts its request, condition must be held '''
+		heapq.heappop(self.queue)
+		self.used_weight = self.used_weight + weight
+		if is_order:
+			self.order_count_10s = self.order_count_10s + 1
+			self.order_count_1d = self.order_count_1d + 1
+		self.condition.notify_all()
+
+	def Update(self, status_code:int, headers):
+		''' Updates the counters from the X-MBX-* headers of a response, and
+		stops all requests for a while if we got rate limited '''
+
+		with self.condition:
+			self._ResetWindows(time.time())
+			for key, value in headers.items():
+				key = key.lower()
+				if key == 'x-mbx-used-weight-1m':
+					self.used_weight = max(self.used_weight, int(value))
+				elif key == 'x-mbx-order-count-10s':
+					self.order_count_10s = max(self.order_count_10s, int(value))
+				elif key == 'x-mbx-order-count-1d':
+					self.order_count_1d = max(self.order_count_1d, int(value))
+
+			if status_code in (418, 429):
+				retry_after = headers.get('Retry-After', None)
+				retry_after = int(retry_after) if retry_after != None else 60
+				self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+			self.condition.notify_all()
+
+	def UsedWeight(self) -> int:
+		with self.condition:
+			self._ResetWindows(time.time())
+			return self.used_weight
+
+	def _ResetWindows(self, now:float):
+		''' Binance counts weight per minute and orders per 10s / per day '''
+		minute = int(now // 60)
+		if minute != self.weight_window:
+			self.weight_window = minute
+			self.used_weight = 0
+		ten_seconds = int(now // 10)
+		if ten_seconds != self.order_window_10s:
+			self.order_window_10s = ten_seconds
+			self.order_count_10s = 0
+		day = int(now // 86400)
+		if day != self.order_window_1d:
+			self.order_window_1d = day
+			self.order_count_1d = 0
+
+	def _Wait(self, weight:int, priority:int, is_order:bool) -> float:
+		''' Returns 0 if the request can go now, otherwise how long to wait before checking again '''
+		now = time.time()
+		self._ResetWindows(now)
+
+		if now < self.blocked_until:
+			return self.blocked_until - now
+
+		limit = self.weight_limit
+		if priority != self.PRIORITY_ORDER:
+			limit = limit - self.order_reserve
+		if self.used_weight + weight > limit:
+			return 60 - now % 60
+
+		if is_order:
+			if self.order_count_1d >= self.order_limit_1d:
+				return 86400 - now % 86400
+			if self.order_count_10s >= self.order_limit_10s:
+				return 10 - now % 10
+
+		return 0
+
+
+# One scheduler for the whole process, since Binance counts weight per IP
+shared_scheduler = RequestScheduler()
@@ -0,0 +1,294 @@
+#Keeps backtest results in a sqlite database, so they're only computed once
+#
+#   store = ResultStore('results.db')
+#   BackTestStrategies(symbols, '1h', strategy_evaluators=strategy_evaluators, store=store)
+#   print(store.query(strategy='ichimoku_bullish', min_returns=0).head(20))
+#
+#Every result is keyed by a hash of what it depends on: the strategy (see strategySource),
+#the code every strategy shares (ENGINE_HASH: every module a backtest runs through), the
+#symbol & interval, the candles themselves and the options of the backtest.
+#A strategy, symbol & options that were already backtested on the same candles are read
+#from the store instead of being backtested again, so after changing one strategy only
+#that one is computed again, and after changing the shared code everything is.
+#Helpers in Strategies.py that a strategy calls aren't part of its hash, forget(strategy)
+#drops its results after changing them.
+import hashlib
+import importlib
+import inspect
+import json
+import sqlite3
+import time
+from decimal import Decimal, getcontext
+
+import numpy as np
+import pandas as pd
+
+from MultiStrategy import MultiStrategyEvaluator, VotingStrategy
+from ParallelBacktest import ParallelBacktest
+
+
+#Candle columns that go into the hash of the candles
+CANDLE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume']
+
+#Columns of query's table, in order
+QUERY_COLUMNS = ['strategy', 'symbol', 'interval', 'first_time', 'last_time', 'candles', 'options',
+    'starting_balance', 'resulting_balance', 'returns', 'trades', 'created']
+
+
+def _describe(value):
+    #Text that changes when value (a strategy or a part of one) does
+    if inspect.isfunction(value) or inspect.ismethod(value):
+        try:
+            return inspect.getsource(value)
+        except (OSError, TypeError):
+            return value.__module__ + '.' + value.__qualname__
+    if isinstance(value, np.ufunc):
+        return repr(value)
+    if isinstance(value, dict):
+        return '{' + ', '.join(repr(key) + ': ' + _describe(item) for key, item in sorted(value.items(), key=lambda item: repr(item[0]))) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_describe(item) for item in value) + ']'
+    if hasattr(value, '__dict__') and not inspect.isclass(value) and not inspect.ismodule(value):
+        #Rules, Params, Indicators... by class & attributes
+        return type(value).__name__ + _describe(vars(value))
+    return repr(value)
+
+
+def strategySource(strategy):
+    #What a strategy's results depend on: the source of a strategy function, its signals
+    #function & its indicators, or the conditions & params of a Rule, or the members,
+    #weights & votes of a VotingStrategy
+    if isinstance(strategy, VotingStrategy):
+        return _describe(dict(voting = [strategySource(member) for member in strategy.strategies],
+            weights = strategy.weights, min_votes = strategy.min_votes))
+    if inspect.isfunction(strategy):
+        return _describe(dict(function = strategy, signals = getattr(strategy, 'signals', None),
+            indicators = getattr(strategy, 'indicators', None)))
+    return _describe(strategy)
+
+
+def strategyHash(strategy):
+    return hashlib.sha256(strategySource(strategy).encode()).hexdigest()
+
+
+def candlesHash(df):
+    #Hash of the candles of df, the same for a df and a CandleFrame of the same candles
+    digest = hashlib.sha256()
+    for name in CANDLE_COLUMNS:
+        if name in df:
+            digest.update(name.encode())
+            digest.update(np.ascontiguousarray(np.asarray(df[name], dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+#The modules a backtest runs through: how candles are held, how indicators are computed
+#(and cached), what rules mean, how signals are found (vectorized, per candle or by vote),
+#and how they're traded
+ENGINE_MODULES = [
+    'BacktestEngine',
+    'CandleFrame',
+    'EvaluateStrategy',
+    'IndicatorCache',
+    'IndicatorPipeline',
+    'Indicators',
+    'MultiStrategy',
+    'ParallelBacktest',
+    'Rules']
+
+#Changes to any of them make every stored result stale
+ENGINE_HASH = hashlib.sha256(''.join(inspect.getsource(importlib.import_module(name))
+    for name in ENGINE_MODULES).encode()).hexdigest()
+
+
+def _jsonTimes(times):
+    #buy_times / sell_times ([[time, Decimal price]...]) as json, prices as strings to keep them exact
+    return json.dumps([[int(candle_time), str(price)] for candle_time, price in times])
+
+
+def _decimalTimes(text):
+    return [[candle_time, Decimal(price)] for candle_time, price in json.loads(text)]
+
+
+class ResultStore:
+
+    def __init__(self, name='results.db'):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.initialise()
+
+    def connect(self):
+        conn = sqlite3.connect(self.name)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def initialise(self):
+        conn = self.connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS results (' +
+            'key TEXT PRIMARY KEY, ' +
+            'strategy TEXT, ' +
+            'strategy_hash TEXT, ' +
+            'symbol TEXT, ' +
+            'interval TEXT, ' +
+            'first_time INTEGER, ' +
+            'last_time INTEGER, ' +
+            'candles INTEGER, ' +
+            'options TEXT, ' +
+            'starting_balance REAL, ' +
+            'resulting_balance TEXT, ' +
+            'returns REAL, ' +
+            'trades INTEGER, ' +
+            'buy_times TEXT, ' +
+            'sell_times TEXT, ' +
+            'created INTEGER)')
+        conn.execute('CREATE INDEX IF NOT EXISTS results_strategy ON results (strategy, strategy_hash)')
+        conn.execute('CREATE INDEX IF NOT EXISTS results_symbol ON results (symbol, interval)')
+        conn.execute('CREATE INDEX IF NOT EXISTS results_returns ON results (returns)')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def key(strategy_hash, symbol, interval, candles_hash, options):
+        return hashlib.sha256(json.dumps(dict(
+            strategy = strategy_hash,
+            engine = ENGINE_HASH,
+            symbol = symbol,
+            interval = interval,
+            candles = candles_hash,
+            options = {name: float(value) for name, value in options.items()}), sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        #(resulting balance, result) stored under key, None if there's none
+        conn = self.connect()
+        row = conn.execute('SELECT resulting_balance, returns, buy_times, sell_times FROM results WHERE key = ?', (key,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        getcontext().prec = 30
+        resulting_balance = Decimal(row['resulting_balance'])
+        return resulting_balance, dict(
+            returns = round(Decimal(row['returns']), 3),
+            buy_times = _decimalTimes(row['buy_times']),
+            sell_times = _decimalTimes(row['sell_times']))
+
+    def put(self, key, strategy, strategy_hash, symbol, interval, df, options, resulting_balance, result):
+        #Saves the result of an EvaluateStrategy.backtest under key
+        times = np.asarray(df['time'])
+        conn = self.connect()
+        conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            key, strategy.__name__, strategy_hash, symbol, interval,
+            int(times[0]) if len(times) > 0 else None,
+            int(times[-1]) if len(times) > 0 else None,
+            len(times),
+            json.dumps(options, sort_keys=True),
+            float(options['starting_balance']),
+            str(resulting_balance),
+            float(result['returns']),
+            len(result['sell_times']),
+            _jsonTimes(result['buy_times']),
+            _jsonTimes(result['sell_times']),
+            int(time.time())))
+        conn.commit()
+        conn.close()
+
+    def backtest(self, strategy_evaluators, model, **options):
+        #Like MultiStrategyEvaluator.backtest: the resulting balances of the evaluators on
+        #model, in order. Only the strategies the store has no result for are backtested
+        return self._backtest(strategy_evaluators, {model.symbol: model.df}, model.timeframe, options,
+            lambda missing, symbols: {model.symbol: MultiStrategyEvaluator(missing).backtest(model, **options)})[model.symbol]
+
+    def backtestFrames(self, strategy_evaluators, frames, interval, options, processes=None):
+        #Like ParallelBacktest.run: {symbol: resulting balances} of frames (dict of symbol -> df)
+        frames = {symbol: df for symbol, df in frames.items() if df is not None and len(df) > 0}
+        return self._backtest(strategy_evaluators, frames, interval, options,
+            lambda missing, symbols: ParallelBacktest(missing, processes).run(
+                {symbol: frames[symbol] for symbol in symbols}, interval, options))
+
+    def _backtest(self, strategy_evaluators, frames, interval, options, run):
+        #run(missing evaluators, symbols) backtests them on those symbols, adds their results to
+        #them (like EvaluateStrategy.backtest does) and returns {symbol: resulting balances}
+        evaluators = list(strategy_evaluators)
+        hashes = [strategyHash(evaluator.strategy) for evaluator in evaluators]
+        balances = {symbol: [None] * len(evaluators) for symbol in frames}
+
+        #Symbols missing the same strategies are backtested together
+        missing = dict()
+        keys = dict()
+        for symbol, df in frames.items():
+            candles_hash = candlesHash(df)
+            absent = []
+            for number, (evaluator, strategy_hash) in enumerate(zip(evaluators, hashes)):
+                key = self.key(strategy_hash, symbol, interval, candles_hash, options)
+                keys[(symbol, number)] = key
+                stored = self.get(key)
+                if stored is None:
+                    absent.append(number)
+                    continue
+                self.hits = self.hits + 1
+                resulting_balance, result = stored
+                evaluator.addResult(symbol, options['starting_balance'], resulting_balance, result)
+                balances[symbol][number] = resulting_balance
+            if len(absent) > 0:
+                missing.setdefault(tuple(absent), []).append(symbol)
+
+        for numbers, symbols in missing.items():
+            missing_evaluators = [evaluators[number] for number in numbers]
+            for symbol, resulting_balances in run(missing_evaluators, symbols).items():
+                for number, resulting_balance in zip(numbers, resulting_balances):
+                    evaluator = evaluators[number]
+                    self.misses = self.misses + 1
+                    self.put(keys[(symbol, number)], evaluator.strategy, hashes[number], symbol, interval,
+                        frames[symbol], options, resulting_balance, evaluator.results[symbol])
+                    balances[symbol][number] = resulting_balance
+
+        #Symbols that couldn't be backtested are left out, like ParallelBacktest does
+        return {symbol: symbol_balances for symbol, symbol_balances in balances.items() if None not in symbol_balances}
+
+    def query(self, strategy=None, symbol=None, interval=None, min_returns=None, max_returns=None, limit=None):
+        #Stored results as a DataFrame, best returns first. strategy is a name, or a strategy
+        #to only get the results of its current version
+        conditions, values = [], []
+        if strategy is not None:
+            if isinstance(strategy, str):
+                conditions.append('strategy = ?')
+                values.append(strategy)
+            else:
+                conditions.append('strategy_hash = ?')
+                values.append(strategyHash(strategy))
+        if symbol is not None:
+            conditions.append('symbol = ?')
+            values.append(symbol)
+        if interval is not None:
+            conditions.append('interval = ?')
+            values.append(interval)
+        if min_returns is not None:
+            conditions.append('returns >= ?')
+            values.append(min_returns)
+        if max_returns is not None:
+            conditions.append('returns <= ?')
+            values.append(max_returns)
+
+        sql = 'SELECT ' + ', '.join(QUERY_COLUMNS) + ' FROM results'
+        if len(conditions) > 0:
+            sql = sql + ' WHERE ' + ' and '.join(conditions)
+        sql = sql + ' ORDER BY returns DESC'
+        if limit is not None:
+            sql = sql + ' LIMIT ' + str(int(limit))
+
+        conn = self.connect()
+        rows = [dict(row) for row in conn.execute(sql, values).fetchall()]
+        conn.close()
+        table = pd.DataFrame(rows, columns=QUERY_COLUMNS)
+        table['resulting_balance'] = table['resulting_balance'].astype(float)
+        return table
+
+    def forget(self, strategy=None):
+        #Deletes the results of strategy (a name or a strategy, all its versions), or all of them
+        conn = self.connect()
+        if strategy is None:
+            conn.execute('DELETE FROM results')
+        else:
+            name = strategy if isinstance(strategy, str) else strategy.__name__
+            conn.execute('DELETE FROM results WHERE strategy = ?', (name,))
+        conn.commit()
+        conn.close()
@@ -0,0 +1,422 @@
+#A small language to write strategies as rules instead of functions
+#
+#   rule = Rule(crossesAbove(EMA(50), EMA(200)) & (RSI(14) < Param('max_rsi', 70)), name='ema_rsi')
+#
+#A Rule works everywhere a strategy function does (strategies_dict, EvaluateStrategy,
+#BotRunner...): it lists the indicators it uses in .indicators (found from the rule),
+#gives the buy price of every candle at once with .signals(data) (1-D df or 2-D Panel),
+#and rule(df, i) only checks candle i (and i-1 for crossovers), which is what the live
+#bot needs when a candle closes.
+#Param values can be changed with rule.bind(max_rsi=60), e.g. for parameter sweeps.
+#
+#Conditions combine with & (and), | (or) and ~ (not). Python's & binds tighter than
+#comparisons, so put parentheses around them: (RSI(14) < 30) & (Col('close') > VWAP(20))
+import numpy as np
+
+from Indicators import Indicators, shift
+
+
+def _resolve(value, params):
+    #Replaces Params in value (a number, a Param or a tuple of them) by their values
+    if isinstance(value, Param):
+        return params.get(value.name, value.default)
+    if isinstance(value, tuple):
+        return tuple(_resolve(item, params) for item in value)
+    return value
+
+
+def _expression(value):
+    return value if isinstance(value, Expression) else Constant(value)
+
+
+class Expression:
+    #A value on every candle: array(data, params) for all candles, at(data, i, params) for one
+
+    def array(self, data, params):
+        raise NotImplementedError
+
+    def at(self, data, i, params):
+        raise NotImplementedError
+
+    def indicators(self, params):
+        return []
+
+    def __add__(self, other):
+        return Operation(np.add, self, other)
+
+    def __radd__(self, other):
+        return Operation(np.add, other, self)
+
+    def __sub__(self, other):
+        return Operation(np.subtract, self, other)
+
+    def __rsub__(self, other):
+        return Operation(np.subtract, other, self)
+
+    def __mul__(self, other):
+        return Operation(np.multiply, self, other)
+
+    def __rmul__(self, other):
+        return Operation(np.multiply, other, self)
+
+    def __truediv__(self, other):
+        return Operation(np.divide, self, other)
+
+    def __rtruediv__(self, other):
+        return Operation(np.divide, other, self)
+
+    def __gt__(self, other):
+        return Comparison(np.greater, self, other)
+
+    def __ge__(self, other):
+        return Comparison(np.greater_equal, self, other)
+
+    def __lt__(self, other):
+        return Comparison(np.less, self, other)
+
+    def __le__(self, other):
+        return Comparison(np.less_equal, self, other)
+
+
+class Constant(Expression):
+
+    def __init__(self, value):
+        self.value = value
+
+    def array(self, data, params):
+        return self.value
+
+    def at(self, data, i, params):
+        return self.value
+
+
+class Param(Expression):
+    #A number that can be changed without rewriting the rule
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+
+    def array(self, data, params):
+        return params.get(self.name, self.default)
+
+    def at(self, data, i, params):
+        return params.get(self.name, self.default)
+
+
+class Col(Expression):
+    #A column of the candles (close, high, volume...)
+
+    def __init__(self, name):
+        self.name = name
+
+    def array(self, data, params):
+        return np.asarray(data[self.name], dtype=np.float64)
+
+    def at(self, data, i, params):
+        return data[self.name][i]
+
+
+class Ind(Col):
+    #A column of an indicator in Indicators.INDICATORS_DICT, computed automatically
+    #col_name defaults to the indicator name & args (ema_50), column is the column to read
+    #when the indicator adds more than one (ichimoku, macd)
+
+    def __init__(self, indicator_name, args=None, col_name=None, column=None):
+        self.indicator_name = indicator_name
+        self.args = args
+        self.col_name = col_name
+        self.column = column
+
+    def spec(self, params):
+        args = _resolve(self.args, params)
+        col_name = self.col_name
+        if col_name is None and self.indicator_name != 'ichimoku':
+            col_name = '_'.join([self.indicator_name] + [str(arg) for arg in np.atleast_1d(args)])
+        return dict(indicator_name=self.indicator_name, col_name=col_name, args=args)
+
+    def name(self, params):
+        return self.column or self.spec(params)['col_name']
+
+    def array(self, data, params):
+        return np.asarray(data[self.name(params)], dtype=np.float64)
+
+    def at(self, data, i, params):
+        return data[self.name(params)][i]
+
+    def indicators(self, params):
+        return [self.spec(params)]
+
+
+class Operation(Expression):
+
+    def __init__(self, function, a, b):
+        self.function = function
+        self.a = _expression(a)
+        self.b = _expression(b)
+
+    def array(self, data, params):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.function(self.a.array(data, params), self.b.array(data, params))
+
+    def at(self, data, i, params):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.function(self.a.at(data, i, params), self.b.at(data, i, params))
+
+    def indicators(self, params):
+        return self.a.indicators(params) + self.b.indicators(params)
+
+
+def minimum(a, b):
+    return Operation(np.minimum, a, b)
+
+
+def maximum(a, b):
+    return Operation(np.maximum, a, b)
+
+
+def _valid(*values):
+    #False where any of values (arrays or numbers) is NaN
+    valid = True
+    for value in values:
+        valid = valid & ~np.isnan(np.asarray(value, dtype=np.float64))
+    return valid
+
+
+class Condition:
+    #True / False on every candle, NaNs (indicators warming up) are False
+    #valid / validAt tell where none of the values a condition looked at were NaN, so
+    #Not can stay False there too
+
+    def array(self, data, params):
+        raise NotImplementedError
+
+    def at(self, data, i, params):
+        raise NotImplementedError
+
+    def valid(self, data, params):
+        return True
+
+    def validAt(self, data, i, params):
+        return True
+
+    def indicators(self, params):
+        return []
+
+    def __and__(self, other):
+        return Combination(np.logical_and, self, other)
+
+    def __or__(self, other):
+        return Combination(np.logical_or, self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Comparison(Condition):
+
+    def __init__(self, function, a, b):
+        self.function = function
+        self.a = _expression(a)
+        self.b = _expression(b)
+
+    def array(self, data, params):
+        return self.function(self.a.array(data, params), self.b.array(data, params))
+
+    def at(self, data, i, params):
+        return bool(self.function(self.a.at(data, i, params), self.b.at(data, i, params)))
+
+    def valid(self, data, params):
+        return _valid(self.a.array(data, params), self.b.array(data, params))
+
+    def validAt(self, data, i, params):
+        return bool(_valid(self.a.at(data, i, params), self.b.at(data, i, params)))
+
+    def indicators(self, params):
+        return self.a.indicators(params) + self.b.indicators(params)
+
+
+class Cross(Condition):
+    #a goes from below (or equal to) b on the previous candle to above it
+
+    def __init__(self, a, b):
+        self.a = _expression(a)
+        self.b = _expression(b)
+
+    def array(self, data, params):
+        a = np.asarray(self.a.array(data, params), dtype=np.float64)
+        b = np.asarray(self.b.array(data, params), dtype=np.float64)
+        a, b = np.broadcast_arrays(a, b)
+        return (shift(a, 1) <= shift(b, 1)) & (a > b)
+
+    def at(self, data, i, params):
+        if i < 1:
+            return False
+        return bool(self.a.at(data, i-1, params) <= self.b.at(data, i-1, params) and
+            self.a.at(data, i, params) > self.b.at(data, i, params))
+
+    def valid(self, data, params):
+        a = np.asarray(self.a.array(data, params), dtype=np.float64)
+        b = np.asarray(self.b.array(data, params), dtype=np.float64)
+        a, b = np.broadcast_arrays(a, b)
+        #shift leaves the first candle NaN
+        return _valid(a, b, shift(a, 1), shift(b, 1))
+
+    def validAt(self, data, i, params):
+        if i < 1:
+            return False
+        return bool(_valid(self.a.at(data, i-1, params), self.b.at(data, i-1, params),
+            self.a.at(data, i, params), self.b.at(data, i, params)))
+
+    def indicators(self, params):
+        return self.a.indicators(params) + self.b.indicators(params)
+
+
+def crossesAbove(a, b):
+    return Cross(a, b)
+
+
+def crossesBelow(a, b):
+    return Cross(b, a)
+
+
+class Combination(Condition):
+
+    def __init__(self, function, a, b):
+        self.function = function
+        self.a = a
+        self.b = b
+
+    def array(self, data, params):
+        return self.function(self.a.array(data, params), self.b.array(data, params))
+
+    def at(self, data, i, params):
+        #short circuits like python's and / or
+        if self.function is np.logical_and:
+            return self.a.at(data, i, params) and self.b.at(data, i, params)
+        return self.a.at(data, i, params) or self.b.at(data, i, params)
+
+    def valid(self, data, params):
+        return self.a.valid(data, params) & self.b.valid(data, params)
+
+    def validAt(self, data, i, params):
+        return self.a.validAt(data, i, params) and self.b.validAt(data, i, params)
+
+    def indicators(self, params):
+        return self.a.indicators(params) + self.b.indicators(params)
+
+
+class Not(Condition):
+    #False where the condition it negates looked at a NaN, instead of True
+
+    def __init__(self, condition):
+        self.condition = condition
+
+    def array(self, data, params):
+        return ~np.asarray(self.condition.array(data, params), dtype=bool) & self.condition.valid(data, params)
+
+    def at(self, data, i, params):
+        return self.condition.validAt(data, i, params) and not self.condition.at(data, i, params)
+
+    def valid(self, data, params):
+        return self.condition.valid(data, params)
+
+    def validAt(self, data, i, params):
+        return self.condition.validAt(data, i, params)
+
+    def indicators(self, params):
+        return self.condition.indicators(params)
+
+
+def _parameters(node):
+    #Params used anywhere in a rule, name -> default
+    if isinstance(node, Param):
+        return {node.name: node.default}
+    if isinstance(node, tuple):
+        found = dict()
+        for item in node:
+            found.update(_parameters(item))
+        return found
+    if isinstance(node, Ind):
+        return _parameters(node.args)
+    found = dict()
+    for value in getattr(node, '__dict__', {}).values():
+        if isinstance(value, (Expression, Condition)):
+            found.update(_parameters(value))
+    return found
+
+
+#Shortcuts for the indicators in Indicators.INDICATORS_DICT
+def EMA(period, col_name=None):
+    return Ind('ema', period, col_name)
+
+def SMMA(period, col_name=None):
+    #what INDICATORS_DICT calls 'sma'
+    return Ind('sma', period, col_name)
+
+def LowerBollinger(period, col_name=None):
+    return Ind('lbb', period, col_name)
+
+def UpperBollinger(period, col_name=None):
+    return Ind('ubb', period, col_name)
+
+def RSI(period=14, col_name=None):
+    return Ind('rsi', period, col_name)
+
+def VWAP(period, col_name=None):
+    return Ind('vwap', period, col_name)
+
+def MACD(fast=12, slow=26, signal=9, col_name=None):
+    #Returns the macd line, signal line and histogram
+    line = Ind('macd', (fast, slow, signal), col_name)
+    name = line.spec({})['col_name'] if col_name is None else col_name
+    return line, Ind('macd', (fast, slow, signal), name, name+'_signal'), Ind('macd', (fast, slow, signal), name, name+'_hist')
+
+def Ichimoku(line):
+    #line is one of tenkansen, kijunsen, senkou_a, senkou_b
+    return Ind('ichimoku', None, None, line)
+
+
+class Rule:
+
+    def __init__(self, condition, price=None, name='rule', params=None):
+        #Buys at price (the close by default) on the candles where condition is True
+        self.condition = condition
+        self.price = Col('close') if price is None else _expression(price)
+        self.__name__ = name
+        self.params = dict(params or {})
+
+    def parameters(self):
+        #Every Param of the rule with its current value
+        found = _parameters(self.condition)
+        found.update(_parameters(self.price))
+        found.update(self.params)
+        return found
+
+    def bind(self, **params):
+        #Same rule with other Param values
+        return Rule(self.condition, self.price, self.__name__, dict(self.params, **params))
+
+    @property
+    def indicators(self):
+        specs = []
+        for spec in self.condition.indicators(self.params) + self.price.indicators(self.params):
+            if spec not in specs:
+                specs.append(spec)
+        return specs
+
+    def signals(self, data):
+        buy = np.asarray(self.condition.array(data, self.params), dtype=bool)
+        price = np.asarray(self.price.array(data, self.params), dtype=np.float64)
+        return np.where(buy, price, np.nan)
+
+    def __call__(self, df, i:int):
+        Indicators.ensureIndicators(df, self.indicators)
+        if self.condition.at(df, i, self.params):
+            price = self.price.at(df, i, self.params)
+            if not np.isnan(price):
+                return price
+        return False
+
+    def __repr__(self):
+        return 'Rule(' + self.__name__ + ', ' + str(self.parameters()) + ')'
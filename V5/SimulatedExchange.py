@@ -0,0 +1,504 @@
+import os
+import io
+import sys
+import time
+import sqlite3
+import contextlib
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from Binance import Binance
+from Database import BotDatabase
+from SymbolRules import SymbolRules
+
+# An exchange that replays historical candles instead of talking to Binance, so the
+# bot's real order code (BotRunner.EntryOrder / ExitOrder) can be run against history.
+# It answers the calls BotRunner makes (GetSymbolKlines, PlaceOrderFromDict, GetOrderInfo,
+# GetAccountData...) with the same kind of dicts Binance does, and fills LIMIT orders
+# when a later candle trades through their price:
+#   BUY  fills if the low goes down to the price, at the price (or the open if it opened lower)
+#   SELL fills if the high goes up to the price, at the price (or the open if it opened higher)
+#   MARKET orders fill at the open of the next candle
+# Time only moves when Advance() is called, one candle at a time.
+
+class SimulatedExchange:
+
+	ORDER_STATUS_NEW = Binance.ORDER_STATUS_NEW
+	ORDER_STATUS_PARTIALLY_FILLED = Binance.ORDER_STATUS_PARTIALLY_FILLED
+	ORDER_STATUS_FILLED = Binance.ORDER_STATUS_FILLED
+	ORDER_STATUS_CANCELED = Binance.ORDER_STATUS_CANCELED
+	ORDER_STATUS_REJECTED = Binance.ORDER_STATUS_REJECTED
+
+	KLINE_INTERVALS = Binance.KLINE_INTERVALS
+	KLINE_INTERVAL_MS = Binance.KLINE_INTERVAL_MS
+	KLINE_COLUMNS = Binance.KLINE_COLUMNS
+
+	# used to guess the base & quote assets of symbols we don't have the exchangeInfo of
+	QUOTE_ASSETS = ['USDT', 'BUSD', 'USDC', 'BTC', 'ETH', 'BNB']
+
+	def __init__(self, frames:dict, interval:str, symbol_datas:dict=None, balances:dict=None, fee:float=0.001):
+		'''
+		Parameters
+		--
+			frames dict:        symbol -> klines DataFrame (as GetSymbolKlines returns them)
+			interval str:       Interval of the klines
+			symbol_datas dict:  symbol -> exchangeInfo data, e.g. from Binance().GetSymbolDataOfSymbols,
+			                    symbols without one trade with a tick & step size of 1e-8
+			balances dict:      asset -> starting free balance. Without it balances aren't
+			                    checked, they can go negative
+			fee float:          Commission on every fill, taken from the asset received
+		'''
+		self.interval = interval
+		self.interval_ms = self.KLINE_INTERVAL_MS[interval]
+		self.fee = Decimal(fee)
+		self.check_balances = balances != None
+		self.balances = {asset: Decimal(value) for asset, value in (balances or {}).items()}
+		self.pool_size = 1
+
+		self.columns = dict()
+		self.frames = dict()
+		self.positions = dict()
+		for symbol, df in frames.items():
+			if df is None or len(df) == 0:
+				continue
+			self.columns[symbol] = {name: np.asarray(df[name], dtype=np.float64) for name in self.KLINE_COLUMNS}
+			# GetSymbolKlines hands out slices of it, so it's only built once
+			frame = pd.DataFrame(self.columns[symbol])
+			frame['time'] = frame['time'].astype(np.int64)
+			frame['date'] = pd.to_datetime(frame['time'] * 1000000)
+			self.frames[symbol] = frame
+			# number of candles of the symbol that have closed
+			self.positions[symbol] = 0
+
+		self.symbol_datas = dict()
+		for symbol in self.columns:
+			if symbol_datas != None and symbol in symbol_datas:
+				self.symbol_datas[symbol] = symbol_datas[symbol]
+			else:
+				self.symbol_datas[symbol] = self.DefaultSymbolData(symbol)
+
+		self.times = np.unique(np.concatenate([columns['time'] for columns in self.columns.values()])) \
+			if len(self.columns) > 0 else np.empty(0)
+		self.step = 0
+		self.now = int(self.times[0]) if len(self.times) > 0 else 0
+
+		self.orders = dict()
+		self.open_orders = {symbol: [] for symbol in self.columns}
+		self.fills = []
+		self.next_order_id = 1
+
+	def DefaultSymbolData(self, symbol:str) -> dict:
+		''' exchangeInfo-like data for a symbol we don't have the real one of '''
+		quote = next((asset for asset in self.QUOTE_ASSETS if symbol.endswith(asset) and symbol != asset), '')
+		return dict(
+			symbol = symbol,
+			status = 'TRADING',
+			baseAsset = symbol[:len(symbol)-len(quote)],
+			quoteAsset = quote,
+			filters = [
+				dict(filterType = 'PRICE_FILTER', tickSize = '0.00000001'),
+				dict(filterType = 'LOT_SIZE', stepSize = '0.00000001', minQty = '0', maxQty = '0'),
+				dict(filterType = 'MIN_NOTIONAL', minNotional = '0')])
+
+	def HasNext(self) -> bool:
+		return self.step < len(self.times)
+
+	def Advance(self):
+		''' Closes the next candle of every symbol that has one at that time, filling the
+		open orders it trades through. Returns the symbols that got a closed candle '''
+		if not self.HasNext():
+			return []
+		candle_time = self.times[self.step]
+		self.step = self.step + 1
+
+		closed = []
+		for symbol, columns in self.columns.items():
+			position = self.positions[symbol]
+			if position < len(columns['time']) and columns['time'][position] == candle_time:
+				self.MatchOrders(symbol, position)
+				self.positions[symbol] = position + 1
+				closed.append(symbol)
+
+		# we're now at the close of the candle
+		self.now = int(candle_time) + self.interval_ms
+		return closed
+
+	def MatchOrders(self, symbol:str, position:int):
+		''' Fills the open orders of symbol that the candle at position trades through '''
+		if len(self.open_orders[symbol]) == 0:
+			return
+		columns = self.columns[symbol]
+		candle_open = Decimal(columns['open'][position])
+		low = Decimal(columns['low'][position])
+		high = Decimal(columns['high'][position])
+		candle_time = int(columns['time'][position])
+
+		still_open = []
+		for order in self.open_orders[symbol]:
+			price = None
+			if order['type'] == 'MARKET':
+				price = candle_open
+			elif order['side'] == 'BUY' and low <= order['limit']:
+				price = min(order['limit'], candle_open)
+			elif order['side'] == 'SELL' and high >= order['limit']:
+				price = max(order['limit'], candle_open)
+
+			if price == None:
+				still_open.append(order)
+			else:
+				self.Fill(order, price, candle_time)
+		self.open_orders[symbol] = still_open
+
+	def Fill(self, order:dict, price:Decimal, fill_time:int):
+		quantity = order['quantity']
+		quote_quantity = price * quantity
+		symbol_data = self.symbol_datas[order['symbol']]
+		base, quote = symbol_data.get('baseAsset', ''), symbol_data.get('quoteAsset', '')
+
+		if order['side'] == 'BUY':
+			# the quote that was locked at the limit price, minus what the fill cost
+			self.AddBalance(quote, order['locked'] - quote_quantity)
+			self.AddBalance(base, quantity * (1 - self.fee))
+			commission, commission_asset = quantity * self.fee, base
+		else:
+			self.AddBalance(quote, quote_quantity * (1 - self.fee))
+			commission, commission_asset = quote_quantity * self.fee, quote
+		order['locked'] = Decimal(0)
+
+		info = order['info']
+		info['status'] = self.ORDER_STATUS_FILLED
+		info['executedQty'] = info['origQty']
+		info['cummulativeQuoteQty'] = format(quote_quantity, 'f')
+		info['updateTime'] = fill_time
+		info['isWorking'] = False
+
+		self.fills.append(dict(
+			time = fill_time,
+			symbol = order['symbol'],
+			side = order['side'],
+			price = price,
+			quantity = quantity,
+			commission = commission,
+			commission_asset = commission_asset,
+			order_id = info['clientOrderId']))
+
+	def AddBalance(self, asset:str, amount:Decimal):
+		self.balances[asset] = self.balances.get(asset, Decimal(0)) + amount
+
+	def Error(self, code:int, msg:str) -> dict:
+		return {'code': code, 'msg': msg}
+
+	def GetTradingSymbols(self, quoteAssets:list=None):
+		if quoteAssets == None:
+			return []
+		return [symbol for symbol, sd in self.symbol_datas.items() if sd.get('quoteAsset', None) in quoteAssets]
+
+	def GetSymbolDataOfSymbols(self, symbols:list=None):
+		if symbols == None:
+			return []
+		return [self.symbol_datas[symbol] for symbol in symbols if symbol in self.symbol_datas]
+
+	def GetSymbolData(self, symbol:str):
+		return self.symbol_datas.get(symbol, None)
+
+	def GetSymbolRules(self, symbol:str):
+		symbol_data = self.GetSymbolData(symbol)
+		if symbol_data == None:
+			return None
+		return SymbolRules.Of(symbol_data)
+
+	def GetSymbolKlines(self, symbol:str, interval:str, limit:int=1000, end_time=False, extra_fields:bool=False):
+		''' The last limit candles of symbol that have closed by now, like KlineStream's window.
+		It's a slice of the symbol's whole frame: columns added to it don't change the frame '''
+		frame = self.frames.get(symbol, None)
+		if frame is None:
+			return pd.DataFrame(columns=self.KLINE_COLUMNS)
+		position = self.positions[symbol]
+		df = frame.iloc[max(0, position - limit):position]
+		# strategies look candles up by position from 0
+		df.index = pd.RangeIndex(len(df))
+		return df
+
+	def AddColumns(self, symbol:str, columns:dict):
+		''' Adds columns (name -> array with a value for every candle) to the candles of symbol,
+		e.g. indicators computed on the whole history. GetSymbolKlines returns them from then on '''
+		frame = self.frames[symbol]
+		for name, values in columns.items():
+			frame[name] = values
+
+	def GetAccountData(self) -> dict:
+		balances = []
+		for asset, free in self.balances.items():
+			locked = sum((order['locked'] for orders in self.open_orders.values() for order in orders
+				if order['locked_asset'] == asset), Decimal(0))
+			balances.append(dict(asset = asset, free = format(free, 'f'), locked = format(locked, 'f')))
+		return dict(makerCommission = 10, takerCommission = 10, canTrade = True, updateTime = self.now,
+			balances = balances)
+
+	def PlaceOrderFromDict(self, params, test:bool=False):
+		''' Places a LIMIT or MARKET order. test is ignored, every order here is simulated '''
+		symbol = params.get('symbol', None)
+		if symbol not in self.columns:
+			return self.Error(-1121, 'Invalid symbol.')
+		if params.get('type', None) not in ['LIMIT', 'MARKET'] or params.get('side', None) not in ['BUY', 'SELL']:
+			return self.Error(-1116, 'Invalid orderType.')
+
+		rules = SymbolRules.Of(self.symbol_datas[symbol])
+		quantity = Decimal(params.get('quantity', 0))
+		if quantity <= 0 or rules.RoundQuantity(quantity) != quantity:
+			return self.Error(-1013, 'Filter failure: LOT_SIZE')
+
+		limit = None
+		if params['type'] == 'LIMIT':
+			limit = Decimal(params.get('price', 0))
+			if limit <= 0 or rules.RoundPrice(limit) != limit:
+				return self.Error(-1013, 'Filter failure: PRICE_FILTER')
+			if not rules.IsValidOrder(limit, quantity):
+				return self.Error(-1013, 'Filter failure: MIN_NOTIONAL')
+
+		# lock what the order can spend
+		symbol_data = self.symbol_datas[symbol]
+		if params['side'] == 'BUY':
+			reference_price = limit if limit != None else Decimal(self.columns[symbol]['close'][max(0, self.positions[symbol]-1)])
+			locked, locked_asset = reference_price * quantity, symbol_data.get('quoteAsset', '')
+		else:
+			locked, locked_asset = quantity, symbol_data.get('baseAsset', '')
+		if self.check_balances and self.balances.get(locked_asset, Decimal(0)) < locked:
+			return self.Error(-2010, 'Account has insufficient balance for requested action.')
+		self.AddBalance(locked_asset, -locked)
+
+		order_id = self.next_order_id
+		self.next_order_id = self.next_order_id + 1
+		client_order_id = params.get('newClientOrderId', None) or 'simulated' + str(order_id)
+		info = dict(
+			symbol = symbol,
+			orderId = order_id,
+			orderListId = -1,
+			clientOrderId = client_order_id,
+			transactTime = self.now,
+			price = format(limit if limit != None else Decimal(0), 'f'),
+			origQty = format(quantity, 'f'),
+			executedQty = '0',
+			cummulativeQuoteQty = '0',
+			status = self.ORDER_STATUS_NEW,
+			timeInForce = params.get('timeInForce', 'GTC'),
+			type = params['type'],
+			side = params['side'],
+			time = self.now,
+			updateTime = self.now,
+			isWorking = True)
+
+		order = dict(symbol = symbol, side = params['side'], type = params['type'], limit = limit,
+			quantity = quantity, locked = locked, locked_asset = locked_asset, info = info)
+		self.orders[client_order_id] = order
+		self.open_orders[symbol].append(order)
+		return dict(info, fills = [])
+
+	def PlaceOrder(self, symbol:str, side:str, type:str, quantity:float=0, price:float=0, test:bool=True):
+		return self.PlaceOrderFromDict(dict(symbol = symbol, side = side, type = type, timeInForce = 'GTC',
+			quantity = quantity, price = price), test)
+
+	def CancelOrder(self, symbol:str, orderId:str):
+		order = self.orders.get(orderId, None)
+		if order == None or order['symbol'] != symbol:
+			return self.Error(-2011, 'Unknown order sent.')
+		if order not in self.open_orders[symbol]:
+			return self.Error(-2011, 'Order is not open.')
+		self.open_orders[symbol].remove(order)
+		self.AddBalance(order['locked_asset'], order['locked'])
+		order['locked'] = Decimal(0)
+		order['info']['status'] = self.ORDER_STATUS_CANCELED
+		order['info']['isWorking'] = False
+		return dict(order['info'])
+
+	def GetOrderInfo(self, symbol:str, orderId:str):
+		''' orderId is the client order id, like Binance.GetOrderInfo sends it '''
+		order = self.orders.get(orderId, None)
+		if order == None or order['symbol'] != symbol:
+			return self.Error(-2013, 'Order does not exist.')
+		return dict(order['info'])
+
+
+class SilentSpinner:
+	''' Stands in for the yaspin spinner BotRunner talks to, shows nothing '''
+
+	def __init__(self):
+		self.text = ''
+
+	def start(self):
+		pass
+
+	def stop(self):
+		pass
+
+
+class SimulationDatabase(BotDatabase):
+	''' A BotDatabase kept in memory for one run: every call shares one connection, and
+	the streaming indicator states aren't saved, there's no restart to carry on from '''
+
+	def __init__(self):
+		self.conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+		super().__init__(':memory:')
+
+	def Connect(self):
+		return self.conn
+
+	def SaveIndicatorState(self, bot, symbol:str, state:dict):
+		pass
+
+	def GetIndicatorState(self, bot, symbol:str):
+		return None
+
+
+class Simulation:
+	''' Runs a bot with BotRunner's real entry & exit code on a SimulatedExchange, the
+	same way BotRunner.StartStreaming does: when a candle closes the open orders are
+	checked for exits, then the bot's strategy looks for an entry on the pairs that
+	aren't in a trade. The bot's streaming indicators are computed on every candle once
+	before the replay, with the same IndicatorState the live bot updates, so every
+	candle of the windows the strategy gets has them (the live bot only fills the last
+	ones). The bot's orders & pairs are kept in an in-memory database. '''
+
+	def __init__(self, frames:dict, interval:str, strategy_name:str='ma_crossover', trade_allocation:float=0.1,
+		profit_target:float=1.012, symbol_datas:dict=None, balances:dict=None, fee:float=0.001,
+		window:int=1000, database_name:str=None, quiet:bool=True):
+		'''
+		Parameters
+		--
+			frames, interval, symbol_datas, balances, fee:  see SimulatedExchange
+			strategy_name, trade_allocation, profit_target: the bot's, see BotRunner.CreateBot
+			window int:          Number of closed candles the strategy gets, like KlineStream's window
+			database_name str:   Where to keep the bot's database, in memory by default
+			quiet bool:          Hide what BotRunner prints about every order
+		'''
+		self.exchange = SimulatedExchange(frames, interval, symbol_datas, balances, fee)
+		self.interval = interval
+		self.strategy_name = strategy_name
+		self.trade_allocation = trade_allocation
+		self.profit_target = profit_target
+		self.window = window
+		self.database_name = database_name
+		self.quiet = quiet
+
+	def Run(self):
+		''' Replays every candle, returns the trades as a DataFrame (see Trades) '''
+		# imported here so the exchange can be used without the bot's dependencies
+		from BotRunner import BotRunner
+		from Indicators import Indicators
+		from Strategies import strategies_dict, strategy_indicators
+		from StreamingIndicators import IndicatorState
+
+		exchange = self.exchange
+		database = SimulationDatabase() if self.database_name == None else BotDatabase(self.database_name)
+
+		start = time.time()
+		candles = 0
+		runner = BotRunner(SilentSpinner(), exchange, database)
+		runner.ask_permission = False
+		strategy_function = strategies_dict[self.strategy_name]
+
+		with self.Output():
+			bot, symbol_datas_dict = runner.CreateBot(
+				name = 'simulation',
+				strategy_name = self.strategy_name,
+				interval = self.interval,
+				trade_allocation = self.trade_allocation,
+				profit_target = self.profit_target,
+				test = False,
+				symbols = list(exchange.columns.keys()))
+		runner.all_symbol_datas = symbol_datas_dict
+
+		specs = strategy_indicators.get(self.strategy_name, None) or []
+		if len(specs) > 0:
+			for symbol, frame in exchange.frames.items():
+				exchange.AddColumns(symbol, IndicatorState(specs).columnsFromDf(frame))
+
+		while exchange.HasNext():
+			closed = exchange.Advance()
+			candles = candles + len(closed)
+			with self.Output():
+				self.CheckExits(runner, database, bot)
+
+				pairs = dict()
+				for pair in database.GetActivePairsOfBot(bot):
+					pairs[pair['symbol']] = pair
+				for symbol in closed:
+					if symbol not in pairs:
+						continue
+					df = exchange.GetSymbolKlines(symbol, self.interval, self.window)
+					# the strategy uses the streaming values instead of computing its indicators
+					for spec in specs:
+						Indicators.markComputed(df, spec['indicator_name'], spec['col_name'], spec['args'])
+					runner.EntryOrder(bot, strategy_function, pairs, symbol_datas_dict[symbol], df)
+
+		elapsed = time.time() - start
+		print('Simulated ' + str(candles) + ' candles in ' + str(round(elapsed, 2)) + 's (' +
+			str(int(candles / max(elapsed, 1e-9))) + ' candles / s)')
+		return self.Trades()
+
+	def CheckExits(self, runner, database, bot):
+		''' BotRunner.CheckExits, without the thread pool: orders are checked one by one
+		so every run gives the same result '''
+		all_pairs = dict()
+		for pair in database.GetAllPairsOfBot(bot):
+			all_pairs[pair['symbol']] = pair
+		for order in database.GetOpenOrdersOfBot(bot):
+			runner.ExitOrder(bot, all_pairs, order)
+
+	def Output(self):
+		if self.quiet:
+			return contextlib.redirect_stdout(io.StringIO())
+		return contextlib.nullcontext()
+
+	def Trades(self):
+		''' Every round trip (entry fill then exit fill on a symbol), with its returns
+		after fees. Entries that were filled but not exited yet have no exit columns '''
+		trades = []
+		entries = dict()
+		for fill in self.exchange.fills:
+			symbol = fill['symbol']
+			if fill['side'] == 'BUY':
+				entries.setdefault(symbol, []).append(fill)
+			elif len(entries.get(symbol, [])) > 0:
+				entry = entries[symbol].pop(0)
+				spent = entry['price'] * entry['quantity']
+				received = fill['price'] * fill['quantity'] - fill['commission']
+				# the buy's commission was taken from the coins bought
+				received = received - fill['price'] * entry['commission']
+				trades.append(dict(symbol = symbol, entry_time = entry['time'], entry_price = float(entry['price']),
+					exit_time = fill['time'], exit_price = float(fill['price']), quantity = float(entry['quantity']),
+					returns = float(100 * (received / spent - 1))))
+		for symbol, open_entries in entries.items():
+			for entry in open_entries:
+				trades.append(dict(symbol = symbol, entry_time = entry['time'], entry_price = float(entry['price']),
+					quantity = float(entry['quantity'])))
+
+		columns = ['symbol', 'entry_time', 'entry_price', 'exit_time', 'exit_price', 'quantity', 'returns']
+		return pd.DataFrame(trades, columns=columns).sort_values(['entry_time', 'symbol']).reset_index(drop=True)
+
+
+def Main(strategy_name='ma_crossover', interval='1h', cache_dir='klines'):
+	''' Simulates a bot on every symbol of interval cached by Binance(cache_dir=cache_dir) '''
+	from KlineCache import KlineCache
+
+	cache = KlineCache(cache_dir)
+	frames = dict()
+	for name in sorted(os.listdir(cache_dir)):
+		if not name.endswith('_' + interval + '.npz'):
+			continue
+		symbol = name[:-len('_' + interval + '.npz')]
+		df = cache.Load(symbol, interval)
+		if df is not None and len(df) > 0:
+			frames[symbol] = df
+
+	trades = Simulation(frames, interval, strategy_name).Run()
+	print(trades.to_string())
+	closed = trades.dropna(subset=['returns'])
+	if len(closed) > 0:
+		print(str(len(closed)) + ' trades, ' + str(round(closed['returns'].mean(), 3)) + '% mean returns after fees')
+
+
+if __name__ == '__main__':
+	Main(*sys.argv[1:])
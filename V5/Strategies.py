@@ -1,49 +1,87 @@
-from Indicators import Indicators
+import numpy as np
+
+from Indicators import Indicators, shift
+from Rules import Rule, Param, MACD, RSI, crossesAbove
+
+#Every strategy lists the indicators it needs in .indicators, as the args it passes to
+#Indicators.addIndicator. That's how the pipeline (IndicatorPipeline.py) and the live
+#streaming indicators (StreamingIndicators.py) know what to compute for it.
+#
+#strategy.signals(data) gives the same buy prices as calling the strategy on every
+#candle, for all candles at once: an array with the buy price or NaN. data is anything
+#that gives arrays by column name, with the indicator columns already added (a df, or a
+#Panel, where the arrays are 2-D and every symbol gets its signals at once).
 
 
 #Ema strategy crossover
 def maCrossoverStrategy(df, i:int):
     #50 ema cross 200 ema
 
-    if not df.__contains__("50_ema") and not df.__contains__('200_ema'):
-        Indicators.addIndicator(df, indicator_name='ema', col_name='50_ema', args=50)
-        Indicators.addIndicator(df, indicator_name='ema', col_name='200_ema', args=200)
+    Indicators.ensureIndicators(df, maCrossoverStrategy.indicators)
 
     if i > 0 and df['50_ema'][i-1] <= df['200_ema'][i-1] and df['50_ema'][i] > df['200_ema'][i]:
         return df['close'][i]
 
     return False
 
+maCrossoverStrategy.indicators = [
+    dict(indicator_name='ema', col_name='50_ema', args=50),
+    dict(indicator_name='ema', col_name='200_ema', args=200)]
+
+def maCrossoverSignals(data):
+    fast = np.asarray(data['50_ema'], dtype=np.float64)
+    slow = np.asarray(data['200_ema'], dtype=np.float64)
+    #shift leaves the first candle NaN, so it never buys (i > 0)
+    buy = (shift(fast, 1) <= shift(slow, 1)) & (fast > slow)
+    return np.where(buy, data['close'], np.nan)
+
+maCrossoverStrategy.signals = maCrossoverSignals
+
 
 #Simple MA strategy
 def maStrategy(df, i:int):
 
-    if not df.__contains__('long_sma'):
-        Indicators.addIndicator(df, indicator_name='sma', col_name='long_sma', args=30)
+    Indicators.ensureIndicators(df, maStrategy.indicators)
 
     #If price is 4% below long sma, put buy signal and return True
     buy_price = 0.96 * df['long_sma'][i]
     if buy_price >= df['close'][i]:
         return min(buy_price, df['high'][i])
-    
+
     return False
 
+maStrategy.indicators = [
+    dict(indicator_name='sma', col_name='long_sma', args=30)]
+
+def maSignals(data):
+    buy_price = 0.96 * np.asarray(data['long_sma'], dtype=np.float64)
+    return np.where(buy_price >= data['close'], np.minimum(buy_price, data['high']), np.nan)
+
+maStrategy.signals = maSignals
+
 def bollStrategy(df, i:int):
-    if not df.__contains__('low_boll'):
-        Indicators.addIndicator(df, indicator_name='lbb', col_name='low_boll', args=14)
+    Indicators.ensureIndicators(df, bollStrategy.indicators)
 
     #if price 2.5% below lower bollinger, return True
     buy_price = 0.975 * df['low_boll'][i]
     if buy_price >= df['close'][i]:
         return min(buy_price, df['high'][i])
-    
+
     return False
 
+bollStrategy.indicators = [
+    dict(indicator_name='lbb', col_name='low_boll', args=14)]
+
+def bollSignals(data):
+    buy_price = 0.975 * np.asarray(data['low_boll'], dtype=np.float64)
+    return np.where(buy_price >= data['close'], np.minimum(buy_price, data['high']), np.nan)
+
+bollStrategy.signals = bollSignals
+
 def ichimokuBull(df, i:int):
     #If price is about cloud formed by span A and span B, and moves above tenkansen, buy signal
 
-    if not df.__contains__('tenkansen') or not df.__contains__('kijunsen') or not df.__contains__('senkou_a') or not df.__contains__('senkou_b'):
-        Indicators.addIndicator(df, indicator_name='ichimoku', col_name=None, args=None)
+    Indicators.ensureIndicators(df, ichimokuBull.indicators)
 
     #Check if valid
     if i - 1 > 0 and i < len(df):
@@ -57,10 +95,37 @@ def ichimokuBull(df, i:int):
 
     return False
 
+ichimokuBull.indicators = [
+    dict(indicator_name='ichimoku', col_name=None, args=None)]
+
+def ichimokuSignals(data):
+    close = np.asarray(data['close'], dtype=np.float64)
+    tenkansen = np.asarray(data['tenkansen'], dtype=np.float64)
+    buy = (shift(close, 1) < shift(tenkansen, 1)) & \
+        (close > tenkansen) & \
+        (close > np.asarray(data['senkou_a'], dtype=np.float64)) & \
+        (close > np.asarray(data['senkou_b'], dtype=np.float64))
+    #the candle based version only looks from the third candle on (i - 1 > 0)
+    buy[:2] = False
+    return np.where(buy, close, np.nan)
+
+ichimokuBull.signals = ichimokuSignals
+
+
+#Strategies written as rules (see Rules.py)
+_macd, _macd_signal, _macd_hist = MACD(12, 26, 9)
+
+#Momentum: macd crosses above its signal line while the RSI isn't overbought yet
+macdMomentum = Rule(crossesAbove(_macd, _macd_signal) & (RSI(14) < Param('max_rsi', 70)), name='macdMomentum')
+
 
 strategies_dict = dict(
     ma_crossover = maCrossoverStrategy,
     ma_simple = maStrategy,
     bollinger_simple = bollStrategy,
-    ichimoku_bullish = ichimokuBull
-)
\ No newline at end of file
+    ichimoku_bullish = ichimokuBull,
+    macd_momentum = macdMomentum
+)
+
+#Indicators of each strategy by name, used to keep them up to date candle by candle when live
+strategy_indicators = {name: strategy.indicators for name, strategy in strategies_dict.items()}
@@ -0,0 +1,422 @@
+#Incremental versions of the indicators in Indicators.py, for live trading
+#Each one takes the newest closed candle and updates in constant time & memory, instead
+#of recomputing the whole window to read its last value. Fed the same candles, they give
+#the same values as Indicators.py. Their state can be saved with toDict() and restored
+#with fromDict(), so a restart picks up where it left off.
+import math
+from collections import deque
+
+import numpy as np
+
+from Indicators import Indicators
+
+NAN = float('nan')
+
+
+class StreamingIndicator:
+
+    #Candle columns passed to update(), in order
+    inputs = ('close',)
+
+    #Attributes saved by toDict(), deques are saved as lists
+    state = ()
+
+    def update(self, *values):
+        raise NotImplementedError
+
+    def toDict(self):
+        data = {'type': type(self).__name__}
+        for name in self.state:
+            value = getattr(self, name)
+            if isinstance(value, StreamingIndicator):
+                value = value.toDict()
+            elif isinstance(value, deque):
+                value = [list(item) if isinstance(item, tuple) else item for item in value]
+            data[name] = value
+        return data
+
+    @staticmethod
+    def fromDict(data):
+        #Rebuilds any streaming indicator from what its toDict() returned
+        indicator_type = STREAMING_TYPES[data['type']]
+        indicator = indicator_type.__new__(indicator_type)
+        for name in indicator_type.state:
+            value = data[name]
+            if isinstance(value, dict) and 'type' in value:
+                value = StreamingIndicator.fromDict(value)
+            elif isinstance(value, list):
+                value = deque([tuple(item) if isinstance(item, list) else item for item in value],
+                    maxlen=indicator._maxlen(name))
+            setattr(indicator, name, value)
+        return indicator
+
+    def _maxlen(self, name):
+        #maxlen of the deque saved as name, None if it isn't bounded
+        return None
+
+
+class StreamingAverage(StreamingIndicator):
+    #Recursive average seeded with the simple average of the first period values, like
+    #Indicators._seededAverage. Leading NaNs are skipped.
+
+    state = ('period', 'alpha', 'count', 'total', 'value')
+
+    def __init__(self, period, alpha):
+        self.period = int(period)
+        self.alpha = alpha
+        self.count = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, value):
+        if math.isnan(value) and self.count == 0:
+            return NAN
+
+        if self.count < self.period:
+            self.count += 1
+            self.total += value
+            if self.count == self.period:
+                self.value = self.total / self.period
+        else:
+            self.value = self.alpha * value + (1 - self.alpha) * self.value
+        return self.value
+
+
+class StreamingEMA(StreamingAverage):
+
+    def __init__(self, period):
+        super().__init__(period, 2.0 / (int(period) + 1))
+
+
+class StreamingSMMA(StreamingAverage):
+
+    def __init__(self, period):
+        super().__init__(period, 1.0 / int(period))
+
+
+class StreamingSMA(StreamingIndicator):
+    #Rolling mean and population std of the last period values. The sums are taken around
+    #an offset, and rebuilt from the window every period candles, so they don't drift.
+
+    state = ('period', 'window', 'offset', 'total', 'total_squares', 'since_rebuild')
+
+    def __init__(self, period):
+        self.period = int(period)
+        self.window = deque(maxlen=self.period)
+        self.offset = 0.0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.since_rebuild = 0
+
+    def _maxlen(self, name):
+        return self.period if name == 'window' else None
+
+    def update(self, value):
+        if len(self.window) == self.period:
+            removed = self.window[0] - self.offset
+            self.total -= removed
+            self.total_squares -= removed * removed
+        self.window.append(value)
+
+        self.since_rebuild += 1
+        if self.since_rebuild >= self.period:
+            self._rebuild()
+        else:
+            added = value - self.offset
+            self.total += added
+            self.total_squares += added * added
+        return self.mean()
+
+    def _rebuild(self):
+        window = np.fromiter(self.window, dtype=np.float64, count=len(self.window))
+        self.offset = float(window[-1])
+        self.total = float(np.sum(window - self.offset))
+        self.total_squares = float(np.sum((window - self.offset) ** 2))
+        self.since_rebuild = 0
+
+    def mean(self):
+        if len(self.window) < self.period:
+            return NAN
+        return self.offset + self.total / self.period
+
+    def std(self):
+        if len(self.window) < self.period:
+            return NAN
+        mean = self.total / self.period
+        return math.sqrt(max(0.0, self.total_squares / self.period - mean * mean))
+
+
+class StreamingLowerBollinger(StreamingIndicator):
+
+    state = ('std_mult', 'sma')
+    sign = -1
+
+    def __init__(self, period, std_mult=2.0):
+        self.std_mult = std_mult
+        self.sma = StreamingSMA(period)
+
+    def update(self, value):
+        mean = self.sma.update(value)
+        return mean + self.sign * self.sma.std() * self.std_mult
+
+
+class StreamingUpperBollinger(StreamingLowerBollinger):
+
+    sign = 1
+
+
+class RollingMax(StreamingIndicator):
+    #Max of the last period values, with a monotonic deque of (index, value): every value
+    #goes in and out of it once, so updates are O(1) amortized
+
+    state = ('period', 'index', 'candidates')
+    sign = 1
+
+    def __init__(self, period):
+        self.period = int(period)
+        self.index = -1
+        self.candidates = deque()
+
+    def update(self, value):
+        self.index += 1
+        candidates = self.candidates
+        #drop the values that can't be the max anymore
+        while len(candidates) > 0 and self.sign * candidates[-1][1] <= self.sign * value:
+            candidates.pop()
+        candidates.append((self.index, value))
+        if candidates[0][0] <= self.index - self.period:
+            candidates.popleft()
+
+        if self.index < self.period - 1:
+            return NAN
+        return candidates[0][1]
+
+
+class RollingMin(RollingMax):
+
+    sign = -1
+
+
+class StreamingShift(StreamingIndicator):
+    #Returns the value from periods candles ago
+
+    state = ('periods', 'window')
+
+    def __init__(self, periods):
+        self.periods = int(periods)
+        self.window = deque(maxlen=self.periods + 1)
+
+    def _maxlen(self, name):
+        return self.periods + 1
+
+    def update(self, value):
+        self.window.append(value)
+        if len(self.window) <= self.periods:
+            return NAN
+        return self.window[0]
+
+
+class StreamingIchimoku(StreamingIndicator):
+    #Same columns as Indicators.getIchimokuCloud. chikou_span is the close 26 candles in
+    #the future, so it's always NaN on the newest candle.
+
+    inputs = ('high', 'low', 'close')
+    state = ('high_9', 'low_9', 'high_26', 'low_26', 'high_52', 'low_52', 'senkou_a', 'senkou_b')
+
+    def __init__(self):
+        self.high_9, self.low_9 = RollingMax(9), RollingMin(9)
+        self.high_26, self.low_26 = RollingMax(26), RollingMin(26)
+        self.high_52, self.low_52 = RollingMax(52), RollingMin(52)
+        self.senkou_a = StreamingShift(26)
+        self.senkou_b = StreamingShift(52)
+
+    def update(self, high, low, close):
+        tenkansen = (self.high_9.update(high) + self.low_9.update(low)) / 2
+        kijunsen = (self.high_26.update(high) + self.low_26.update(low)) / 2
+        period52 = (self.high_52.update(high) + self.low_52.update(low)) / 2
+        return {
+            'tenkansen': tenkansen,
+            'kijunsen': kijunsen,
+            'senkou_a': self.senkou_a.update((tenkansen + kijunsen) / 2),
+            'senkou_b': self.senkou_b.update(period52),
+            'chikou_span': NAN
+        }
+
+
+class StreamingRSI(StreamingIndicator):
+
+    state = ('previous', 'average_gain', 'average_loss')
+
+    def __init__(self, period):
+        self.previous = NAN
+        self.average_gain = StreamingSMMA(period)
+        self.average_loss = StreamingSMMA(period)
+
+    def update(self, value):
+        change = value - self.previous
+        self.previous = value
+        if math.isnan(change):
+            return NAN
+
+        average_gain = self.average_gain.update(max(change, 0.0))
+        average_loss = self.average_loss.update(max(-change, 0.0))
+        if math.isnan(average_gain):
+            return NAN
+        if average_loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + average_gain / average_loss)
+
+
+class StreamingMACD(StreamingIndicator):
+
+    state = ('col_name', 'fast', 'slow', 'signal')
+
+    def __init__(self, col_name, args=(12, 26, 9)):
+        self.col_name = col_name
+        self.fast = StreamingEMA(args[0])
+        self.slow = StreamingEMA(args[1])
+        self.signal = StreamingEMA(args[2])
+
+    def update(self, value):
+        macd = self.fast.update(value) - self.slow.update(value)
+        #the signal ema starts with the first macd value, like the vectorized one
+        macd_signal = self.signal.update(macd)
+        return {
+            self.col_name: macd,
+            self.col_name+'_signal': macd_signal,
+            self.col_name+'_hist': macd - macd_signal
+        }
+
+
+class StreamingVWAP(StreamingIndicator):
+
+    inputs = ('high', 'low', 'close', 'volume')
+    state = ('period', 'price_volume', 'volume')
+
+    def __init__(self, period):
+        self.period = int(period)
+        self.price_volume = StreamingSMA(period)
+        self.volume = StreamingSMA(period)
+
+    def update(self, high, low, close, volume):
+        price_volume = self.price_volume.update((high + low + close) / 3 * volume)
+        volume = self.volume.update(volume)
+        if math.isnan(volume) or volume == 0:
+            return NAN
+        return price_volume / volume
+
+
+#Streaming counterparts of Indicators.INDICATORS_DICT, built from the same col_name & args
+STREAMING_INDICATORS = {
+    'sma': lambda col_name, args: StreamingSMMA(args),
+    'ema': lambda col_name, args: StreamingEMA(args),
+    'lbb': lambda col_name, args: StreamingLowerBollinger(args),
+    'ubb': lambda col_name, args: StreamingUpperBollinger(args),
+    'ichimoku': lambda col_name, args: StreamingIchimoku(),
+    'rsi': lambda col_name, args: StreamingRSI(args),
+    'macd': lambda col_name, args: StreamingMACD(col_name, args),
+    'vwap': lambda col_name, args: StreamingVWAP(args)
+}
+
+#Used by fromDict to find the class of a saved indicator
+STREAMING_TYPES = {indicator_type.__name__: indicator_type for indicator_type in [
+    StreamingEMA, StreamingSMMA, StreamingSMA, StreamingLowerBollinger, StreamingUpperBollinger,
+    RollingMax, RollingMin, StreamingShift, StreamingIchimoku, StreamingRSI, StreamingMACD, StreamingVWAP
+]}
+
+
+class IndicatorState:
+    #The streaming indicators of one symbol, for a list of addIndicator-style specs
+    #(dicts of indicator_name, col_name, args, like Strategies.strategy_indicators).
+    #Keeps the values of the last `keep` candles, strategies look back one candle.
+
+    def __init__(self, specs, keep=2):
+        self.specs = [dict(spec) for spec in specs]
+        self.keep = keep
+        self.indicators = [STREAMING_INDICATORS[spec['indicator_name']](spec['col_name'], spec['args'])
+            for spec in self.specs]
+        self.last_time = None
+        self.history = deque(maxlen=keep)
+
+    def update(self, candle):
+        #candle is anything indexable by column name (a dict, a df row...)
+        values = dict()
+        for spec, indicator in zip(self.specs, self.indicators):
+            result = indicator.update(*[float(candle[column]) for column in indicator.inputs])
+            if isinstance(result, dict):
+                values.update(result)
+            else:
+                values[spec['col_name']] = result
+        self.last_time = float(candle['time'])
+        self.history.append(values)
+        return values
+
+    def updateFromDf(self, df):
+        #Feeds the candles of df we haven't seen yet. If we missed candles that aren't in df
+        #anymore, starts over from the whole df. Returns the number of candles fed.
+        times = np.asarray(df['time'], dtype=np.float64)
+        if self.last_time is not None and (len(times) == 0 or times[0] > self.last_time):
+            self.reset()
+
+        start = 0 if self.last_time is None else int(np.searchsorted(times, self.last_time, side='right'))
+        columns = self.inputColumns(df)
+        for i in range(start, len(times)):
+            self.update({column: values[i] for column, values in columns.items()})
+        return len(times) - start
+
+    def columnsFromDf(self, df):
+        #Feeds every candle of df, returns the values each of them got as whole columns
+        #(col_name -> array), what fillColumns writes on the last candles as they come in
+        columns = self.inputColumns(df)
+        rows = [self.update({column: values[i] for column, values in columns.items()})
+            for i in range(len(df))]
+        if len(rows) == 0:
+            return dict()
+        return {col_name: np.array([values[col_name] for values in rows], dtype=np.float64) for col_name in rows[-1]}
+
+    def inputColumns(self, df):
+        #The columns of df the indicators read, as float arrays
+        columns = {'time': np.asarray(df['time'], dtype=np.float64)}
+        for indicator in self.indicators:
+            for column in indicator.inputs:
+                columns[column] = np.asarray(df[column], dtype=np.float64)
+        return columns
+
+    def reset(self):
+        self.__init__(self.specs, self.keep)
+
+    def fillColumns(self, df):
+        #Writes the values we have into df's indicator columns, aligned on its last candle.
+        #Older rows are NaN, strategies only read the last ones.
+        if len(df) == 0 or self.last_time is None or float(df['time'].iloc[-1]) != self.last_time:
+            return False
+
+        history = list(self.history)[-len(df):]
+        for col_name in history[-1]:
+            column = np.full(len(df), np.nan)
+            column[len(df)-len(history):] = [values[col_name] for values in history]
+            df[col_name] = column
+        for spec in self.specs:
+            Indicators.markComputed(df, spec['indicator_name'], spec['col_name'], spec['args'])
+        return True
+
+    def toDict(self):
+        return {
+            'specs': self.specs,
+            'keep': self.keep,
+            'indicators': [indicator.toDict() for indicator in self.indicators],
+            'last_time': self.last_time,
+            'history': list(self.history)
+        }
+
+    @staticmethod
+    def fromDict(data):
+        state = IndicatorState.__new__(IndicatorState)
+        #json turns tuple args (macd) into lists
+        state.specs = [dict(spec, args=tuple(spec['args']) if isinstance(spec['args'], list) else spec['args'])
+            for spec in data['specs']]
+        state.keep = data['keep']
+        state.indicators = [StreamingIndicator.fromDict(indicator) for indicator in data['indicators']]
+        state.last_time = data['last_time']
+        state.history = deque(data['history'], maxlen=state.keep)
+        return state
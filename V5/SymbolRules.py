@@ -0,0 +1,106 @@
+import threading
+import numpy as np
+from decimal import Decimal, ROUND_HALF_EVEN
+
+# The trading rules of a symbol (exchangeInfo filters), read once instead of scanning
+# symbol_data["filters"] on every rounding. Prices and quantities are rounded to the
+# nearest multiple of tickSize / stepSize, both for single Decimals (placing orders)
+# and for whole numpy arrays (simulated fills in backtests).
+
+class SymbolRules:
+
+	__slots__ = ('symbol', 'tick_size', 'step_size', 'min_qty', 'max_qty', 'min_notional',
+		'tick_float', 'step_float', 'tick_decimals', 'step_decimals')
+
+	# SymbolRules.Of keeps the compiled rules of every symbol_data dict it has seen
+	_compiled = dict()
+	_lock = threading.Lock()
+
+	def __init__(self, symbol:str, tick_size, step_size, min_qty=0, max_qty=0, min_notional=0):
+		self.symbol = symbol
+		self.tick_size = Decimal(tick_size).normalize()
+		self.step_size = Decimal(step_size).normalize()
+		self.min_qty = Decimal(min_qty)
+		self.max_qty = Decimal(max_qty)
+		self.min_notional = Decimal(min_notional)
+
+		self.tick_float = float(self.tick_size)
+		self.step_float = float(self.step_size)
+		# number of decimals of the tick / step, used to clean up float rounding errors
+		self.tick_decimals = max(0, -self.tick_size.as_tuple().exponent)
+		self.step_decimals = max(0, -self.step_size.as_tuple().exponent)
+
+	@classmethod
+	def FromSymbolData(cls, symbol_data:dict):
+		''' Builds the rules from the exchangeInfo entry of a symbol '''
+		filters = dict()
+		for fil in symbol_data["filters"]:
+			filters[fil["filterType"]] = fil
+
+		if not filters.get("PRICE_FILTER", {}).__contains__("tickSize"):
+			raise Exception("Couldn't find tickSize or PRICE_FILTER in symbol_data.")
+		if not filters.get("LOT_SIZE", {}).__contains__("stepSize"):
+			raise Exception("Couldn't find stepSize or LOT_SIZE in symbol_data.")
+
+		lot_filter = filters["LOT_SIZE"]
+		notional_filter = filters.get("MIN_NOTIONAL", filters.get("NOTIONAL", {}))
+
+		return cls(
+			symbol = symbol_data.get("symbol", None),
+			tick_size = filters["PRICE_FILTER"]["tickSize"],
+			step_size = lot_filter["stepSize"],
+			min_qty = lot_filter.get("minQty", 0),
+			max_qty = lot_filter.get("maxQty", 0),
+			min_notional = notional_filter.get("minNotional", 0))
+
+	@classmethod
+	def Of(cls, symbol_data:dict):
+		''' Returns the (compiled once) rules of symbol_data '''
+		key = symbol_data.get("symbol", None)
+		entry = cls._compiled.get(key, None)
+		# exchangeInfo refreshes hand out new dicts, so only reuse rules compiled from this one
+		if entry != None and entry[0] is symbol_data:
+			return entry[1]
+
+		rules = cls.FromSymbolData(symbol_data)
+		with cls._lock:
+			cls._compiled[key] = (symbol_data, rules)
+		return rules
+
+	def _Round(self, value, size:Decimal, round_up:bool) -> Decimal:
+		number = (Decimal(value) / size).to_integral_value(ROUND_HALF_EVEN) * size
+		if round_up:
+			number = number + size
+		return number.quantize(size)
+
+	def RoundPrice(self, price, round_up:bool=False) -> Decimal:
+		''' Rounds price to the closest multiple of tickSize (one tick higher if round_up) '''
+		return self._Round(price, self.tick_size, round_up)
+
+	def RoundQuantity(self, quantity, round_up:bool=False) -> Decimal:
+		''' Rounds quantity to the closest multiple of stepSize (one step higher if round_up) '''
+		return self._Round(quantity, self.step_size, round_up)
+
+	def _RoundArray(self, values, size:float, decimals:int, round_up:bool):
+		number = np.rint(np.asarray(values, dtype=np.float64) / size) * size
+		if round_up:
+			number = number + size
+		return np.round(number, decimals)
+
+	def RoundPrices(self, prices, round_up:bool=False):
+		''' RoundPrice over a whole array, returns float64 '''
+		return self._RoundArray(prices, self.tick_float, self.tick_decimals, round_up)
+
+	def RoundQuantities(self, quantities, round_up:bool=False):
+		''' RoundQuantity over a whole array, returns float64 '''
+		return self._RoundArray(quantities, self.step_float, self.step_decimals, round_up)
+
+	def IsValidOrder(self, price, quantity) -> bool:
+		''' Checks an order against minQty / maxQty and minNotional '''
+		price = Decimal(price)
+		quantity = Decimal(quantity)
+		if quantity < self.min_qty:
+			return False
+		if self.max_qty > 0 and quantity > self.max_qty:
+			return False
+		return price * quantity >= self.min_notional
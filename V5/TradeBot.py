@@ -1,9 +1,15 @@
 #ALL IMPORTS
 from EvaluateStrategy import EvaluateStrategy
+from MultiStrategy import MultiStrategyEvaluator
+from ParameterSweep import ParameterSweep
+from ParallelBacktest import ParallelBacktest, loadFrames
+from ResultStore import ResultStore
 from Strategies import *
 
 from Binance import Binance
 from TradeModel import TradeModel
+from IndicatorPipeline import IndicatorPipeline
+from Panel import Panel
 
 import json
 from decimal import Decimal, getcontext
@@ -12,34 +18,60 @@ from decimal import Decimal, getcontext
 #Updated in v4, make easier to customize
 #Shows summary of profitable and unprofitable strategies / trades
 #DO NOT USE TO EXECUTE STRATEGIES RIGHT NOW.
+#With processes other than 1 the symbols are backtested in parallel (None uses all cpus)
+#With a store (ResultStore) only the strategies it has no results for are backtested
 def BackTestStrategies(
     symbols=[], interval = '4h', plot=False, strategy_evaluators=[],
     options = dict(starting_balance = 100, initial_profits = 1.012, initial_stop_loss = 0.9,
-    incremental_profits = 1.006, incremental_stop_loss = 0.996)):
+    incremental_profits = 1.006, incremental_stop_loss = 0.996), exchange=None, processes=1, store=None):
 
     tested_coins = 0
     trade_value = options['starting_balance']
 
-    for symbol in symbols:
-        print(symbol)
-        model = TradeModel(symbol=symbol, timeframe=interval)
-
-        for evaluator in strategy_evaluators:
-            resulting_balance = evaluator.backtest(
-                model,
-                starting_balance= options['starting_balance'],
-                initial_profits = options['initial_profits'],
-                initial_stop_loss = options['initial_stop_loss'],
-                incremental_profits = options['incremental_profits'],
-                incremental_stop_loss = options['incremental_stop_loss']
-                )
-            
+    if processes == 1:
+        #Indicators & signals of all strategies, computed once per symbol
+        multi_evaluator = MultiStrategyEvaluator(strategy_evaluators)
+        backtest = multi_evaluator.backtest if store is None else \
+            lambda model, **options: store.backtest(strategy_evaluators, model, **options)
+
+        def backtests():
+            for symbol in symbols:
+                print(symbol)
+                model = TradeModel(symbol=symbol, timeframe=interval, exchange=exchange)
+                resulting_balances = backtest(
+                    model,
+                    starting_balance= options['starting_balance'],
+                    initial_profits = options['initial_profits'],
+                    initial_stop_loss = options['initial_stop_loss'],
+                    incremental_profits = options['incremental_profits'],
+                    incremental_stop_loss = options['incremental_stop_loss']
+                    )
+                yield symbol, model, resulting_balances
+    else:
+        #All the candles are downloaded first, then shared with the worker processes
+        if exchange is None:
+            exchange = Binance()
+        frames = loadFrames(exchange, symbols, interval)
+        if store is None:
+            all_balances = ParallelBacktest(strategy_evaluators, processes).run(frames, interval, options)
+        else:
+            all_balances = store.backtestFrames(strategy_evaluators, frames, interval, options, processes)
+
+        def backtests():
+            for symbol, resulting_balances in all_balances.items():
+                print(symbol)
+                yield symbol, None, resulting_balances
+
+    for symbol, model, resulting_balances in backtests():
+        for evaluator, resulting_balance in zip(strategy_evaluators, resulting_balances):
             if resulting_balance != trade_value:
                 print(evaluator.strategy.__name__
                 + ': starting balance: ' + str(trade_value)
                 + ': resulting balance: ' + str(round(resulting_balance, 2)))
 
                 if plot:
+                    if model is None:
+                        model = TradeModel(symbol=symbol, timeframe=interval, exchange=exchange)
                     model.plot_data(
                         buy_signals = evaluator.results[model.symbol]['buy_times'],
                         sell_signals = evaluator.results[model.symbol]['sell_times'],
@@ -54,6 +86,10 @@ def BackTestStrategies(
         print("")
         evaluator.printResult()
 
+    if store is not None:
+        print("")
+        print(str(store.hits) + ' results from the store, ' + str(store.misses) + ' backtested')
+
     
 #Message user will see on matched symbol:
 strat_matched_symbol = "\n Strategy Found a Match! \
@@ -67,12 +103,14 @@ prompt_place_order = "/nPress 'p' then ENTER to place an order \
 #Check current markets, option to place order if strategy conditions are met
 def evalStrategies(symbols = [], strategy_evaluators = [], interval = '1h',
 options = dict(starting_balance = 100, initial_profits = 1.012, initial_stop_loss = 0.9,
-incremental_profits = 1.006, incremental_stop_loss = 0.996)):
+incremental_profits = 1.006, incremental_stop_loss = 0.996), exchange=None):
+    multi_evaluator = MultiStrategyEvaluator(strategy_evaluators)
     for symbol in symbols:
         print(symbol)
-        model = TradeModel(symbol=symbol, timeframe=interval)
-        for evaluator in strategy_evaluators:
-            if evaluator.evaluate(model):
+        model = TradeModel(symbol=symbol, timeframe=interval, exchange=exchange)
+        matches = multi_evaluator.evaluate(model)
+        for evaluator, match in zip(strategy_evaluators, matches):
+            if match:
                 print('\n' + evaluator.strategy.__name__ + " match on " + symbol)
                 print(strat_matched_symbol)
                 answer = input()
@@ -108,33 +146,73 @@ incremental_profits = 1.006, incremental_stop_loss = 0.996)):
                         print('\n Sucessful order.')
                         print(order_result)
 
+#Check the latest candle of all symbols at once, returns the matches of each strategy
+#Uses a Panel, so indicators & signals are computed for every symbol in one go
+def screenStrategies(symbols = [], strategy_evaluators = [], interval = '1h', exchange=None):
+    if exchange is None:
+        exchange = Binance()
+    panel = Panel.fromExchange(exchange, symbols, interval)
+    panel.addIndicators(IndicatorPipeline.forStrategies([evaluator.strategy for evaluator in strategy_evaluators]))
+
+    matches = dict()
+    for evaluator in strategy_evaluators:
+        buys = panel.lastSignals(evaluator.strategy)
+        matches[evaluator.strategy.__name__] = buys
+        print('\n' + evaluator.strategy.__name__ + ': ' + str(len(buys)) + ' matches')
+        for symbol, price in buys.items():
+            print('    ' + symbol + ' at ' + str(price))
+    return matches
+
 starting_message = "Crypto Trading Bot. \n \
     Press 'b' then ENTER to backtest all strategies \n \
     Press 'e' then ENTER to execute all strategies on all trading pairs. \n \
+    Press 's' then ENTER to screen all trading pairs for signals. \n \
+    Press 't' then ENTER to tune the exit parameters of all strategies. \n \
     Press 'q' then ENTER to exit program. "
 
 def Main():
-    exchange = Binance()
+    #Klines are cached in ./klines, reruns only download the newest candles
+    exchange = Binance(cache_dir='klines')
     symbols = exchange.GetTradingSymbols(quoteAssets=['ETH'])
 
     strategy_evaluators = [
         EvaluateStrategy(strategy_function=strategies_dict['bollinger_simple']),
         #EvaluateStrategy(strategy_function=strategies_dict.maStrategy),
         EvaluateStrategy(strategy_function=strategies_dict['ichimoku_bullish']),
-        EvaluateStrategy(strategy_function=strategies_dict['ma_crossover'])
+        EvaluateStrategy(strategy_function=strategies_dict['ma_crossover']),
+        #Buys when at least 2 of the 3 strategies above buy on the same candle
+        #EvaluateStrategy(strategy_function=VotingStrategy([strategies_dict['bollinger_simple'],
+        #    strategies_dict['ichimoku_bullish'], strategies_dict['ma_crossover']], min_votes=2, name='vote')),
     ]
     
     print(starting_message)
     
     answer = input()
-    while answer not in ['b', 'q', 'e']:
+    while answer not in ['b', 'q', 'e', 's', 't']:
         print(starting_message)
         answer = input()
     if answer == 'e':
-        evalStrategies(symbols=symbols, interval='1h', strategy_evaluators=strategy_evaluators)
+        evalStrategies(symbols=symbols, interval='1h', strategy_evaluators=strategy_evaluators, exchange=exchange)
     if answer == 'b':
         #Change plot=True to make graphs of each symbol to trade
-        BackTestStrategies(symbols=symbols, interval='1h', plot=False, strategy_evaluators=strategy_evaluators)
+        print("Backtest the symbols on all cpus (y / n)?")
+        processes = None if input() == 'y' else 1
+        #Unchanged strategies aren't backtested again on the same candles
+        print("Keep the results in results.db and reuse them (y / n)?")
+        store = ResultStore('results.db') if input() == 'y' else None
+        BackTestStrategies(symbols=symbols, interval='1h', plot=False, strategy_evaluators=strategy_evaluators, exchange=exchange,
+            processes=processes, store=store)
+    if answer == 's':
+        screenStrategies(symbols=symbols, interval='1h', strategy_evaluators=strategy_evaluators, exchange=exchange)
+    if answer == 't':
+        #Backtests every combination of these values on all symbols, prints the best ones
+        sweep = ParameterSweep([evaluator.strategy for evaluator in strategy_evaluators], grid=dict(
+            initial_profits = [1.006, 1.012, 1.024, 1.045],
+            initial_stop_loss = [0.85, 0.9, 0.95],
+            incremental_profits = [1.003, 1.006, 1.012],
+            incremental_stop_loss = [0.99, 0.996]))
+        table = sweep.run(symbols, interval='1h', exchange=exchange, time_budget=3600)
+        print(ParameterSweep.summary(table).head(20).to_string())
     if answer == 'q':
         print('\nExiting now...\n')
 
@@ -6,14 +6,18 @@ from plotly.offline import plot
 import plotly.graph_objs as pgo
 
 from Binance import Binance
+from Indicators import Indicators
 
 class TradeModel:
 
-    def __init__(self, symbol, timeframe:str='4h'):
+    def __init__(self, symbol, timeframe:str='4h', exchange=None):
         self.symbol = symbol
         self.timeframe = timeframe
-        self.exchange = Binance()
+        #Pass an exchange to share its kline cache between models
+        self.exchange = exchange if exchange is not None else Binance()
         self.df = self.exchange.GetSymbolKlines(symbol, timeframe)
+        #Backtests of the same symbol reuse each other's indicators
+        Indicators.describe(self.df, symbol, timeframe)
         self.last_price = self.df['close'][len(self.df['close']) -1]
         
     #For indicators, check if they are in the df to see what to plot
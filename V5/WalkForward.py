@@ -0,0 +1,213 @@
+#Walk forward optimization: are the parameters a sweep finds still good on candles they
+#weren't picked on?
+#
+#   sweep = ParameterSweep([bollStrategy, macdMomentum], grid=dict(
+#       initial_profits=[1.006, 1.012, 1.024], initial_stop_loss=[0.85, 0.9, 0.95]))
+#   walk = WalkForward(sweep, in_sample=2000, out_of_sample=500)
+#   table = walk.run(loadFrames(exchange, symbols, '1h', limit=10000), '1h')
+#   print(WalkForward.summary(table))
+#
+#Every symbol's history is cut in windows: the parameters with the best returns on the
+#in sample candles are picked, then backtested on the out of sample candles right after
+#them. The next window starts out_of_sample candles later (or at the first candle with
+#anchored=True, so the in sample part keeps growing).
+#
+#Indicators & signals are computed once per symbol on the whole history, the windows
+#only take slices of them: indicators are warmed up at the start of every window, and
+#nothing is computed again per window. Symbols are spread over a process pool to compute
+#the signals, which are then shared in a memory mapped file (SharedCandles) with the
+#processes backtesting the windows.
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import BacktestEngine
+from CandleFrame import CandleFrame
+from EvaluateStrategy import EvaluateStrategy
+from Indicators import Indicators
+from IndicatorPipeline import IndicatorPipeline
+from ParallelBacktest import SharedCandles
+from ParameterSweep import EXIT_PARAMETERS
+
+
+class WalkForward:
+
+    def __init__(self, sweep, in_sample, out_of_sample, step=None, anchored=False):
+        #sweep: a ParameterSweep with the strategies & parameters to pick from
+        #in_sample, out_of_sample and step are numbers of candles, step defaults to out_of_sample
+        self.sweep = sweep
+        self.in_sample = in_sample
+        self.out_of_sample = out_of_sample
+        self.step = out_of_sample if step is None else step
+        self.anchored = anchored
+
+    def windows(self, length):
+        #(in sample start, out of sample start, out of sample end) of a history of length candles
+        windows = []
+        start = 0
+        while start + self.in_sample + self.out_of_sample <= length:
+            first = 0 if self.anchored else start
+            windows.append((first, start + self.in_sample, start + self.in_sample + self.out_of_sample))
+            start = start + self.step
+        return windows
+
+    def signals(self, symbol, df, interval=None):
+        #Signals of every variant of the sweep on df, as a CandleFrame with a column per variant
+        Indicators.describe(df, symbol, interval)
+        variants = self.sweep.variants()
+        IndicatorPipeline.forStrategies([variant for strategy, params, variant, exit_params in variants]).run(df)
+        return CandleFrame({str(number): EvaluateStrategy(variant).signals(df)
+            for number, (strategy, params, variant, exit_params) in enumerate(variants)})
+
+    def walkWindow(self, symbol, candles, signals, window):
+        #Picks the best parameters of each strategy in sample, returns a row per strategy
+        first, split, end = window
+        lows = np.asarray(candles['low'])
+        highs = np.asarray(candles['high'])
+        times = np.asarray(candles['time'])
+        starting_balance = self.sweep.options['starting_balance']
+
+        def returns(variant_signals, start, stop, options):
+            buys, sells, resulting_balance = BacktestEngine.backtest(
+                variant_signals[start:stop], lows[start:stop], highs[start:stop], **options)
+            return 100 * (resulting_balance / starting_balance - 1), len(sells)
+
+        best = dict()
+        for number, (strategy, params, variant, exit_params) in enumerate(self.sweep.variants()):
+            variant_signals = np.asarray(signals[str(number)])
+            for exits in exit_params:
+                options = dict(self.sweep.options, **exits)
+                in_sample_returns, trades = returns(variant_signals, first, split, options)
+                if strategy.__name__ not in best or in_sample_returns > best[strategy.__name__][0]:
+                    best[strategy.__name__] = (in_sample_returns, params, options, variant_signals)
+
+        rows = []
+        for strategy_name, (in_sample_returns, params, options, variant_signals) in best.items():
+            out_of_sample_returns, trades = returns(variant_signals, split, end, options)
+            row = dict(strategy = strategy_name, symbol = symbol,
+                in_sample_start = times[first], out_of_sample_start = times[split], out_of_sample_end = times[end-1])
+            row.update(params)
+            row.update({name: options[name] for name in EXIT_PARAMETERS})
+            row.update(in_sample_returns = in_sample_returns, out_of_sample_returns = out_of_sample_returns,
+                out_of_sample_trades = trades)
+            rows.append(row)
+        return rows
+
+    def run(self, frames, interval=None, processes=None):
+        #Walks forward on every symbol of frames (dict of symbol -> df, e.g. from
+        #ParallelBacktest.loadFrames), returns a DataFrame with a row per strategy & window
+        frames = {symbol: df for symbol, df in frames.items() if df is not None and len(df) > 0}
+        candles = SharedCandles.fromFrames(frames)
+        columns = [str(number) for number in range(len(self.sweep.variants()))]
+        shared_signals = None
+
+        rows = []
+        try:
+            pool = Pool(processes, initializer=_initWorker, initargs=(self, candles, None, interval))
+            try:
+                #signals of every symbol, computed once on its whole history
+                all_signals = dict(pool.imap_unordered(_symbolSignals, list(frames)))
+                shared_signals = SharedCandles.fromFrames(all_signals, columns)
+                del all_signals
+            finally:
+                pool.close()
+                pool.join()
+
+            tasks = [(symbol, window) for symbol in frames for window in self.windows(len(frames[symbol]))]
+            print('Walking forward on ' + str(len(tasks)) + ' windows of ' + str(len(frames)) + ' symbols')
+            pool = Pool(processes, initializer=_initWorker, initargs=(self, candles, shared_signals, interval))
+            try:
+                chunksize = max(1, len(tasks) // (4 * (processes or os.cpu_count() or 1)))
+                for window_rows in pool.imap_unordered(_walkWindow, tasks, chunksize):
+                    rows.extend(window_rows)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            candles.close()
+            if shared_signals is not None:
+                shared_signals.close()
+
+        #strategy, symbol, window, strategy params, exit params, then the results
+        table = pd.DataFrame(rows)
+        if len(table) == 0:
+            return table
+        first = ['strategy', 'symbol', 'in_sample_start', 'out_of_sample_start', 'out_of_sample_end']
+        last = ['in_sample_returns', 'out_of_sample_returns', 'out_of_sample_trades']
+        params = [name for name in table.columns if name not in first + EXIT_PARAMETERS + last]
+        table = table[first + params + EXIT_PARAMETERS + last]
+        return table.sort_values(['strategy', 'symbol', 'out_of_sample_start']).reset_index(drop=True)
+
+    @staticmethod
+    def summary(table):
+        #One row per strategy: mean returns in & out of sample, how often out of sample was
+        #profitable, and the efficiency (out of sample returns per unit of time / in sample ones).
+        #The efficiency is NaN when the in sample returns aren't positive, as a ratio to a loss
+        #(or to nothing) would be meaningless
+        if len(table) == 0:
+            return table
+        in_sample_time = table['out_of_sample_start'] - table['in_sample_start']
+        out_of_sample_time = table['out_of_sample_end'] - table['out_of_sample_start']
+        table = table.assign(
+            in_sample_rate = table['in_sample_returns'] / in_sample_time,
+            out_of_sample_rate = table['out_of_sample_returns'] / out_of_sample_time)
+
+        grouped = table.groupby('strategy')
+        in_sample_rate = grouped['in_sample_rate'].mean()
+        summary = pd.DataFrame(dict(
+            windows = grouped.size(),
+            in_sample_returns = grouped['in_sample_returns'].mean(),
+            out_of_sample_returns = grouped['out_of_sample_returns'].mean(),
+            profitable_windows = grouped['out_of_sample_returns'].apply(lambda returns: (returns > 0).mean()),
+            efficiency = grouped['out_of_sample_rate'].mean() / in_sample_rate.where(in_sample_rate > 0)))
+        return summary.sort_values('out_of_sample_returns', ascending=False).reset_index()
+
+
+#What each worker process works on, set once when it starts
+_worker_walk = None
+_worker_candles = None
+_worker_signals = None
+_worker_interval = None
+
+def _initWorker(walk, candles, signals, interval):
+    global _worker_walk, _worker_candles, _worker_signals, _worker_interval
+    _worker_walk = walk
+    _worker_candles = candles
+    _worker_signals = signals
+    _worker_interval = interval
+
+def _symbolSignals(symbol):
+    return symbol, _worker_walk.signals(symbol, _worker_candles.frame(symbol), _worker_interval)
+
+def _walkWindow(task):
+    symbol, window = task
+    try:
+        return _worker_walk.walkWindow(symbol, _worker_candles.frame(symbol), _worker_signals.frame(symbol), window)
+    except Exception as e:
+        print('Error raised when walking forward on ' + symbol)
+        print(e)
+        return []
+
+
+def Main():
+    #Walk forward of every strategy on all ETH pairs, on the cached klines (e.g. nightly)
+    from Binance import Binance
+    from ParallelBacktest import loadFrames
+    from ParameterSweep import ParameterSweep
+    from Strategies import strategies_dict
+
+    exchange = Binance(cache_dir='klines')
+    frames = loadFrames(exchange, exchange.GetTradingSymbols(quoteAssets=['ETH']), '1h', limit=5000)
+    sweep = ParameterSweep(list(strategies_dict.values()), grid=dict(
+        initial_profits = [1.006, 1.012, 1.024, 1.045],
+        initial_stop_loss = [0.85, 0.9, 0.95],
+        incremental_profits = [1.003, 1.006, 1.012],
+        incremental_stop_loss = [0.99, 0.996]))
+    table = WalkForward(sweep, in_sample=2000, out_of_sample=500).run(frames, '1h')
+    print(WalkForward.summary(table).to_string())
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,43 @@
+#GetOpenOrdersOfBot is what CheckExits polls: the entry orders waiting to fill, then
+#the exit orders placed for them once they did, until those fill too
+from decimal import Decimal
+
+from Database import BotDatabase
+
+
+BOT = dict(id='bot', name='bot', strategy_name='ma_crossover', interval='1h',
+    trade_allocation='0.1', profit_target='1.012', test_run=False)
+
+
+def order(id, is_entry_order, closing_order_id=False):
+    #Like BotRunner.OrderResultToDatabase saves them
+    return dict(id=id, bot_id=BOT['id'], symbol='ETHUSDT', time=0, price='100',
+        take_profit_price=Decimal('101.2'), original_quantity=Decimal('1'), executed_quantity=Decimal('0'),
+        status='NEW', side='BUY' if is_entry_order else 'SELL', is_entry_order=is_entry_order,
+        is_closed=False, closing_order_id=closing_order_id)
+
+
+def openOrderIds(database):
+    return [row['id'] for row in database.GetOpenOrdersOfBot(BOT)]
+
+
+def test_exit_orders_are_checked(tmp_path):
+    database = BotDatabase(str(tmp_path / 'bot.db'))
+    database.SaveBot(BOT)
+
+    entry = order('entry', True)
+    database.SaveOrder(entry)
+    assert openOrderIds(database) == ['entry']
+
+    #the entry filled, ExitOrder places the exit (saved with the entry's id) and closes the entry
+    database.SaveOrder(order('exit', False, closing_order_id='entry'))
+    entry['is_closed'] = True
+    entry['closing_order_id'] = 'exit'
+    database.UpdateOrder(entry)
+    assert openOrderIds(database) == ['exit']
+
+    #the exit filled
+    exit_order = database.GetOrder('exit')
+    exit_order['is_closed'] = True
+    database.UpdateOrder(exit_order)
+    assert openOrderIds(database) == []
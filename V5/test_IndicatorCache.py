@@ -0,0 +1,84 @@
+#The cache must not change what a df's indicators come out as: the same df gets the
+#same columns whether the cache is cold or already saw overlapping windows of it
+import numpy as np
+import pandas as pd
+
+from Indicators import Indicators
+
+
+#(indicator name, col_name, args)
+SPECS = [
+    ('sma', '30_sma', 30),
+    ('ema', '200_ema', 200),
+    ('lbb', '14_lbb', 14),
+    ('ubb', '14_ubb', 14),
+    ('ichimoku', None, None),
+    ('rsi', '14_rsi', 14),
+    ('macd', 'macd', (12, 26, 9)),
+    ('vwap', '20_vwap', 20),
+]
+
+
+def candles(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    return pd.DataFrame(dict(
+        time = np.arange(n) * 3600000.0,
+        open = close,
+        high = close * 1.01,
+        low = close * 0.99,
+        close = close,
+        volume = rng.uniform(1, 10, n)))
+
+
+def withIndicators(df):
+    df = df.copy()
+    Indicators.describe(df, 'TESTUSDT', '1h')
+    for indicator_name, col_name, args in SPECS:
+        Indicators.addIndicator(df, indicator_name, col_name, args)
+    return df
+
+
+def assertSameColumns(cold, warm):
+    assert list(cold.columns) == list(warm.columns)
+    for col in cold.columns:
+        np.testing.assert_array_equal(np.asarray(cold[col]), np.asarray(warm[col]), err_msg=col)
+
+
+def cold(df):
+    Indicators.cache.clear()
+    return withIndicators(df)
+
+
+def test_sliding_window():
+    full = candles(1500)
+    window = full.iloc[300:1300].reset_index(drop=True)
+    expected = cold(window)
+
+    #windows that slid forward one candle & many candles at a time
+    Indicators.cache.clear()
+    withIndicators(full.iloc[0:1000].reset_index(drop=True))
+    for start in (1, 2, 150, 299, 300):
+        withIndicators(full.iloc[start:start+1000].reset_index(drop=True))
+    assertSameColumns(expected, withIndicators(window))
+
+
+def test_growing_df():
+    full = candles(1200, seed=1)
+    expected = cold(full)
+
+    Indicators.cache.clear()
+    for end in (500, 501, 900, 1199):
+        withIndicators(full.iloc[:end])
+    assertSameColumns(expected, withIndicators(full))
+
+
+def test_changed_candle():
+    full = candles(1000, seed=2)
+    changed = full.copy()
+    changed.loc[700, 'close'] = changed.loc[700, 'close'] * 1.05
+    expected = cold(changed)
+
+    Indicators.cache.clear()
+    withIndicators(full)
+    assertSameColumns(expected, withIndicators(changed))